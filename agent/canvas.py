@@ -15,6 +15,9 @@
 #
 import logging
 import json
+import os
+import threading
+from collections import OrderedDict
 from copy import deepcopy
 from functools import partial
 import pandas as pd
@@ -22,6 +25,42 @@ import pandas as pd
 from agent.component import component_class
 from agent.component.base import ComponentBase
 
+CANVAS_TEMPLATE_CACHE_SIZE = int(os.environ.get("CANVAS_TEMPLATE_CACHE_SIZE", "64"))
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def build_param(conf):
+    param = component_class(conf["component_name"] + "Param")()
+    param.update(conf["params"])
+    param.check()
+    return param
+
+
+def compile_template(canvas_id, version, dsl):
+    """
+    The checked param objects of the components of a canvas, built once per canvas version and kept
+    in an LRU cache. A Canvas given it as `template` copies the params of the components whose
+    config matches instead of building and checking them again.
+    """
+    key = (canvas_id, version)
+    with _templates_lock:
+        if key in _templates:
+            _templates.move_to_end(key)
+            return _templates[key]
+
+    dsl = json.loads(dsl) if isinstance(dsl, str) else deepcopy(dsl)
+    template = {}
+    for k, cpn in dsl["components"].items():
+        template[k] = (cpn["obj"]["component_name"], cpn["obj"]["params"], build_param(cpn["obj"]))
+
+    with _templates_lock:
+        _templates[key] = template
+        while len(_templates) > CANVAS_TEMPLATE_CACHE_SIZE:
+            _templates.popitem(last=False)
+    return template
+
 
 class Canvas:
     """
@@ -68,7 +107,7 @@ class Canvas:
     }
     """
 
-    def __init__(self, dsl: str, tenant_id=None):
+    def __init__(self, dsl: str, tenant_id=None, template=None):
         self.path = []
         self.history = []
         self.messages = []
@@ -96,6 +135,7 @@ class Canvas:
         }
         self._tenant_id = tenant_id
         self._embed_id = ""
+        self._template = template or {}
         self.load()
 
     def load(self):
@@ -109,9 +149,7 @@ class Canvas:
 
         for k, cpn in self.components.items():
             cpn_nms.add(cpn["obj"]["component_name"])
-            param = component_class(cpn["obj"]["component_name"] + "Param")()
-            param.update(cpn["obj"]["params"])
-            param.check()
+            param = self._load_param(k, cpn["obj"])
             cpn["obj"] = component_class(cpn["obj"]["component_name"])(self, k, param)
             if cpn["obj"].component_name == "Categorize":
                 for _, desc in param.category_description.items():
@@ -125,6 +163,19 @@ class Canvas:
         self.reference = self.dsl["reference"]
         self._embed_id = self.dsl.get("embed_id", "")
 
+    def _load_param(self, cpn_id, conf):
+        if cpn_id not in self._template:
+            return build_param(conf)
+        component_name, params, param = self._template[cpn_id]
+        if component_name != conf["component_name"] or not params.keys() <= conf["params"].keys():
+            return build_param(conf)
+        param = deepcopy(param)
+        changed = {k: v for k, v in conf["params"].items() if k not in params or params[k] != v}
+        if changed:
+            param.update(changed)
+            param.check()
+        return param
+
     def __str__(self):
         self.dsl["path"] = self.path
         self.dsl["history"] = self.history
@@ -138,16 +189,10 @@ class Canvas:
         for k in self.dsl.keys():
             if k in ["components"]:
                 continue
-            dsl[k] = deepcopy(self.dsl[k])
+            dsl[k] = self.dsl[k]
 
         for k, cpn in self.components.items():
-            if k not in dsl["components"]:
-                dsl["components"][k] = {}
-            for c in cpn.keys():
-                if c == "obj":
-                    dsl["components"][k][c] = json.loads(str(cpn["obj"]))
-                    continue
-                dsl["components"][k][c] = deepcopy(cpn[c])
+            dsl["components"][k] = {c: cpn["obj"].as_dict() if c == "obj" else cpn[c] for c in cpn.keys()}
         return json.dumps(dsl, ensure_ascii=False)
 
     def reset(self):
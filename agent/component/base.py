@@ -385,21 +385,24 @@ class ComponentBase(ABC):
             "params": {}
         }
         """
+        return json.dumps(self.as_dict(), ensure_ascii=False)
+
+    def as_dict(self):
+        """
+        The JSON-ready form of the component, built in a single pass over the param.
+        """
         out = getattr(self._param, self._param.output_var_name)
         if isinstance(out, pd.DataFrame) and "chunks" in out:
             del out["chunks"]
             setattr(self._param, self._param.output_var_name, out)
 
-        return """{{
-            "component_name": "{}",
-            "params": {},
-            "output": {},
-            "inputs": {}
-        }}""".format(self.component_name,
-                     self._param,
-                     json.dumps(json.loads(str(self._param)).get("output", {}), ensure_ascii=False),
-                     json.dumps(json.loads(str(self._param)).get("inputs", []), ensure_ascii=False)
-        )
+        params = self._param.as_dict()
+        return {
+            "component_name": self.component_name,
+            "params": params,
+            "output": params.get("output", {}),
+            "inputs": params.get("inputs", [])
+        }
 
     def __init__(self, canvas, id, param: ComponentParamBase):
         from agent.canvas import Canvas  # Local import to avoid cyclic dependency
@@ -417,8 +420,9 @@ class ComponentBase(ABC):
         return list(cpnts)
 
     def run(self, history, **kwargs):
-        logging.debug("{}, history: {}, kwargs: {}".format(self, json.dumps(history, ensure_ascii=False),
-                                                              json.dumps(kwargs, ensure_ascii=False)))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("{}, history: {}, kwargs: {}".format(self, json.dumps(history, ensure_ascii=False),
+                                                                  json.dumps(kwargs, ensure_ascii=False)))
         self._param.debug_inputs = []
         try:
             res = self._run(history, **kwargs)
@@ -116,6 +116,28 @@ def get():
         return server_error_response(e)
 
 
+@manager.route("/messages", methods=["GET"])  # noqa: F821
+@login_required
+def list_messages():
+    conv_id = request.args["conversation_id"]
+    page_number = int(request.args.get("page", 1))
+    items_per_page = int(request.args.get("page_size", 30))
+    try:
+        convs = list(ConversationService.get_by_ids([conv_id], cols=[ConversationService.model.dialog_id]))
+        if not convs:
+            return get_data_error_result(message="Conversation not found!")
+        tenants = UserTenantService.query(user_id=current_user.id)
+        for tenant in tenants:
+            if DialogService.query(tenant_id=tenant.tenant_id, id=convs[0].dialog_id):
+                break
+        else:
+            return get_json_result(data=False, message="Only owner of conversation authorized for this operation.", code=settings.RetCode.OPERATING_ERROR)
+        total, messages = ConversationService.get_messages(conv_id, page_number, items_per_page)
+        return get_json_result(data={"total": total, "messages": messages})
+    except Exception as e:
+        return server_error_response(e)
+
+
 @manager.route("/getsse/<dialog_id>", methods=["GET"])  # type: ignore # noqa: F821
 def getsse(dialog_id):
     token = request.headers.get("Authorization").split()
@@ -231,7 +253,7 @@ def completion():
                 for ans in chat(dia, msg, True, **req):
                     ans = structure_answer(conv, ans, message_id, conv.id)
                     yield "data:" + json.dumps({"code": 0, "message": "", "data": ans}, ensure_ascii=False) + "\n\n"
-                ConversationService.update_by_id(conv.id, conv.to_dict())
+                ConversationService.append_message(conv.id, conv.to_dict())
             except Exception as e:
                 traceback.print_exc()
                 yield "data:" + json.dumps({"code": 500, "message": str(e), "data": {"answer": "**ERROR**: " + str(e), "reference": []}}, ensure_ascii=False) + "\n\n"
@@ -249,7 +271,7 @@ def completion():
             answer = None
             for ans in chat(dia, msg, **req):
                 answer = structure_answer(conv, ans, message_id, req["conversation_id"])
-                ConversationService.update_by_id(conv.id, conv.to_dict())
+                ConversationService.append_message(conv.id, conv.to_dict())
                 break
             return get_json_result(data=answer)
     except Exception as e:
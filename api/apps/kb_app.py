@@ -13,7 +13,6 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
-import json
 import os
 
 from flask import request
@@ -34,6 +33,7 @@ from api import settings
 from rag.nlp import search
 from api.constants import DATASET_NAME_LIMIT
 from rag.settings import PAGERANK_FLD
+from graphrag.utils import load_graph_snapshot
 
 
 @manager.route('/create', methods=['post'])  # noqa: F821
@@ -324,7 +324,7 @@ def knowledge_graph(kb_id):
     for id in sres.ids[:1]:
         ty = sres.field[id]["knowledge_graph_kwd"]
         try:
-            content_json = json.loads(sres.field[id]["content_with_weight"])
+            content_json = load_graph_snapshot(kb.tenant_id, kb_id, sres.field[id]["content_with_weight"])
         except Exception:
             continue
 
@@ -348,6 +348,6 @@ def delete_knowledge_graph(kb_id):
             code=settings.RetCode.AUTHENTICATION_ERROR
         )
     _, kb = KnowledgebaseService.get_by_id(kb_id)
-    settings.docStoreConn.delete({"knowledge_graph_kwd": ["graph", "subgraph", "entity", "relation"]}, search.index_name(kb.tenant_id), kb_id)
+    settings.docStoreConn.delete({"knowledge_graph_kwd": ["graph", "graph_segment", "subgraph", "entity", "relation"]}, search.index_name(kb.tenant_id), kb_id)
 
     return get_json_result(data=True)
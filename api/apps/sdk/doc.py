@@ -42,6 +42,7 @@ from rag.prompts import keyword_extraction
 from rag.app.tag import label_question
 from rag.utils import rmSpace
 from rag.utils.storage_factory import STORAGE_IMPL
+from rag.utils.task_cancel import cancel_documents
 
 from pydantic import BaseModel, Field, validator
 
@@ -813,6 +814,7 @@ def stop_parsing(tenant_id, dataset_id):
             )
         info = {"run": "2", "progress": 0, "chunk_num": 0}
         DocumentService.update_by_id(id, info)
+        cancel_documents([id])
         settings.docStoreConn.delete({"doc_id": doc[0].id}, search.index_name(tenant_id), dataset_id)
         success_count += 1
     if duplicate_messages:
@@ -36,6 +36,7 @@ from rag.utils.storage_factory import STORAGE_IMPL, STORAGE_IMPL_TYPE
 from timeit import default_timer as timer
 
 from rag.utils.redis_conn import REDIS_CONN
+from rag.utils.embedding_cache import query_embedding_cache
 
 @manager.route("/version", methods=["GET"])  # noqa: F821
 @login_required
@@ -165,6 +166,7 @@ def status():
     except Exception:
         logging.exception("get task executor heartbeats failed!")
     res["task_executor_heartbeats"] = task_executor_heartbeats
+    res["query_embedding_cache"] = query_embedding_cache.info()
 
     return get_json_result(data=res)
 
@@ -624,6 +624,7 @@ class Document(DataBaseModel):
     name = CharField(max_length=255, null=True, help_text="file name", index=True)
     location = CharField(max_length=255, null=True, help_text="where dose it store", index=True)
     size = IntegerField(default=0, index=True)
+    page_num = IntegerField(default=0, help_text="page number of the PDF, counted at upload; 0 if unknown")
     token_num = IntegerField(default=0, index=True)
     chunk_num = IntegerField(default=0, index=True)
     progress = FloatField(default=0, index=True)
@@ -727,6 +728,18 @@ class Conversation(DataBaseModel):
         db_table = "conversation"
 
 
+class ConversationMessage(DataBaseModel):
+    id = CharField(max_length=32, primary_key=True)
+    conversation_id = CharField(max_length=32, null=False, index=True, help_text="id of a conversation or an api_4_conversation")
+    seq = IntegerField(default=0, index=True, help_text="position of the first message of this segment in the conversation")
+    ref_seq = IntegerField(default=0, help_text="position of the first reference of this segment in the conversation")
+    message = JSONField(null=True, default=[])
+    reference = JSONField(null=True, default=[])
+
+    class Meta:
+        db_table = "conversation_message"
+
+
 class APIToken(DataBaseModel):
     tenant_id = CharField(max_length=32, null=False, index=True)
     token = CharField(max_length=255, null=False, index=True)
@@ -887,3 +900,7 @@ def migrate_db():
         migrate(migrator.add_column("llm", "is_tools", BooleanField(null=False, help_text="support tools", default=False)))
     except Exception:
         pass
+    try:
+        migrate(migrator.add_column("document", "page_num", IntegerField(default=0, help_text="page number of the PDF, counted at upload; 0 if unknown")))
+    except Exception:
+        pass
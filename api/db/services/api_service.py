@@ -19,6 +19,7 @@ import peewee
 
 from api.db.db_models import DB, API4Conversation, APIToken, Dialog
 from api.db.services.common_service import CommonService
+from api.db.services.conversation_message_service import SegmentedConversationService
 from api.utils import current_timestamp, datetime_format
 
 
@@ -36,7 +37,7 @@ class APITokenService(CommonService):
         )
 
 
-class API4ConversationService(CommonService):
+class API4ConversationService(SegmentedConversationService):
     model = API4Conversation
 
     @classmethod
@@ -59,12 +60,12 @@ class API4ConversationService(CommonService):
             sessions = sessions.order_by(cls.model.getter_by(orderby).asc())
         sessions = sessions.paginate(page_number, items_per_page)
 
-        return list(sessions.dicts())
+        return cls.stitch(list(sessions.dicts()))
 
     @classmethod
     @DB.connection_context()
     def append_message(cls, id, conversation):
-        cls.update_by_id(id, conversation)
+        super().append_message(id, conversation)
         return cls.model.update(round=cls.model.round + 1).where(cls.model.id == id).execute()
 
     @classmethod
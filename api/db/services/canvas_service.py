@@ -17,7 +17,7 @@ import json
 import time
 import traceback
 from uuid import uuid4
-from agent.canvas import Canvas
+from agent.canvas import Canvas, compile_template
 from api.db import TenantPermission
 from api.db.db_models import DB, CanvasTemplate, User, UserCanvas, API4Conversation
 from api.db.services.api_service import API4ConversationService
@@ -127,10 +127,11 @@ def completion(tenant_id, agent_id, question, session_id=None, stream=True, **kw
     assert cvs.user_id == tenant_id, "You do not own the agent."
     if not isinstance(cvs.dsl,str):
         cvs.dsl = json.dumps(cvs.dsl, ensure_ascii=False)
-    canvas = Canvas(cvs.dsl, tenant_id)
-    canvas.reset()
+    template = compile_template(cvs.id, cvs.update_time, cvs.dsl)
     message_id = str(uuid4())
     if not session_id:
+        canvas = Canvas(cvs.dsl, tenant_id, template=template)
+        canvas.reset()
         query = canvas.get_preset_param()
         if query:
             for ele in query:
@@ -159,7 +160,7 @@ def completion(tenant_id, agent_id, question, session_id=None, stream=True, **kw
     else:
         e, conv = API4ConversationService.get_by_id(session_id)
         assert e, "Session not found!"
-        canvas = Canvas(json.dumps(conv.dsl), tenant_id)
+        canvas = Canvas(json.dumps(conv.dsl), tenant_id, template=template)
         canvas.messages.append({"role": "user", "content": question, "id": message_id})
         canvas.add_user_input(question)
         if not conv.message:
@@ -244,12 +245,13 @@ def completionOpenAI(tenant_id, agent_id, question, session_id=None, stream=True
     if not isinstance(cvs.dsl, str):
         cvs.dsl = json.dumps(cvs.dsl, ensure_ascii=False)
     
-    canvas = Canvas(cvs.dsl, tenant_id)
-    canvas.reset()
+    template = compile_template(cvs.id, cvs.update_time, cvs.dsl)
     message_id = str(uuid4())
     
     # Handle new session creation
     if not session_id:
+        canvas = Canvas(cvs.dsl, tenant_id, template=template)
+        canvas.reset()
         query = canvas.get_preset_param()
         if query:
             for ele in query:
@@ -295,7 +297,7 @@ def completionOpenAI(tenant_id, agent_id, question, session_id=None, stream=True
             )
             return
         
-        canvas = Canvas(json.dumps(conv.dsl), tenant_id)
+        canvas = Canvas(json.dumps(conv.dsl), tenant_id, template=template)
         canvas.messages.append({"role": "user", "content": question, "id": message_id})
         canvas.add_user_input(question)
         
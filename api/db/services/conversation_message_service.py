@@ -0,0 +1,182 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from api.db.db_models import DB, ConversationMessage
+from api.db.services.common_service import CommonService
+
+
+class ConversationMessageService(CommonService):
+    model = ConversationMessage
+
+    @classmethod
+    @DB.connection_context()
+    def get_segments(cls, conversation_ids):
+        segments = {}
+        for seg in cls.model.select().where(cls.model.conversation_id.in_(conversation_ids)).order_by(cls.model.seq):
+            segments.setdefault(seg.conversation_id, []).append(seg)
+        return segments
+
+    @classmethod
+    @DB.connection_context()
+    def append(cls, owner, conversation_id, messages, references):
+        """
+        Stores what `messages` and `references` hold beyond the stored part of the conversation as a new segment.
+        If the last stored segment has changed since, e.g. an answer saved before it finished streaming,
+        that segment is rewritten instead.
+        """
+        last = cls.model.select().where(cls.model.conversation_id == conversation_id).order_by(cls.model.seq.desc()).first()
+        if last:
+            stored_msgs, stored_refs = last.message or [], last.reference or []
+            if messages[last.seq:last.seq + len(stored_msgs)] != stored_msgs or \
+                    references[last.ref_seq:last.ref_seq + len(stored_refs)] != stored_refs:
+                return cls.model.update(message=messages[last.seq:], reference=references[last.ref_seq:]) \
+                    .where(cls.model.id == last.id).execute()
+            seq, ref_seq = last.seq + len(stored_msgs), last.ref_seq + len(stored_refs)
+        else:
+            base = owner.select(owner.message, owner.reference).where(owner.id == conversation_id).first()
+            if not base:
+                return 0
+            seq, ref_seq = len(base.message or []), len(base.reference or [])
+
+        if len(messages) <= seq and len(references) <= ref_seq:
+            return 0
+        cls.insert(conversation_id=conversation_id, seq=seq, ref_seq=ref_seq,
+                   message=messages[seq:], reference=references[ref_seq:])
+        return 1
+
+    @classmethod
+    @DB.connection_context()
+    def get_page(cls, owner, conversation_id, page_number, items_per_page):
+        """
+        One page of the messages of a conversation, oldest first, reading just the segments the page
+        overlaps (and the last one, which tells the total).
+        Returns (total, messages).
+        """
+        start = (page_number - 1) * items_per_page
+        end = start + items_per_page
+        segs = list(cls.model.select(cls.model.id, cls.model.seq)
+                    .where(cls.model.conversation_id == conversation_id).order_by(cls.model.seq))
+
+        pieces = []
+        if not segs or start < segs[0].seq:
+            base = owner.select(owner.message).where(owner.id == conversation_id).first()
+            if not base:
+                return 0, []
+            pieces.append((0, (base.message or [])[:segs[0].seq] if segs else (base.message or [])))
+
+        wanted = [s.id for i, s in enumerate(segs) if s.seq < end and (i + 1 == len(segs) or segs[i + 1].seq > start)]
+        if segs:
+            wanted.append(segs[-1].id)
+        loaded = {s.id: s.message or [] for s in cls.model.select(cls.model.id, cls.model.message).where(cls.model.id.in_(wanted))}
+        for s in segs:
+            if s.id in loaded:
+                pieces.append((s.seq, loaded[s.id]))
+
+        total = segs[-1].seq + len(loaded[segs[-1].id]) if segs else len(pieces[0][1])
+        page = []
+        for offset, msgs in pieces:
+            page.extend(msgs[max(0, start - offset):max(0, end - offset)])
+        return total, page
+
+
+class SegmentedConversationService(CommonService):
+    """
+    Base of the services of conversation tables whose message/reference lists grow turn by turn.
+
+    The JSON columns of the conversation row hold the base segment; every later turn saved through
+    append_message lands in its own conversation_message row, so a turn writes its own messages rather
+    than the whole history again. The reads below stitch the segments back, so callers keep seeing
+    complete `message` and `reference` lists; update_by_id with either of them rewrites the base
+    segment and drops the others.
+    """
+
+    @classmethod
+    def stitch(cls, convs):
+        if not convs:
+            return convs
+        ids = [c["id"] if isinstance(c, dict) else c.id for c in convs]
+        segments = ConversationMessageService.get_segments(ids)
+        for c in convs:
+            data = c if isinstance(c, dict) else c.__data__
+            if "message" not in data or data["id"] not in segments:
+                continue
+            msgs, refs = list(data["message"] or []), list(data.get("reference") or [])
+            for seg in segments[data["id"]]:
+                del msgs[seg.seq:]
+                del refs[seg.ref_seq:]
+                msgs.extend(seg.message or [])
+                refs.extend(seg.reference or [])
+            if isinstance(c, dict):
+                c["message"], c["reference"] = msgs, refs
+            else:
+                c.message, c.reference = msgs, refs
+        return convs
+
+    @classmethod
+    @DB.connection_context()
+    def query(cls, cols=None, reverse=None, order_by=None, **kwargs):
+        return cls.stitch(super().query(cols=cols, reverse=reverse, order_by=order_by, **kwargs))
+
+    @classmethod
+    @DB.connection_context()
+    def get_by_id(cls, pid):
+        e, obj = super().get_by_id(pid)
+        if e:
+            cls.stitch([obj])
+        return e, obj
+
+    @classmethod
+    @DB.connection_context()
+    def update_by_id(cls, pid, data):
+        if "message" not in data and "reference" not in data:
+            return super().update_by_id(pid, data)
+        if "message" not in data or "reference" not in data:
+            e, conv = cls.get_by_id(pid)
+            if e:
+                data.setdefault("message", conv.message)
+                data.setdefault("reference", conv.reference)
+        with DB.atomic():
+            ConversationMessageService.filter_delete([ConversationMessage.conversation_id == pid])
+            return super().update_by_id(pid, data)
+
+    @classmethod
+    @DB.connection_context()
+    def append_message(cls, id, conversation):
+        conversation = dict(conversation)
+        messages = conversation.pop("message", None) or []
+        references = conversation.pop("reference", None) or []
+        conversation.pop("id", None)
+        with DB.atomic():
+            ConversationMessageService.append(cls.model, id, messages, references)
+            return super().update_by_id(id, conversation)
+
+    @classmethod
+    @DB.connection_context()
+    def get_messages(cls, id, page_number, items_per_page):
+        return ConversationMessageService.get_page(cls.model, id, page_number, items_per_page)
+
+    @classmethod
+    @DB.connection_context()
+    def delete_by_id(cls, pid):
+        with DB.atomic():
+            ConversationMessageService.filter_delete([ConversationMessage.conversation_id == pid])
+            return super().delete_by_id(pid)
+
+    @classmethod
+    @DB.connection_context()
+    def delete_by_ids(cls, pids):
+        with DB.atomic():
+            ConversationMessageService.filter_delete([ConversationMessage.conversation_id.in_(pids)])
+            return super().delete_by_ids(pids)
@@ -18,7 +18,7 @@ from uuid import uuid4
 from api.db import StatusEnum
 from api.db.db_models import Conversation, DB
 from api.db.services.api_service import API4ConversationService
-from api.db.services.common_service import CommonService
+from api.db.services.conversation_message_service import SegmentedConversationService
 from api.db.services.dialog_service import DialogService, chat
 from api.utils import get_uuid
 import json
@@ -26,7 +26,7 @@ import json
 from rag.prompts import chunks_format
 
 
-class ConversationService(CommonService):
+class ConversationService(SegmentedConversationService):
     model = Conversation
 
     @classmethod
@@ -46,7 +46,7 @@ class ConversationService(CommonService):
 
         sessions = sessions.paginate(page_number, items_per_page)
 
-        return list(sessions.dicts())
+        return cls.stitch(list(sessions.dicts()))
 
 
 def structure_answer(conv, ans, message_id, session_id):
@@ -133,7 +133,7 @@ def completion(tenant_id, chat_id, question, name="New session", session_id=None
             for ans in chat(dia, msg, True, **kwargs):
                 ans = structure_answer(conv, ans, message_id, session_id)
                 yield "data:" + json.dumps({"code": 0, "data": ans}, ensure_ascii=False) + "\n\n"
-            ConversationService.update_by_id(conv.id, conv.to_dict())
+            ConversationService.append_message(conv.id, conv.to_dict())
         except Exception as e:
             yield "data:" + json.dumps({"code": 500, "message": str(e),
                                         "data": {"answer": "**ERROR**: " + str(e), "reference": []}},
@@ -144,7 +144,7 @@ def completion(tenant_id, chat_id, question, name="New session", session_id=None
         answer = None
         for ans in chat(dia, msg, False, **kwargs):
             answer = structure_answer(conv, ans, message_id, session_id)
-            ConversationService.update_by_id(conv.id, conv.to_dict())
+            ConversationService.append_message(conv.id, conv.to_dict())
             break
         yield answer
 
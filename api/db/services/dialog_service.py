@@ -243,7 +243,8 @@ def chat(dialog, messages, stream=True, **kwargs):
             reasoner = DeepResearcher(
                 chat_mdl,
                 prompt_config,
-                partial(retriever.retrieval, embd_mdl=embd_mdl, tenant_ids=tenant_ids, kb_ids=dialog.kb_ids, page=1, page_size=dialog.top_n, similarity_threshold=0.2, vector_similarity_weight=0.3),
+                partial(retriever.retrieval, embd_mdl=embd_mdl, tenant_ids=tenant_ids, kb_ids=dialog.kb_ids, page=1, page_size=dialog.top_n, similarity_threshold=0.2, vector_similarity_weight=0.3,
+                        use_cache=kwargs.get("retrieval_cache", True)),
             )
 
             for think in reasoner.thinking(kbinfos, " ".join(questions)):
@@ -267,6 +268,7 @@ def chat(dialog, messages, stream=True, **kwargs):
                 aggs=False,
                 rerank_mdl=rerank_mdl,
                 rank_feature=label_question(" ".join(questions), kbs),
+                use_cache=kwargs.get("retrieval_cache", True),
             )
             if prompt_config.get("tavily_api_key"):
                 tav = Tavily(prompt_config["tavily_api_key"])
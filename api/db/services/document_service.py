@@ -24,7 +24,7 @@ from io import BytesIO
 
 import trio
 import xxhash
-from peewee import fn
+from peewee import Case, fn
 
 from api import settings
 from api.db import FileType, LLMType, ParserType, StatusEnum, TaskStatus, UserTenantRole
@@ -36,12 +36,20 @@ from api.utils import current_timestamp, get_format_time, get_uuid
 from rag.nlp import rag_tokenizer, search
 from rag.settings import get_svr_queue_name
 from rag.utils.redis_conn import REDIS_CONN
+from rag.utils.retrieval_cache import bump_kb_version
 from rag.utils.storage_factory import STORAGE_IMPL
+from rag.utils.task_cancel import cancel_documents
 from rag.utils.doc_store_conn import OrderByExpr
 
+PROGRESS_FULL_SCAN_TICKS = 10
+
 
 class DocumentService(CommonService):
     model = Document
+    # State of the last update_progress run: task high-water mark and per document task aggregates.
+    _progress_hwm = None
+    _progress_marks = {}
+    _progress_ticks = 0
 
     @classmethod
     @DB.connection_context()
@@ -145,6 +153,7 @@ class DocumentService(CommonService):
     @classmethod
     @DB.connection_context()
     def remove_document(cls, doc, tenant_id):
+        cancel_documents([doc.id])
         cls.clear_chunk_num(doc.id)
         try:
             settings.docStoreConn.delete({"doc_id": doc.id}, search.index_name(tenant_id), doc.kb_id)
@@ -152,6 +161,7 @@ class DocumentService(CommonService):
                 settings.docStoreConn.search(["source_id"], [], {"kb_id": doc.kb_id, "knowledge_graph_kwd": ["graph"]}, [], OrderByExpr(), 0, 1, search.index_name(tenant_id), [doc.kb_id]), ["source_id"]
             )
             if len(graph_source) > 0 and doc.id in list(graph_source.values())[0]["source_id"]:
+                graph_sources = list(graph_source.values())[0]["source_id"]
                 settings.docStoreConn.update({"kb_id": doc.kb_id, "knowledge_graph_kwd": ["entity", "relation", "graph", "subgraph", "community_report"], "source_id": doc.id},
                                             {"remove": {"source_id": doc.id}},
                                             search.index_name(tenant_id), doc.kb_id)
@@ -160,6 +170,10 @@ class DocumentService(CommonService):
                                             search.index_name(tenant_id), doc.kb_id)
                 settings.docStoreConn.delete({"kb_id": doc.kb_id, "knowledge_graph_kwd": ["entity", "relation", "graph", "subgraph", "community_report"], "must_not": {"exists": "source_id"}},
                                             search.index_name(tenant_id), doc.kb_id)
+                # The segments of the graph snapshot have no source_id: they go with the head, once its last source is removed.
+                if all(s == doc.id for s in graph_sources):
+                    settings.docStoreConn.delete({"kb_id": doc.kb_id, "knowledge_graph_kwd": ["graph_segment"]},
+                                                search.index_name(tenant_id), doc.kb_id)
         except Exception:
             pass
         return cls.delete_by_id(doc.id)
@@ -222,6 +236,7 @@ class DocumentService(CommonService):
             chunk_num=Knowledgebase.chunk_num +
             chunk_num).where(
             Knowledgebase.id == kb_id).execute()
+        bump_kb_version(kb_id)
         return num
 
     @classmethod
@@ -435,57 +450,118 @@ class DocumentService(CommonService):
                     "process_begin_at": get_format_time()
                     })
 
+    @classmethod
+    @DB.connection_context()
+    def run_documents(cls, doc_ids, action="run"):
+        """Queue the parsing of the documents ("run") or cancel it ("cancel")."""
+        from api.db.services.file2document_service import File2DocumentService
+        from api.db.services.task_service import queue_tasks
+
+        for doc_id in doc_ids:
+            if action == "cancel":
+                cls.update_by_id(doc_id, {"run": TaskStatus.CANCEL.value, "progress": 0})
+                cancel_documents([doc_id])
+                continue
+            cls.update_by_id(doc_id, {"run": TaskStatus.RUNNING.value, "progress": 0})
+            tenant_id = cls.get_tenant_id(doc_id)
+            e, doc = cls.get_by_id(doc_id)
+            if not tenant_id or not e:
+                raise LookupError(f"Document {doc_id} not found!")
+            doc = doc.to_dict()
+            doc["tenant_id"] = tenant_id
+            bucket, name = File2DocumentService.get_storage_address(doc_id=doc_id)
+            queue_tasks(doc, bucket, name, 0)
+
     @classmethod
     @DB.connection_context()
     def update_meta_fields(cls, doc_id, meta_fields):
         return cls.update_by_id(doc_id, {"meta_fields": meta_fields})
 
+    @classmethod
+    @DB.connection_context()
+    def get_unfinished_task_stats(cls):
+        """Aggregate the tasks of every unfinished document in one query, keyed by document id."""
+        prog = Task.progress
+        tasks = Task.select(
+            Task.doc_id,
+            fn.COUNT(Task.id).alias("total"),
+            fn.SUM(Case(None, [(prog >= 0, prog)], 0)).alias("progress"),
+            fn.SUM(Case(None, [((prog >= 0) & (prog < 1), 1)], 0)).alias("unfinished"),
+            fn.SUM(Case(None, [(prog == -1, 1)], 0)).alias("bad"),
+            fn.MAX(Case(None, [(Task.task_type == "raptor", 1)], 0)).alias("has_raptor"),
+            fn.MAX(Case(None, [(Task.task_type == "graphrag", 1)], 0)).alias("has_graphrag"),
+            fn.MAX(Task.priority).alias("priority"),
+            fn.MAX(Task.update_time).alias("update_time")) \
+            .join(cls.model, on=(Task.doc_id == cls.model.id)) \
+            .where(
+            cls.model.status == StatusEnum.VALID.value,
+            ~(cls.model.type == FileType.VIRTUAL.value),
+            cls.model.progress < 1,
+            cls.model.progress > 0) \
+            .group_by(Task.doc_id)
+        return {t["doc_id"]: t for t in tasks.dicts()}
+
     @classmethod
     @DB.connection_context()
     def update_progress(cls):
-        docs = cls.get_unfinished_docs()
-        for d in docs:
+        """
+        Roll the progress of the tasks up into their documents.
+        The tasks are aggregated per document with one query and only the documents whose tasks changed since the
+        previous run are written, in one transaction. The whole run is skipped while no task has been updated,
+        except every PROGRESS_FULL_SCAN_TICKS runs since task timestamps come from the clocks of several hosts.
+        """
+        cls._progress_ticks += 1
+        hwm = Task.select(fn.MAX(Task.update_time)).scalar()
+        if hwm == cls._progress_hwm and cls._progress_ticks % PROGRESS_FULL_SCAN_TICKS:
+            return
+
+        stats = cls.get_unfinished_task_stats()
+        marks = {}
+        changed = []
+        for doc_id, st in stats.items():
+            mark = (st["total"], float(st["progress"] or 0), int(st["unfinished"] or 0), int(st["bad"] or 0),
+                    int(st["has_raptor"] or 0), int(st["has_graphrag"] or 0), st["update_time"])
+            marks[doc_id] = mark
+            if cls._progress_marks.get(doc_id) != mark:
+                changed.append(doc_id)
+        if not changed:
+            cls._progress_marks = marks
+            cls._progress_hwm = hwm
+            return
+
+        docs = {d["id"]: d for d in cls.get_unfinished_docs() if d["id"] in stats}
+        msgs = {}
+        for t in Task.select(Task.doc_id, Task.progress_msg).where(Task.doc_id.in_(changed)):
+            msgs.setdefault(t.doc_id, []).append(t.progress_msg)
+
+        infos = []
+        for doc_id in changed:
+            d = docs.get(doc_id)
+            if not d:
+                marks.pop(doc_id, None)
+                continue
             try:
-                tsks = Task.query(doc_id=d["id"], order_by=Task.create_time)
-                if not tsks:
-                    continue
-                msg = []
-                prg = 0
-                finished = True
-                bad = 0
-                has_raptor = False
-                has_graphrag = False
-                e, doc = DocumentService.get_by_id(d["id"])
-                status = doc.run  # TaskStatus.RUNNING.value
-                priority = 0
-                for t in tsks:
-                    if 0 <= t.progress < 1:
-                        finished = False
-                    if t.progress == -1:
-                        bad += 1
-                    prg += t.progress if t.progress >= 0 else 0
-                    msg.append(t.progress_msg)
-                    if t.task_type == "raptor":
-                        has_raptor = True
-                    elif t.task_type == "graphrag":
-                        has_graphrag = True
-                    priority = max(priority, t.priority)
-                prg /= len(tsks)
+                st = stats[doc_id]
+                total, bad = st["total"], int(st["bad"] or 0)
+                finished = not int(st["unfinished"] or 0)
+                status = d["run"]  # TaskStatus.RUNNING.value
+                prg = float(st["progress"] or 0) / total
                 if finished and bad:
                     prg = -1
                     status = TaskStatus.FAIL.value
                 elif finished:
-                    if d["parser_config"].get("raptor", {}).get("use_raptor") and not has_raptor:
-                        queue_raptor_o_graphrag_tasks(d, "raptor", priority)
-                        prg = 0.98 * len(tsks) / (len(tsks) + 1)
-                    elif d["parser_config"].get("graphrag", {}).get("use_graphrag") and not has_graphrag:
-                        queue_raptor_o_graphrag_tasks(d, "graphrag", priority)
-                        prg = 0.98 * len(tsks) / (len(tsks) + 1)
+                    if d["parser_config"].get("raptor", {}).get("use_raptor") and not st["has_raptor"]:
+                        queue_raptor_o_graphrag_tasks(d, "raptor", st["priority"] or 0)
+                        prg = 0.98 * total / (total + 1)
+                    elif d["parser_config"].get("graphrag", {}).get("use_graphrag") and not st["has_graphrag"]:
+                        queue_raptor_o_graphrag_tasks(d, "graphrag", st["priority"] or 0)
+                        prg = 0.98 * total / (total + 1)
                     else:
                         status = TaskStatus.DONE.value
 
-                msg = "\n".join(sorted(msg))
+                msg = "\n".join(sorted(m or "" for m in msgs.get(doc_id, [])))
                 info = {
+                    "id": doc_id,
                     "process_duation": datetime.timestamp(
                         datetime.now()) -
                     d["process_begin_at"].timestamp(),
@@ -494,11 +570,16 @@ class DocumentService(CommonService):
                     info["progress"] = prg
                 if msg:
                     info["progress_msg"] = msg
-                cls.update_by_id(d["id"], info)
+                infos.append(info)
             except Exception as e:
+                marks.pop(doc_id, None)
                 if str(e).find("'0'") < 0:
                     logging.exception("fetch task exception")
 
+        cls.update_many_by_id(infos)
+        cls._progress_marks = marks
+        cls._progress_hwm = hwm
+
     @classmethod
     @DB.connection_context()
     def get_kb_doc_count(cls, kb_id):
@@ -30,6 +30,7 @@ from api.db.services.document_service import DocumentService
 from api.db.services.file2document_service import File2DocumentService
 from api.utils import get_uuid
 from api.utils.file_utils import filename_type, thumbnail_img
+from deepdoc.parser import PdfParser
 from rag.utils.storage_factory import STORAGE_IMPL
 
 
@@ -478,6 +479,91 @@ class FileService(CommonService):
 
         return err, files
 
+    @classmethod
+    @DB.connection_context()
+    def reserve_uploads(cls, kb, filenames, user_id):
+        """Pick a unique document name and storage location for each file to be uploaded into the knowledgebase,
+        unique among the given files as well, so that they can then be uploaded concurrently.
+
+        Returns the id of the knowledgebase folder and a (name, location, error) tuple per file.
+        """
+        root_folder = cls.get_root_folder(user_id)
+        cls.init_knowledgebase_docs(root_folder["id"], user_id)
+        kb_root_folder = cls.get_kb_folder(user_id)
+        kb_folder = cls.new_a_file_from_kb(kb.tenant_id, kb.name, kb_root_folder["id"])
+
+        MAX_FILE_NUM_PER_USER = int(os.environ.get('MAX_FILE_NUM_PER_USER', 0))
+        doc_count = DocumentService.get_doc_count(kb.tenant_id) if MAX_FILE_NUM_PER_USER > 0 else 0
+        names, locations, res = set(), set(), []
+        for filename in filenames:
+            try:
+                if MAX_FILE_NUM_PER_USER > 0 and doc_count >= MAX_FILE_NUM_PER_USER:
+                    raise RuntimeError("Exceed the maximum file number of a free user!")
+                if len(filename.encode("utf-8")) >= 128:
+                    raise RuntimeError("Exceed the maximum length of file name!")
+                name = duplicate_name(
+                    lambda **kwargs: kwargs["name"] in names or DocumentService.query(**kwargs),
+                    name=filename,
+                    kb_id=kb.id)
+                if filename_type(name) == FileType.OTHER.value:
+                    raise RuntimeError("This type of file has not been supported yet!")
+                location = name
+                while location in locations or STORAGE_IMPL.obj_exist(kb.id, location):
+                    location += "_"
+                names.add(name)
+                locations.add(location)
+                doc_count += 1
+                res.append((name, location, None))
+            except Exception as e:
+                res.append((None, None, filename + ": " + str(e)))
+        return kb_folder["id"], res
+
+    @classmethod
+    def store_document_stream(cls, kb, stream, filename, location, user_id):
+        """Stream a seekable file object into the storage as a document of the knowledgebase.
+
+        The content is never loaded in memory as a whole: it goes to the storage as a multipart upload,
+        and the page number and thumbnail are read from the file object. No database access is made here,
+        so the transfer doesn't hold a connection; the returned document goes to add_stored_document.
+        """
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        STORAGE_IMPL.put_stream(kb.id, location, stream, size)
+
+        doc_id = get_uuid()
+        filetype = filename_type(filename)
+        page_num = 0
+        if filetype == FileType.PDF.value:
+            stream.seek(0)
+            page_num = PdfParser.total_page_number(stream) or 0
+
+        img = thumbnail_img(filename, stream)
+        thumbnail_location = ''
+        if img is not None:
+            thumbnail_location = f'thumbnail_{doc_id}.png'
+            STORAGE_IMPL.put(kb.id, thumbnail_location, img)
+
+        return {
+            "id": doc_id,
+            "kb_id": kb.id,
+            "parser_id": cls.get_parser(filetype, filename, kb.parser_id),
+            "parser_config": kb.parser_config,
+            "created_by": user_id,
+            "type": filetype,
+            "name": filename,
+            "location": location,
+            "size": size,
+            "page_num": page_num,
+            "thumbnail": thumbnail_location
+        }
+
+    @classmethod
+    @DB.connection_context()
+    def add_stored_document(cls, kb, kb_folder_id, doc):
+        DocumentService.insert(doc)
+        cls.add_file_from_kb(doc, kb_folder_id, kb.tenant_id)
+        return doc
+
     @staticmethod
     def parse_docs(file_objs, user_id):
         from rag.app import presentation, picture, naive, audio, email
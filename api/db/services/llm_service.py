@@ -24,6 +24,7 @@ from api.db.services.common_service import CommonService
 from api.db.services.langfuse_service import TenantLangfuseService
 from api.db.services.user_service import TenantService
 from rag.llm import ChatModel, CvModel, EmbeddingModel, RerankModel, Seq2txtModel, TTSModel
+from rag.utils.embedding_cache import query_embedding_cache
 
 
 class LLMFactoriesService(CommonService):
@@ -212,6 +213,7 @@ class LLMBundle:
         assert self.mdl, "Can't find model for {}/{}/{}".format(tenant_id, llm_type, llm_name)
         model_config = TenantLLMService.get_model_config(tenant_id, llm_type, llm_name)
         self.max_length = model_config.get("max_tokens", 8192)
+        self.model_key = "{}/{}/{}".format(model_config["llm_factory"], model_config["llm_name"], model_config.get("api_base") or "")
 
         self.is_tools = model_config.get("is_tools", False)
 
@@ -244,6 +246,10 @@ class LLMBundle:
         return embeddings, used_tokens
 
     def encode_queries(self, query: str):
+        emd = query_embedding_cache.get(self.model_key, query)
+        if emd is not None:
+            return emd, 0
+
         if self.langfuse:
             generation = self.trace.generation(name="encode_queries", model=self.llm_name, input={"query": query})
 
@@ -254,6 +260,7 @@ class LLMBundle:
         if self.langfuse:
             generation.end(usage_details={"total_tokens": used_tokens})
 
+        query_embedding_cache.put(self.model_key, query, emd)
         return emd, used_tokens
 
     def similarity(self, query: str, texts: list):
@@ -31,6 +31,7 @@ from deepdoc.parser.excel_parser import RAGFlowExcelParser
 from rag.settings import get_svr_queue_name
 from rag.utils.storage_factory import STORAGE_IMPL
 from rag.utils.redis_conn import REDIS_CONN
+from rag.utils.task_cancel import uncancel_documents
 from api import settings
 from rag.nlp import search
 
@@ -289,6 +290,40 @@ class TaskService(CommonService):
                 ).execute()
 
 
+    @classmethod
+    @DB.connection_context()
+    def update_progress_batch(cls, infos):
+        """Update the progress information of many tasks at once.
+
+        Same semantics as `update_progress` for every task, but the current messages are read with
+        one query and all the updates run in one transaction under a single acquisition of the lock.
+
+        Args:
+            infos (dict): Task id to progress information, as accepted by `update_progress`.
+        """
+        if not infos:
+            return
+
+        def apply():
+            ids = [id for id, info in infos.items() if info.get("progress_msg")]
+            msgs = {t.id: t.progress_msg for t in cls.model.select(cls.model.id, cls.model.progress_msg).where(cls.model.id.in_(ids))} if ids else {}
+            with DB.atomic():
+                for id, info in infos.items():
+                    fields = {}
+                    if info.get("progress_msg") and id in msgs:
+                        fields["progress_msg"] = trim_header_by_lines((msgs[id] or "") + "\n" + info["progress_msg"], 3000)
+                    if "progress" in info:
+                        fields["progress"] = info["progress"]
+                    if fields:
+                        cls.model.update(**fields).where(cls.model.id == id).execute()
+
+        if os.environ.get("MACOS"):
+            apply()
+            return
+        with DB.lock("update_progress", -1):
+            apply()
+
+
 def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
     """Create and queue document processing tasks.
     
@@ -313,11 +348,12 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
         return {"id": get_uuid(), "doc_id": doc["id"], "progress": 0.0, "from_page": 0, "to_page": 100000000}
 
     parse_task_array = []
+    uncancel_documents([doc["id"]])
 
     if doc["type"] == FileType.PDF.value:
-        file_bin = STORAGE_IMPL.get(bucket, name)
         do_layout = doc["parser_config"].get("layout_recognize", "DeepDOC")
-        pages = PdfParser.total_page_number(doc["name"], file_bin)
+        # Counted at upload time by the streaming path, otherwise the file is fetched again.
+        pages = doc.get("page_num") or PdfParser.total_page_number(doc["name"], STORAGE_IMPL.get(bucket, name))
         page_size = doc["parser_config"].get("task_page_size", 12)
         if doc["parser_id"] == "paper":
             page_size = doc["parser_config"].get("task_page_size", 22)
@@ -15,6 +15,7 @@ from api.db import StatusEnum
 from api.db.db_models import close_connection
 from api.db.services.user_service import UserService
 from api.utils import CustomJSONEncoder
+from api.utils.fastapi_utils import run_db, db_pool_stats
 from api.routers.user import router as user_router
 from api.routers.sdk.chat import router as sdk_chat_router
 from api.routers.chat import router as public_chat_router
@@ -89,8 +90,8 @@ async def get_current_user(request: Request):
     if authorization:
         try:
             access_token = str(jwt.loads(authorization))
-            user = UserService.query(
-                access_token=access_token, status=StatusEnum.VALID.value
+            user = await run_db(
+                UserService.query, access_token=access_token, status=StatusEnum.VALID.value
             )
             if user:
                 return user[0]
@@ -134,4 +135,4 @@ app.include_router(admin_token_router)
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy", "db_pool": db_pool_stats()} 
\ No newline at end of file
@@ -9,7 +9,7 @@ from api.constants import API_VERSION
 from api.db import StatusEnum
 from api.db.services.user_service import UserService
 from api.utils import get_uuid, current_timestamp, get_format_time, datetime_format
-from api.utils.fastapi_utils import token_required, get_json_result, get_error_data_result
+from api.utils.fastapi_utils import token_required, get_json_result, get_error_data_result, run_db
 
 # Pydantic models for request/response validation
 class TokenCreateRequest(BaseModel):
@@ -53,7 +53,7 @@ async def create_token(
         token_value = get_uuid()
         
         # Check if user has admin privileges
-        user = UserService.query(id=tenant_id, status=StatusEnum.VALID.value)
+        user = await run_db(UserService.query, id=tenant_id, status=StatusEnum.VALID.value)
         if not user or user[0].role != "admin":
             return get_error_data_result(
                 message="Only admin users can create tokens",
@@ -79,7 +79,7 @@ async def create_token(
         }
         
         # Save token to database
-        if not UserService.save_token(**token):
+        if not await run_db(UserService.save_token, **token):
             return get_error_data_result(
                 message="Failed to create token",
                 code=settings.RetCode.SERVER_ERROR
@@ -102,7 +102,7 @@ async def list_tokens(tenant_id: str = Depends(token_required)):
     """
     try:
         # Check if user has admin privileges
-        user = UserService.query(id=tenant_id, status=StatusEnum.VALID.value)
+        user = await run_db(UserService.query, id=tenant_id, status=StatusEnum.VALID.value)
         if not user or user[0].role != "admin":
             return get_error_data_result(
                 message="Only admin users can list tokens",
@@ -110,7 +110,7 @@ async def list_tokens(tenant_id: str = Depends(token_required)):
             )
             
         # Get tokens for this tenant
-        tokens = UserService.query_tokens(tenant_id=tenant_id, status=StatusEnum.VALID.value)
+        tokens = await run_db(UserService.query_tokens, tenant_id=tenant_id, status=StatusEnum.VALID.value)
         
         # Format tokens for response
         token_list = []
@@ -148,7 +148,7 @@ async def revoke_token(token_id: str, tenant_id: str = Depends(token_required)):
     """
     try:
         # Check if user has admin privileges
-        user = UserService.query(id=tenant_id, status=StatusEnum.VALID.value)
+        user = await run_db(UserService.query, id=tenant_id, status=StatusEnum.VALID.value)
         if not user or user[0].role != "admin":
             return get_error_data_result(
                 message="Only admin users can revoke tokens",
@@ -156,7 +156,7 @@ async def revoke_token(token_id: str, tenant_id: str = Depends(token_required)):
             )
             
         # Check if token exists and belongs to this tenant
-        token = UserService.query_tokens(id=token_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
+        token = await run_db(UserService.query_tokens, id=token_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
         if not token:
             return get_error_data_result(
                 message=f"Token {token_id} not found or not accessible",
@@ -164,7 +164,7 @@ async def revoke_token(token_id: str, tenant_id: str = Depends(token_required)):
             )
             
         # Delete the token
-        if not UserService.delete_token(id=token_id):
+        if not await run_db(UserService.delete_token, id=token_id):
             return get_error_data_result(
                 message=f"Failed to delete token {token_id}",
                 code=settings.RetCode.SERVER_ERROR
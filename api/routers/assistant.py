@@ -12,7 +12,7 @@ from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.llm_service import TenantLLMService, LLMService
 from api.db.services.user_service import TenantService
 from api.utils import get_uuid, current_timestamp, get_format_time
-from api.utils.fastapi_utils import token_required, get_json_result, get_error_data_result, check_duplicate_ids
+from api.utils.fastapi_utils import token_required, get_json_result, get_error_data_result, check_duplicate_ids, run_db
 
 # Pydantic models for request/response validation
 class PromptParameter(BaseModel):
@@ -116,7 +116,7 @@ async def create_assistant(
         
         # Check if knowledge bases exist and belong to tenant
         for kb_id in kb_ids:
-            kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+            kb = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
             if not kb:
                 return get_error_data_result(
                     message=f"Knowledge base {kb_id} not found or not accessible",
@@ -131,7 +131,7 @@ async def create_assistant(
                 code=settings.RetCode.PARAM_ERROR
             )
             
-        if not TenantLLMService.query(tenant_id=tenant_id, llm_name=llm_id, model_type="chat"):
+        if not await run_db(TenantLLMService.query, tenant_id=tenant_id, llm_name=llm_id, model_type="chat"):
             return get_error_data_result(
                 message=f"LLM {llm_id} not found or not accessible",
                 code=settings.RetCode.PARAM_ERROR
@@ -141,7 +141,7 @@ async def create_assistant(
         rerank_id = req.get("rerank_id")
         if rerank_id:
             value_rerank_model = ["BAAI/bge-reranker-v2-m3", "maidalun1020/bce-reranker-base_v1"]
-            if rerank_id not in value_rerank_model and not TenantLLMService.query(
+            if rerank_id not in value_rerank_model and not await run_db(TenantLLMService.query,
                 tenant_id=tenant_id,
                 llm_name=rerank_id,
                 model_type="rerank"
@@ -155,7 +155,7 @@ async def create_assistant(
         assistant_id = req.get("id")
         if assistant_id:
             # Update existing assistant
-            assistant = DialogService.query(id=assistant_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
+            assistant = await run_db(DialogService.query, id=assistant_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
             if not assistant:
                 return get_error_data_result(
                     message=f"Assistant {assistant_id} not found or not accessible",
@@ -169,7 +169,7 @@ async def create_assistant(
             new_name = req.get("name")
             if new_name and new_name != assistant_obj.name:
                 # Check for duplicate name
-                existing = DialogService.query(name=new_name, tenant_id=tenant_id, status=StatusEnum.VALID.value)
+                existing = await run_db(DialogService.query, name=new_name, tenant_id=tenant_id, status=StatusEnum.VALID.value)
                 if existing and existing[0].id != assistant_id:
                     return get_error_data_result(
                         message=f"Assistant with name '{new_name}' already exists",
@@ -188,14 +188,14 @@ async def create_assistant(
                 if key != "id":
                     setattr(assistant_obj, key, value)
                     
-            if not assistant_obj.save():
+            if not await run_db(assistant_obj.save):
                 return get_error_data_result(
                     message="Failed to update assistant",
                     code=settings.RetCode.SERVER_ERROR
                 )
                 
             # Get updated assistant
-            e, assistant = DialogService.get_by_id(assistant_id)
+            e, assistant = await run_db(DialogService.get_by_id, assistant_id)
             if not e:
                 return get_error_data_result(
                     message="Failed to retrieve updated assistant",
@@ -218,7 +218,7 @@ async def create_assistant(
                     code=settings.RetCode.PARAM_ERROR
                 )
                 
-            existing = DialogService.query(name=name, tenant_id=tenant_id, status=StatusEnum.VALID.value)
+            existing = await run_db(DialogService.query, name=name, tenant_id=tenant_id, status=StatusEnum.VALID.value)
             if existing:
                 return get_error_data_result(
                     message=f"Assistant with name '{name}' already exists",
@@ -239,14 +239,14 @@ async def create_assistant(
                 req["kb_ids"] = ",".join(req["kb_ids"])
                 
             # Create assistant
-            if not DialogService.save(**req):
+            if not await run_db(DialogService.save, **req):
                 return get_error_data_result(
                     message="Failed to create assistant",
                     code=settings.RetCode.SERVER_ERROR
                 )
                 
             # Get created assistant
-            e, assistant = DialogService.get_by_id(req["id"])
+            e, assistant = await run_db(DialogService.get_by_id, req["id"])
             if not e:
                 return get_error_data_result(
                     message="Failed to retrieve created assistant",
@@ -286,8 +286,8 @@ async def list_assistants(
             filters["id"] = id
         
         # Get total count and paginated assistants
-        total = DialogService.count(filters, name)
-        assistants = DialogService.query_page(
+        total = await run_db(DialogService.count, filters, name)
+        assistants = await run_db(DialogService.query_page,
             page=page,
             page_size=page_size,
             filters=filters,
@@ -337,18 +337,18 @@ async def delete_assistants(
             # Delete specific assistants
             for assistant_id in ids:
                 # Check if assistant exists and belongs to tenant
-                assistant = DialogService.query(id=assistant_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
+                assistant = await run_db(DialogService.query, id=assistant_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
                 if not assistant:
                     continue
                     
                 # Delete assistant
-                if DialogService.delete(id=assistant_id):
+                if await run_db(DialogService.delete, id=assistant_id):
                     deleted_ids.append(assistant_id)
         else:
             # Delete all assistants for this tenant
-            assistants = DialogService.query(tenant_id=tenant_id, status=StatusEnum.VALID.value)
+            assistants = await run_db(DialogService.query, tenant_id=tenant_id, status=StatusEnum.VALID.value)
             for assistant in assistants:
-                if DialogService.delete(id=assistant.id):
+                if await run_db(DialogService.delete, id=assistant.id):
                     deleted_ids.append(assistant.id)
                     
         return get_json_result({"deleted_ids": deleted_ids})
@@ -369,7 +369,7 @@ async def set_default_assistant(
     """
     try:
         # Check if assistant exists and belongs to tenant
-        assistant = DialogService.query(id=assistant_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
+        assistant = await run_db(DialogService.query, id=assistant_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
         if not assistant:
             return get_error_data_result(
                 message=f"Assistant {assistant_id} not found or not accessible",
@@ -377,7 +377,7 @@ async def set_default_assistant(
             )
             
         # Get tenant
-        e, tenant = TenantService.get_by_id(tenant_id)
+        e, tenant = await run_db(TenantService.get_by_id, tenant_id)
         if not e:
             return get_error_data_result(
                 message="Tenant not found",
@@ -389,7 +389,7 @@ async def set_default_assistant(
         tenant.update_time = current_timestamp()
         tenant.update_date = get_format_time()
         
-        if not tenant.save():
+        if not await run_db(tenant.save):
             return get_error_data_result(
                 message="Failed to set default assistant",
                 code=settings.RetCode.SERVER_ERROR
@@ -413,7 +413,7 @@ async def set_default_models(
     """
     try:
         # Get tenant
-        e, tenant = TenantService.get_by_id(tenant_id)
+        e, tenant = await run_db(TenantService.get_by_id, tenant_id)
         if not e:
             return get_error_data_result(
                 message="Tenant not found",
@@ -422,7 +422,7 @@ async def set_default_models(
             
         # Validate embedding model
         embd_id = defaults.embedding_model
-        if not TenantLLMService.query(tenant_id=tenant_id, llm_name=embd_id, model_type="embd"):
+        if not await run_db(TenantLLMService.query, tenant_id=tenant_id, llm_name=embd_id, model_type="embd"):
             return get_error_data_result(
                 message=f"Embedding model {embd_id} not found or not accessible",
                 code=settings.RetCode.PARAM_ERROR
@@ -430,7 +430,7 @@ async def set_default_models(
             
         # Validate chat model
         llm_id = defaults.chat_model
-        if not TenantLLMService.query(tenant_id=tenant_id, llm_name=llm_id, model_type="chat"):
+        if not await run_db(TenantLLMService.query, tenant_id=tenant_id, llm_name=llm_id, model_type="chat"):
             return get_error_data_result(
                 message=f"Chat model {llm_id} not found or not accessible",
                 code=settings.RetCode.PARAM_ERROR
@@ -442,7 +442,7 @@ async def set_default_models(
         tenant.update_time = current_timestamp()
         tenant.update_date = get_format_time()
         
-        if not tenant.save():
+        if not await run_db(tenant.save):
             return get_error_data_result(
                 message="Failed to set default models",
                 code=settings.RetCode.SERVER_ERROR
@@ -466,7 +466,7 @@ async def get_default_models(tenant_id: str = Depends(token_required)):
     """
     try:
         # Get tenant
-        e, tenant = TenantService.get_by_id(tenant_id)
+        e, tenant = await run_db(TenantService.get_by_id, tenant_id)
         if not e:
             return get_error_data_result(
                 message="Tenant not found",
@@ -13,7 +13,7 @@ from api.db import StatusEnum
 from api.db.services.dialog_service import DialogService
 from api.db.services.canvas_service import completionOpenAI
 from api.db.services.user_service import UserService
-from api.utils.fastapi_utils import token_required, get_error_response, get_success_response
+from api.utils.fastapi_utils import token_required, get_error_response, get_success_response, run_db
 
 router = APIRouter(
     prefix=f"/api/{API_VERSION}/agents_openai",
@@ -64,7 +64,7 @@ async def agents_completion_openai_compatibility(
     
     # Check if user owns the agent
     from api.db.services.canvas_service import UserCanvasService
-    if not UserCanvasService.query(user_id=tenant_id, id=agent_id):
+    if not await run_db(UserCanvasService.query, user_id=tenant_id, id=agent_id):
         return get_error_response(f"You don't own the agent {agent_id}")
     
     # Filter messages to only include user and assistant roles
@@ -1,3 +1,6 @@
+import asyncio
+import logging
+import os
 from typing import Optional, List, Dict, Any, Union
 from enum import Enum
 
@@ -10,8 +13,9 @@ from api.constants import API_VERSION
 from api.db import StatusEnum
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.document_service import DocumentService
+from api.db.services.file_service import FileService
 from api.utils import get_uuid, current_timestamp, get_format_time
-from api.utils.fastapi_utils import token_required, get_json_result, get_error_data_result
+from api.utils.fastapi_utils import token_required, get_json_result, get_error_data_result, run_db
 
 # Pydantic models for request/response validation
 class RaptorConfig(BaseModel):
@@ -87,6 +91,8 @@ class DocumentListParams(BaseModel):
     run_status: Optional[List[str]] = None
     types: Optional[List[str]] = None
 
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))
+
 router = APIRouter(
     prefix=f"/api/{API_VERSION}/kb",
     tags=["Knowledge Base Management"]
@@ -118,19 +124,19 @@ async def create_knowledge_base(
         # Use tenant's default embedding model if not specified
         if not kb_dict.get("embd_id"):
             from api.db.services.user_service import TenantService
-            tenant = TenantService.query(id=tenant_id, status=StatusEnum.VALID.value)
+            tenant = await run_db(TenantService.query, id=tenant_id, status=StatusEnum.VALID.value)
             if tenant:
                 kb_dict["embd_id"] = tenant[0].embd_id
         
         # Save knowledge base
-        if not KnowledgebaseService.save(**kb_dict):
+        if not await run_db(KnowledgebaseService.save, **kb_dict):
             return get_error_data_result(
                 message="Failed to create knowledge base",
                 code=settings.RetCode.SERVER_ERROR
             )
             
         # Get the created knowledge base
-        kb = KnowledgebaseService.query(id=kb_dict["id"])
+        kb = await run_db(KnowledgebaseService.query, id=kb_dict["id"])
         if not kb:
             return get_error_data_result(
                 message="Knowledge base created but could not be retrieved",
@@ -156,7 +162,7 @@ async def update_knowledge_base(
     try:
         # Check if knowledge base exists and belongs to tenant
         kb_id = kb_data.kb_id
-        kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+        kb = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
         if not kb:
             return get_error_data_result(
                 message=f"Knowledge base {kb_id} not found or not accessible",
@@ -173,7 +179,7 @@ async def update_knowledge_base(
         for key, value in update_dict.items():
             setattr(kb_obj, key, value)
             
-        if not kb_obj.save():
+        if not await run_db(kb_obj.save):
             return get_error_data_result(
                 message="Failed to update knowledge base",
                 code=settings.RetCode.SERVER_ERROR
@@ -205,8 +211,8 @@ async def list_knowledge_bases(
             filters["parser_id"] = parser_id
             
         # Get total count and paginated knowledge bases
-        total = KnowledgebaseService.count(filters, keywords)
-        kbs = KnowledgebaseService.query_page(
+        total = await run_db(KnowledgebaseService.count, filters, keywords)
+        kbs = await run_db(KnowledgebaseService.query_page,
             page=page,
             page_size=page_size,
             filters=filters,
@@ -237,7 +243,7 @@ async def get_knowledge_base_detail(
     """
     try:
         # Check if knowledge base exists and belongs to tenant
-        kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+        kb = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
         if not kb:
             return get_error_data_result(
                 message=f"Knowledge base {kb_id} not found or not accessible",
@@ -262,7 +268,7 @@ async def delete_knowledge_base(
     """
     try:
         # Check if knowledge base exists and belongs to tenant
-        kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+        kb = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
         if not kb:
             return get_error_data_result(
                 message=f"Knowledge base {kb_id} not found or not accessible",
@@ -270,14 +276,14 @@ async def delete_knowledge_base(
             )
             
         # Delete knowledge base
-        if not KnowledgebaseService.delete(id=kb_id):
+        if not await run_db(KnowledgebaseService.delete, id=kb_id):
             return get_error_data_result(
                 message=f"Failed to delete knowledge base {kb_id}",
                 code=settings.RetCode.SERVER_ERROR
             )
             
         # Delete all documents in this knowledge base
-        DocumentService.delete_by_kb(kb_id)
+        await run_db(DocumentService.delete_by_kb, kb_id)
             
         return get_json_result({"id": kb_id, "deleted": True})
         
@@ -299,66 +305,52 @@ async def upload_documents(
     """
     try:
         # Check if knowledge base exists and belongs to tenant
-        kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
-        if not kb:
+        if not await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id):
             return get_error_data_result(
                 message=f"Knowledge base {kb_id} not found or not accessible",
                 code=settings.RetCode.PARAM_ERROR
             )
-            
-        # Process each file
-        doc_ids = []
-        doc_results = []
-        
-        for file in files:
-            # Read file content
-            file_content = await file.read()
-            
-            # Create document record
-            doc_id = get_uuid()
-            doc_data = {
-                "id": doc_id,
-                "kb_id": kb_id,
-                "name": file.filename,
-                "parser_id": kb[0].parser_id,
-                "parser_config": kb[0].parser_config,
-                "create_time": current_timestamp(),
-                "create_date": get_format_time(),
-                "update_time": current_timestamp(),
-                "update_date": get_format_time(),
-                "status": StatusEnum.VALID.value,
-                "run": "todo",
-                "progress": 0
-            }
-            
-            # Save document metadata
-            success = DocumentService.save(**doc_data)
-            if not success:
-                return get_error_data_result(
-                    message=f"Failed to save document {file.filename}",
-                    code=settings.RetCode.SERVER_ERROR
-                )
-                
-            # Save file content
-            success = DocumentService.save_file(doc_id, file.filename, file_content)
-            if not success:
-                DocumentService.delete(id=doc_id)
-                return get_error_data_result(
-                    message=f"Failed to save file content for {file.filename}",
-                    code=settings.RetCode.SERVER_ERROR
-                )
-                
-            doc_ids.append(doc_id)
-            doc_results.append({
-                "id": doc_id,
-                "name": file.filename,
-                "status": "todo"
-            })
-            
+        e, kb = await run_db(KnowledgebaseService.get_by_id, kb_id)
+        if not e:
+            return get_error_data_result(
+                message=f"Knowledge base {kb_id} not found or not accessible",
+                code=settings.RetCode.PARAM_ERROR
+            )
+
+        # Names are picked for the whole batch first, then the files are streamed to the storage concurrently
+        # from their spooled temporary files, never read into memory.
+        kb_folder_id, reserved = await run_db(FileService.reserve_uploads, kb, [file.filename for file in files], tenant_id)
+        errors = [err for _, _, err in reserved if err]
+        limiter = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+        async def upload(file, name, location):
+            async with limiter:
+                try:
+                    # The transfer runs on its own thread, not on the DB pool: only the row inserts go through run_db.
+                    doc = await asyncio.to_thread(FileService.store_document_stream, kb, file.file, name, location, tenant_id)
+                    return await run_db(FileService.add_stored_document, kb, kb_folder_id, doc)
+                except Exception as e:
+                    logging.exception(f"Fail to upload {file.filename}")
+                    errors.append(f"{file.filename}: {str(e)}")
+                finally:
+                    await file.close()
+
+        docs = await asyncio.gather(*[upload(file, name, location) for file, (name, location, err) in zip(files, reserved) if not err])
+        docs = [doc for doc in docs if doc]
+        doc_ids = [doc["id"] for doc in docs]
+        doc_results = [{"id": doc["id"], "name": doc["name"], "status": "todo"} for doc in docs]
+        if errors and not doc_ids:
+            return get_error_data_result(
+                message="\n".join(errors),
+                code=settings.RetCode.SERVER_ERROR
+            )
+
         # Start processing documents
         if doc_ids:
-            DocumentService.run_documents(doc_ids, "run")
+            await run_db(DocumentService.run_documents, doc_ids, "run")
             
+        if errors:
+            return get_json_result(doc_results, code=settings.RetCode.SERVER_ERROR, message="\n".join(errors))
         return get_json_result(doc_results)
         
     except Exception as e:
@@ -379,7 +371,7 @@ async def update_document(
     """
     try:
         # Check if knowledge base exists and belongs to tenant
-        kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+        kb = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
         if not kb:
             return get_error_data_result(
                 message=f"Knowledge base {kb_id} not found or not accessible",
@@ -387,7 +379,7 @@ async def update_document(
             )
             
         # Check if document exists and belongs to this knowledge base
-        doc = DocumentService.query(id=doc_id, kb_id=kb_id, status=StatusEnum.VALID.value)
+        doc = await run_db(DocumentService.query, id=doc_id, kb_id=kb_id, status=StatusEnum.VALID.value)
         if not doc:
             return get_error_data_result(
                 message=f"Document {doc_id} not found in knowledge base {kb_id}",
@@ -403,7 +395,7 @@ async def update_document(
         for key, value in update_dict.items():
             setattr(doc_obj, key, value)
             
-        if not doc_obj.save():
+        if not await run_db(doc_obj.save):
             return get_error_data_result(
                 message="Failed to update document",
                 code=settings.RetCode.SERVER_ERROR
@@ -411,7 +403,7 @@ async def update_document(
             
         # Re-process document if parser configuration changed
         if "parser_id" in update_dict or "parser_config" in update_dict:
-            DocumentService.run_documents([doc_id], "run")
+            await run_db(DocumentService.run_documents, [doc_id], "run")
             
         return get_json_result(doc_obj.to_json())
         
@@ -432,7 +424,7 @@ async def delete_document(
     """
     try:
         # Check if knowledge base exists and belongs to tenant
-        kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+        kb = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
         if not kb:
             return get_error_data_result(
                 message=f"Knowledge base {kb_id} not found or not accessible",
@@ -440,7 +432,7 @@ async def delete_document(
             )
             
         # Check if document exists and belongs to this knowledge base
-        doc = DocumentService.query(id=doc_id, kb_id=kb_id, status=StatusEnum.VALID.value)
+        doc = await run_db(DocumentService.query, id=doc_id, kb_id=kb_id, status=StatusEnum.VALID.value)
         if not doc:
             return get_error_data_result(
                 message=f"Document {doc_id} not found in knowledge base {kb_id}",
@@ -448,7 +440,7 @@ async def delete_document(
             )
             
         # Delete document
-        if not DocumentService.delete(id=doc_id):
+        if not await run_db(DocumentService.delete, id=doc_id):
             return get_error_data_result(
                 message=f"Failed to delete document {doc_id}",
                 code=settings.RetCode.SERVER_ERROR
@@ -473,7 +465,7 @@ async def delete_documents(
     """
     try:
         # Check if knowledge base exists and belongs to tenant
-        kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+        kb = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
         if not kb:
             return get_error_data_result(
                 message=f"Knowledge base {kb_id} not found or not accessible",
@@ -485,14 +477,14 @@ async def delete_documents(
         if ids:
             # Delete specific documents
             for doc_id in ids:
-                doc = DocumentService.query(id=doc_id, kb_id=kb_id, status=StatusEnum.VALID.value)
-                if doc and DocumentService.delete(id=doc_id):
+                doc = await run_db(DocumentService.query, id=doc_id, kb_id=kb_id, status=StatusEnum.VALID.value)
+                if doc and await run_db(DocumentService.delete, id=doc_id):
                     deleted_ids.append(doc_id)
         else:
             # Delete all documents in this knowledge base
-            docs = DocumentService.query(kb_id=kb_id, status=StatusEnum.VALID.value)
+            docs = await run_db(DocumentService.query, kb_id=kb_id, status=StatusEnum.VALID.value)
             for doc in docs:
-                if DocumentService.delete(id=doc.id):
+                if await run_db(DocumentService.delete, id=doc.id):
                     deleted_ids.append(doc.id)
                     
         return get_json_result({"deleted_ids": deleted_ids})
@@ -518,7 +510,7 @@ async def list_documents(
     """
     try:
         # Check if knowledge base exists and belongs to tenant
-        kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+        kb = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
         if not kb:
             return get_error_data_result(
                 message=f"Knowledge base {kb_id} not found or not accessible",
@@ -533,8 +525,8 @@ async def list_documents(
             filters["type"] = types
             
         # Get total count and paginated documents
-        total = DocumentService.count(filters, keywords)
-        docs = DocumentService.query_page(
+        total = await run_db(DocumentService.count, filters, keywords)
+        docs = await run_db(DocumentService.query_page,
             page=page,
             page_size=page_size,
             filters=filters,
@@ -578,7 +570,7 @@ async def get_document_detail(
     """
     try:
         # Check if knowledge base exists and belongs to tenant
-        kb = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+        kb = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
         if not kb:
             return get_error_data_result(
                 message=f"Knowledge base {kb_id} not found or not accessible",
@@ -586,7 +578,7 @@ async def get_document_detail(
             )
             
         # Check if document exists and belongs to this knowledge base
-        doc = DocumentService.query(id=doc_id, kb_id=kb_id, status=StatusEnum.VALID.value)
+        doc = await run_db(DocumentService.query, id=doc_id, kb_id=kb_id, status=StatusEnum.VALID.value)
         if not doc:
             return get_error_data_result(
                 message=f"Document {doc_id} not found in knowledge base {kb_id}",
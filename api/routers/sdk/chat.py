@@ -11,7 +11,7 @@ from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.llm_service import TenantLLMService
 from api.db.services.user_service import TenantService
 from api.utils import get_uuid
-from api.utils.fastapi_utils import token_required, get_error_data_result, get_result, check_duplicate_ids
+from api.utils.fastapi_utils import token_required, get_error_data_result, get_result, check_duplicate_ids, run_db
 
 router = APIRouter(
     prefix=f"/api/{API_VERSION}/chats",
@@ -103,15 +103,15 @@ async def create_chat(
         # Validate dataset IDs
         ids = [i for i in req.get("dataset_ids", []) if i]
         for kb_id in ids:
-            kbs = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+            kbs = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
             if not kbs:
                 return get_error_data_result(f"You don't own the dataset {kb_id}")
-            kbs = KnowledgebaseService.query(id=kb_id)
+            kbs = await run_db(KnowledgebaseService.query, id=kb_id)
             kb = kbs[0]
             if kb.chunk_num == 0:
                 return get_error_data_result(f"The dataset {kb_id} doesn't own parsed file")
         
-        kbs = KnowledgebaseService.get_by_ids(ids) if ids else []
+        kbs = await run_db(KnowledgebaseService.get_by_ids, ids) if ids else []
         embd_ids = [TenantLLMService.split_model_name_and_factory(kb.embd_id)[0] for kb in kbs]
         embd_count = list(set(embd_ids))
         if len(embd_count) > 1:
@@ -127,12 +127,12 @@ async def create_chat(
         if llm:
             if "model_name" in llm:
                 req["llm_id"] = llm.pop("model_name")
-                if not TenantLLMService.query(tenant_id=tenant_id, llm_name=req["llm_id"], model_type="chat"):
+                if not await run_db(TenantLLMService.query, tenant_id=tenant_id, llm_name=req["llm_id"], model_type="chat"):
                     return get_error_data_result(f"`model_name` {req.get('llm_id')} doesn't exist")
             req["llm_setting"] = req.pop("llm")
         
         # Get tenant
-        e, tenant = TenantService.get_by_id(tenant_id)
+        e, tenant = await run_db(TenantService.get_by_id, tenant_id)
         if not e:
             return get_error_data_result(message="Tenant not found!")
         
@@ -168,7 +168,7 @@ async def create_chat(
         # Validate rerank model
         if req.get("rerank_id"):
             value_rerank_model = ["BAAI/bge-reranker-v2-m3", "maidalun1020/bce-reranker-base_v1"]
-            if req["rerank_id"] not in value_rerank_model and not TenantLLMService.query(
+            if req["rerank_id"] not in value_rerank_model and not await run_db(TenantLLMService.query,
                 tenant_id=tenant_id,
                 llm_name=req.get("rerank_id"),
                 model_type="rerank"
@@ -182,7 +182,7 @@ async def create_chat(
         # Validate name
         if not req.get("name"):
             return get_error_data_result(message="`name` is required.")
-        if DialogService.query(name=req["name"], tenant_id=tenant_id, status=StatusEnum.VALID.value):
+        if await run_db(DialogService.query, name=req["name"], tenant_id=tenant_id, status=StatusEnum.VALID.value):
             return get_error_data_result(message="Duplicated chat name in creating chat.")
         
         # Set tenant_id
@@ -223,11 +223,11 @@ async def create_chat(
                     message="Parameter '{}' is not used".format(p["key"]))
         
         # Save chat
-        if not DialogService.save(**req):
+        if not await run_db(DialogService.save, **req):
             return get_error_data_result(message="Fail to new a chat!")
         
         # Get and format response
-        e, res = DialogService.get_by_id(req["id"])
+        e, res = await run_db(DialogService.get_by_id, req["id"])
         if not e:
             return get_error_data_result(message="Fail to new a chat!")
         
@@ -280,7 +280,7 @@ async def update_chat(
     """
     try:
         # Check if chat exists and belongs to tenant
-        if not DialogService.query(tenant_id=tenant_id, id=chat_id, status=StatusEnum.VALID.value):
+        if not await run_db(DialogService.query, tenant_id=tenant_id, id=chat_id, status=StatusEnum.VALID.value):
             return get_error_data_result(message='You do not own the chat')
         
         # Convert request model to dict for processing
@@ -294,15 +294,15 @@ async def update_chat(
         ids = req.get("dataset_ids")
         if ids is not None:
             for kb_id in ids:
-                kbs = KnowledgebaseService.accessible(kb_id=kb_id, user_id=tenant_id)
+                kbs = await run_db(KnowledgebaseService.accessible, kb_id=kb_id, user_id=tenant_id)
                 if not kbs:
                     return get_error_data_result(f"You don't own the dataset {kb_id}")
-                kbs = KnowledgebaseService.query(id=kb_id)
+                kbs = await run_db(KnowledgebaseService.query, id=kb_id)
                 kb = kbs[0]
                 if kb.chunk_num == 0:
                     return get_error_data_result(f"The dataset {kb_id} doesn't own parsed file")
                 
-            kbs = KnowledgebaseService.get_by_ids(ids)
+            kbs = await run_db(KnowledgebaseService.get_by_ids, ids)
             embd_ids = [TenantLLMService.split_model_name_and_factory(kb.embd_id)[0] for kb in kbs]
             embd_count = list(set(embd_ids))
             if len(embd_count) != 1:
@@ -316,12 +316,12 @@ async def update_chat(
         if llm:
             if "model_name" in llm:
                 req["llm_id"] = llm.pop("model_name")
-                if not TenantLLMService.query(tenant_id=tenant_id, llm_name=req["llm_id"], model_type="chat"):
+                if not await run_db(TenantLLMService.query, tenant_id=tenant_id, llm_name=req["llm_id"], model_type="chat"):
                     return get_error_data_result(f"`model_name` {req.get('llm_id')} doesn't exist")
             req["llm_setting"] = req.pop("llm")
         
         # Get tenant
-        e, tenant = TenantService.get_by_id(tenant_id)
+        e, tenant = await run_db(TenantService.get_by_id, tenant_id)
         if not e:
             return get_error_data_result(message="Tenant not found!")
         
@@ -350,7 +350,7 @@ async def update_chat(
             req["prompt_config"] = req.pop("prompt")
         
         # Update chat
-        e, res = DialogService.get_by_id(chat_id)
+        e, res = await run_db(DialogService.get_by_id, chat_id)
         if not e:
             return get_error_data_result(message="Chat not found!")
         
@@ -360,7 +360,7 @@ async def update_chat(
                 setattr(res, key, value)
         
         # Save changes
-        if not res.save():
+        if not await run_db(res.save):
             return get_error_data_result(message="Fail to update the chat!")
         
         # Get and format response
@@ -421,13 +421,13 @@ async def delete_chats(
         
         # Verify ownership of all chats
         for id in ids:
-            if not DialogService.query(id=id, tenant_id=tenant_id, status=StatusEnum.VALID.value):
+            if not await run_db(DialogService.query, id=id, tenant_id=tenant_id, status=StatusEnum.VALID.value):
                 return get_error_data_result(message=f"You do not own the chat {id}")
         
         # Delete chats
         for id in ids:
             try:
-                DialogService.delete(id=id)
+                await run_db(DialogService.delete, id=id)
             except Exception as e:
                 return get_error_data_result(message=f"Failed to delete chat {id}: {str(e)}")
         
@@ -442,7 +442,7 @@ async def list_chats(tenant_id: str = Depends(token_required)):
     List all chats for the tenant
     """
     try:
-        chats = DialogService.query(tenant_id=tenant_id, status=StatusEnum.VALID.value)
+        chats = await run_db(DialogService.query, tenant_id=tenant_id, status=StatusEnum.VALID.value)
         result = []
         
         for chat in chats:
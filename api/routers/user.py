@@ -24,7 +24,8 @@ from api.utils.fastapi_utils import (
     get_json_result, 
     get_error_data_result, 
     construct_response,
-    validate_params
+    validate_params,
+    run_db
 )
 from api.apps.auth import get_auth_client
 
@@ -69,7 +70,7 @@ async def login(login_data: LoginRequest):
     User login endpoint.
     """
     email = login_data.email
-    users = UserService.query(email=email)
+    users = await run_db(UserService.query, email=email)
     if not users:
         return get_json_result(
             data=False,
@@ -87,13 +88,13 @@ async def login(login_data: LoginRequest):
             message="Fail to crypt password"
         )
 
-    user = UserService.query_user(email, password)
+    user = await run_db(UserService.query_user, email, password)
     if user:
         response_data = user.to_json()
         user.access_token = get_uuid()
         user.update_time = current_timestamp()
         user.update_date = datetime_format(datetime.now())
-        user.save()
+        await run_db(user.save)
         msg = "Welcome back!"
         return construct_response(data=response_data, auth=user.get_id(), message=msg)
     else:
@@ -168,7 +169,7 @@ async def oauth_callback(channel: str, code: Optional[str] = None):
             return RedirectResponse("/?error=email_missing")
 
         # Login or register
-        users = UserService.query(email=user_info.email)
+        users = await run_db(UserService.query, email=user_info.email)
         user_id = get_uuid()
         
         if not users:
@@ -178,7 +179,8 @@ async def oauth_callback(channel: str, code: Optional[str] = None):
                 except Exception:
                     avatar = ""
 
-                users = user_register(
+                users = await run_db(
+                    user_register,
                     user_id,
                     {
                         "access_token": get_uuid(),
@@ -188,12 +190,12 @@ async def oauth_callback(channel: str, code: Optional[str] = None):
                     }
                 )
             except Exception as e:
-                rollback_user_registration(user_id)
+                await run_db(rollback_user_registration, user_id)
                 raise e
         
         user = users[0]
         user.access_token = get_uuid()
-        user.save()
+        await run_db(user.save)
         
         return RedirectResponse(f"/?token={user.access_token}")
     except Exception as e:
@@ -205,11 +207,11 @@ async def logout(tenant_id: str = Depends(token_required)):
     User logout
     """
     try:
-        users = UserService.query(id=tenant_id)
+        users = await run_db(UserService.query, id=tenant_id)
         if users:
             user = users[0]
             user.access_token = ""
-            user.save()
+            await run_db(user.save)
         return get_json_result(True)
     except Exception as e:
         return get_json_result(
@@ -227,7 +229,7 @@ async def setting_user(
     Update user settings
     """
     try:
-        users = UserService.query(id=tenant_id)
+        users = await run_db(UserService.query, id=tenant_id)
         if not users:
             return get_json_result(
                 data=False,
@@ -266,7 +268,7 @@ async def setting_user(
                     message="Fail to crypt password"
                 )
         
-        user.save()
+        await run_db(user.save)
         return get_json_result(True)
     except Exception as e:
         return get_json_result(
@@ -281,7 +283,7 @@ async def user_profile(tenant_id: str = Depends(token_required)):
     Get user profile information
     """
     try:
-        users = UserService.query(id=tenant_id)
+        users = await run_db(UserService.query, id=tenant_id)
         if not users:
             return get_json_result(
                 data=False,
@@ -383,7 +385,7 @@ async def user_add(request: Request):
             return get_error_data_result("Invalid email format")
         
         # Check if email already exists
-        if UserService.query(email=email):
+        if await run_db(UserService.query, email=email):
             return get_error_data_result(f"Email: {email} is already registered")
         
         # Password validation
@@ -406,13 +408,13 @@ async def user_add(request: Request):
         }
         
         try:
-            user_register(user_id, user)
+            await run_db(user_register, user_id, user)
         except Exception as e:
-            rollback_user_registration(user_id)
+            await run_db(rollback_user_registration, user_id)
             return get_error_data_result(str(e))
         
         # Return new user
-        users = UserService.query(id=user_id)
+        users = await run_db(UserService.query, id=user_id)
         if not users:
             return get_error_data_result("Fail to create user")
         
@@ -429,7 +431,7 @@ async def tenant_info(tenant_id: str = Depends(token_required)):
     Get tenant information
     """
     try:
-        e, res = TenantService.get_by_id(tenant_id)
+        e, res = await run_db(TenantService.get_by_id, tenant_id)
         if not e:
             return get_error_data_result(message="Tenant not found!")
         
@@ -457,7 +459,7 @@ async def set_tenant_info(
         if tenant_info.tenant_id != tenant_id:
             return get_error_data_result(message="You don't own the tenant!")
         
-        e, tenant = TenantService.get_by_id(tenant_id)
+        e, tenant = await run_db(TenantService.get_by_id, tenant_id)
         if not e:
             return get_error_data_result(message="Tenant not found!")
         
@@ -469,7 +471,7 @@ async def set_tenant_info(
         tenant.update_time = current_timestamp()
         tenant.update_date = get_format_time()
         
-        if not tenant.save():
+        if not await run_db(tenant.save):
             return get_error_data_result(message="Fail to update tenant!")
         
         return get_json_result(True)
@@ -19,6 +19,7 @@ from datetime import date
 from enum import Enum, IntEnum
 
 import rag.utils
+import rag.utils.embedded_conn
 import rag.utils.es_conn
 import rag.utils.infinity_conn
 import rag.utils.opensearch_coon
@@ -145,6 +146,8 @@ def init_settings():
         docStoreConn = rag.utils.infinity_conn.InfinityConnection()
     elif lower_case_doc_engine == "opensearch":
         docStoreConn = rag.utils.opensearch_coon.OSConnection()
+    elif lower_case_doc_engine == "embedded":
+        docStoreConn = rag.utils.embedded_conn.EmbeddedConnection()
     else:
         raise Exception(f"Not supported doc engine: {DOC_ENGINE}")
 
@@ -1,5 +1,10 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, Optional, Union, TypeVar, Callable, List
-from functools import wraps
+from functools import wraps, partial
 
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import APIKeyHeader
@@ -12,6 +17,64 @@ from api import settings
 
 T = TypeVar('T')
 
+# Service layer access
+DB_THREAD_POOL_SIZE = int(os.environ.get("DB_THREAD_POOL_SIZE", "32"))
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREAD_POOL_SIZE, thread_name_prefix="db")
+_db_lock = threading.Lock()
+_db_stats = {"submitted": 0, "active": 0, "queued": 0, "calls": {}}
+
+def _timed_db_call(func: Callable[..., T], submitted_at: float) -> T:
+    started_at = time.perf_counter()
+    with _db_lock:
+        _db_stats["queued"] -= 1
+        _db_stats["active"] += 1
+    try:
+        return func()
+    finally:
+        done_at = time.perf_counter()
+        owner = getattr(func.func, "__self__", None)
+        name = f"{owner.__name__}.{func.func.__name__}" if isinstance(owner, type) else getattr(func.func, "__qualname__", repr(func.func))
+        with _db_lock:
+            _db_stats["active"] -= 1
+            st = _db_stats["calls"].setdefault(name, {"count": 0, "seconds": 0., "max": 0., "wait": 0.})
+            st["count"] += 1
+            st["seconds"] += done_at - started_at
+            st["max"] = max(st["max"], done_at - started_at)
+            st["wait"] += started_at - submitted_at
+
+async def run_db(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a synchronous service call (peewee query) on the DB thread pool so it doesn't block the event loop.
+    """
+    with _db_lock:
+        _db_stats["submitted"] += 1
+        _db_stats["queued"] += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, _timed_db_call, partial(func, *args, **kwargs), time.perf_counter())
+
+def db_pool_stats() -> Dict[str, Any]:
+    """
+    Utilization of the DB thread pool and per service call latency: count, average and max run time, average queue wait.
+    """
+    with _db_lock:
+        calls = {
+            name: {
+                "count": st["count"],
+                "avg": st["seconds"] / st["count"],
+                "max": st["max"],
+                "wait_avg": st["wait"] / st["count"],
+            }
+            for name, st in _db_stats["calls"].items()
+        }
+        return {
+            "size": DB_THREAD_POOL_SIZE,
+            "active": _db_stats["active"],
+            "queued": _db_stats["queued"],
+            "utilization": _db_stats["active"] / DB_THREAD_POOL_SIZE,
+            "submitted": _db_stats["submitted"],
+            "calls": calls,
+        }
+
 # Models for standardized API responses
 class StandardResponse(BaseModel):
     code: int = Field(0, description="Status code")
@@ -33,7 +96,8 @@ async def token_required(authorization: Optional[str] = Depends(auth_header)) ->
         )
     
     try:
-        user = UserService.query(
+        user = await run_db(
+            UserService.query,
             access_token=authorization, 
             status=StatusEnum.VALID.value
         )
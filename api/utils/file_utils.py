@@ -175,14 +175,22 @@ def filename_type(filename):
 
     return FileType.OTHER.value
 
+def _as_stream(blob):
+    if hasattr(blob, "read"):
+        blob.seek(0)
+        return blob
+    return BytesIO(blob)
+
+
 def thumbnail_img(filename, blob):
     """
     MySQL LongText max length is 65535
+    `blob` is the content, or a seekable file object holding it.
     """
     filename = filename.lower()
     if re.match(r".*\.pdf$", filename):
         with sys.modules[LOCK_KEY_pdfplumber]:
-            pdf = pdfplumber.open(BytesIO(blob))
+            pdf = pdfplumber.open(_as_stream(blob))
             buffered = BytesIO()
             resolution = 32
             img = None
@@ -199,7 +207,7 @@ def thumbnail_img(filename, blob):
         return img
 
     elif re.match(r".*\.(jpg|jpeg|png|tif|gif|icon|ico|webp)$", filename):
-        image = Image.open(BytesIO(blob))
+        image = Image.open(_as_stream(blob))
         image.thumbnail((30, 30))
         buffered = BytesIO()
         image.save(buffered, format="png")
@@ -209,7 +217,7 @@ def thumbnail_img(filename, blob):
         import aspose.slides as slides
         import aspose.pydrawing as drawing
         try:
-            with slides.Presentation(BytesIO(blob)) as presentation:
+            with slides.Presentation(_as_stream(blob)) as presentation:
                 buffered = BytesIO()
                 scale = 0.03
                 img = None
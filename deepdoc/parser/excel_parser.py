@@ -11,12 +11,15 @@
 #  limitations under the License.
 #
 
+import codecs
+import csv
 import logging
 import sys
-from io import BytesIO
+from io import BytesIO, TextIOWrapper
+from itertools import chain, islice
 
 import pandas as pd
-from openpyxl import Workbook, load_workbook
+from openpyxl import load_workbook
 
 from rag.nlp import find_codec
 
@@ -24,104 +27,121 @@ from rag.nlp import find_codec
 class RAGFlowExcelParser:
 
     @staticmethod
-    def _load_excel_to_workbook(file_like_object):
-        if isinstance(file_like_object, bytes):
-            file_like_object = BytesIO(file_like_object)
+    def _iter_sheets(fnm):
+        """
+        Yields (sheet name, rows) for every sheet, `rows` being a lazy iterator over the tuples of cell values,
+        header row first. Workbooks are opened read-only and CSV is read line by line, so only the rows being
+        iterated are in memory; consume the rows of a sheet before moving on to the next one.
+        """
+        file_like_object = BytesIO(fnm) if isinstance(fnm, bytes) else fnm
 
         # Read first 4 bytes to determine file type
-        file_like_object.seek(0)
-        file_head = file_like_object.read(4)
-        file_like_object.seek(0)
+        if isinstance(file_like_object, str):
+            with open(file_like_object, "rb") as f:
+                file_head = f.read(4)
+        else:
+            file_like_object.seek(0)
+            file_head = file_like_object.read(4)
+            file_like_object.seek(0)
 
         if not (file_head.startswith(b'PK\x03\x04') or file_head.startswith(b'\xD0\xCF\x11\xE0')):
-            logging.info("****wxy: Not an Excel file, converting CSV to Excel Workbook")
-
-            try:
-                file_like_object.seek(0)
-                df = pd.read_csv(file_like_object)
-                return RAGFlowExcelParser._dataframe_to_workbook(df)
-
-            except Exception as e_csv:
-                raise Exception(f"****wxy: Failed to parse CSV and convert to Excel Workbook: {e_csv}")
+            logging.info("****wxy: Not an Excel file, reading it as CSV")
+            yield "Data", RAGFlowExcelParser._iter_csv_rows(file_like_object)
+            return
 
         try:
-            return load_workbook(file_like_object,data_only= True)
+            wb = load_workbook(file_like_object, read_only=True, data_only=True)
         except Exception as e:
             logging.info(f"****wxy: openpyxl load error: {e}, try pandas instead")
             try:
-                file_like_object.seek(0)
+                if not isinstance(file_like_object, str):
+                    file_like_object.seek(0)
                 df = pd.read_excel(file_like_object)
-                return RAGFlowExcelParser._dataframe_to_workbook(df)
             except Exception as e_pandas:
                 raise Exception(f"****wxy: pandas.read_excel error: {e_pandas}, original openpyxl error: {e}")
+            yield "Data", chain([tuple(df.columns)], df.itertuples(index=False, name=None))
+            return
 
-    @staticmethod
-    def _dataframe_to_workbook(df):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Data"
-
-        for col_num, column_name in enumerate(df.columns, 1):
-            ws.cell(row=1, column=col_num, value=column_name)
+        try:
+            for ws in wb.worksheets:
+                # Some exporters write a stale dimension (e.g. "A1"), which read-only sheets would trust.
+                ws.reset_dimensions()
+                yield ws.title, ws.iter_rows(min_row=1, values_only=True)
+        finally:
+            wb.close()
 
-        for row_num, row in enumerate(df.values, 2):
-            for col_num, value in enumerate(row, 1):
-                ws.cell(row=row_num, column=col_num, value=value)
+    @staticmethod
+    def _iter_csv_rows(file_like_object):
+        f = open(file_like_object, "rb") if isinstance(file_like_object, str) else file_like_object
+        try:
+            encoding = find_codec(f.read(4096))
+            if codecs.lookup(encoding).name == "utf-8":
+                encoding = "utf-8-sig"
+            f.seek(0)
+            txt = TextIOWrapper(f, encoding=encoding, errors="ignore", newline="")
+            try:
+                for row in csv.reader(txt):
+                    # Blank lines are skipped and empty fields read as empty cells.
+                    if row:
+                        yield tuple(v if v != "" else None for v in row)
+            finally:
+                txt.detach()
+        finally:
+            if f is not file_like_object:
+                f.close()
 
-        return wb
+    @staticmethod
+    def _fit(row, width):
+        # Rows of sheets read without their dimension lack their trailing empty cells.
+        if len(row) < width:
+            return tuple(row) + (None,) * (width - len(row))
+        return row
 
     def html(self, fnm, chunk_rows=256):
-        file_like_object = BytesIO(fnm) if not isinstance(fnm, str) else fnm
-        wb = RAGFlowExcelParser._load_excel_to_workbook(file_like_object)
         tb_chunks = []
-        for sheetname in wb.sheetnames:
-            ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows:
+        for sheetname, rows in RAGFlowExcelParser._iter_sheets(fnm):
+            header = next(rows, None)
+            if header is None:
                 continue
 
             tb_rows_0 = "<tr>"
-            for t in list(rows[0]):
-                tb_rows_0 += f"<th>{t.value}</th>"
+            for t in header:
+                tb_rows_0 += f"<th>{t}</th>"
             tb_rows_0 += "</tr>"
 
-            for chunk_i in range((len(rows) - 1) // chunk_rows + 1):
+            while True:
+                chunk = list(islice(rows, chunk_rows))
                 tb = ""
                 tb += f"<table><caption>{sheetname}</caption>"
                 tb += tb_rows_0
-                for r in list(
-                    rows[1 + chunk_i * chunk_rows: 1 + (chunk_i + 1) * chunk_rows]
-                ):
+                for r in chunk:
                     tb += "<tr>"
-                    for i, c in enumerate(r):
-                        if c.value is None:
+                    for i, c in enumerate(RAGFlowExcelParser._fit(r, len(header))):
+                        if c is None:
                             tb += "<td></td>"
                         else:
-                            tb += f"<td>{c.value}</td>"
+                            tb += f"<td>{c}</td>"
                     tb += "</tr>"
                 tb += "</table>\n"
                 tb_chunks.append(tb)
+                if len(chunk) < chunk_rows:
+                    break
 
         return tb_chunks
 
     def __call__(self, fnm):
-        file_like_object = BytesIO(fnm) if not isinstance(fnm, str) else fnm
-        wb = RAGFlowExcelParser._load_excel_to_workbook(file_like_object)
-
         res = []
-        for sheetname in wb.sheetnames:
-            ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows:
+        for sheetname, rows in RAGFlowExcelParser._iter_sheets(fnm):
+            ti = next(rows, None)
+            if ti is None:
                 continue
-            ti = list(rows[0])
-            for r in list(rows[1:]):
+            for r in rows:
                 fields = []
-                for i, c in enumerate(r):
-                    if not c.value:
+                for i, c in enumerate(RAGFlowExcelParser._fit(r, len(ti))):
+                    if not c:
                         continue
-                    t = str(ti[i].value) if i < len(ti) else ""
-                    t += ("：" if t else "") + str(c.value)
+                    t = str(ti[i]) if i < len(ti) else ""
+                    t += ("：" if t else "") + str(c)
                     fields.append(t)
                 line = "; ".join(fields)
                 if sheetname.lower().find("sheet") < 0:
@@ -132,17 +152,15 @@ class RAGFlowExcelParser:
     @staticmethod
     def row_number(fnm, binary):
         if fnm.split(".")[-1].lower().find("xls") >= 0:
-            wb = RAGFlowExcelParser._load_excel_to_workbook(BytesIO(binary))
             total = 0
-            for sheetname in wb.sheetnames:
-                ws = wb[sheetname]
-                total += len(list(ws.rows))
+            for _, rows in RAGFlowExcelParser._iter_sheets(binary):
+                total += sum(1 for _ in rows)
             return total
 
         if fnm.split(".")[-1].lower() in ["csv", "txt"]:
             encoding = find_codec(binary)
             txt = binary.decode(encoding, errors="ignore")
-            return len(txt.split("\n"))
+            return txt.count("\n") + 1
 
 
 if __name__ == "__main__":
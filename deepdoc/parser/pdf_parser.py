@@ -34,7 +34,9 @@ from pypdf import PdfReader as pdf2_read
 
 from api import settings
 from api.utils.file_utils import get_project_base_directory
+from deepdoc.parser.pdf_rasterizer import PdfRasterizer
 from deepdoc.vision import OCR, LayoutRecognizer, Recognizer, TableStructureRecognizer
+from deepdoc.vision.box_index import BoxIndex
 from rag.app.picture import vision_llm_chunk as picture_vision_llm_chunk
 from rag.nlp import rag_tokenizer
 from rag.prompts import vision_llm_describe_prompt
@@ -44,6 +46,8 @@ LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
 if LOCK_KEY_pdfplumber not in sys.modules:
     sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
 
+OCR_PAGE_CONCURRENCY = int(os.environ.get("OCR_PAGE_CONCURRENCY", "4"))
+
 
 class RAGFlowPdfParser:
     def __init__(self, **kwargs):
@@ -183,8 +187,12 @@ class RAGFlowPdfParser:
     def sort_X_by_page(arr, threashold):
         # sort using y1 first and then x1
         arr = sorted(arr, key=lambda r: (r["page_number"], r["x0"], r["top"]))
+        page_start = 0
         for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
+            # boxes are never swapped across pages, so the pass stays within the page of arr[i + 1]
+            if arr[i + 1]["page_number"] != arr[page_start]["page_number"]:
+                page_start = i + 1
+            for j in range(i, page_start - 1, -1):
                 # restore the order using th
                 if abs(arr[j + 1]["x0"] - arr[j]["x0"]) < threashold \
                         and arr[j + 1]["top"] < arr[j]["top"] \
@@ -248,10 +256,12 @@ class RAGFlowPdfParser:
                     pg.append(it)
             self.tb_cpns.extend(pg)
 
+        boxes_index = BoxIndex(self.boxes)
+
         def gather(kwd, fzy=10, ption=0.6):
             eles = Recognizer.sort_Y_firstly(
                 [r for r in self.tb_cpns if re.match(kwd, r["label"])], fzy)
-            eles = Recognizer.layouts_cleanup(self.boxes, eles, 5, ption)
+            eles = Recognizer.layouts_cleanup(self.boxes, eles, 5, ption, boxes_index)
             return Recognizer.sort_Y_firstly(eles, 0)
 
         # add R,H,C,SP tag to boxes within table layout
@@ -260,18 +270,19 @@ class RAGFlowPdfParser:
         spans = gather(r".*spanning")
         clmns = sorted([r for r in self.tb_cpns if re.match(
             r"table column$", r["label"])], key=lambda x: (x["pn"], x["layoutno"], x["x0"]))
-        clmns = Recognizer.layouts_cleanup(self.boxes, clmns, 5, 0.5)
+        clmns = Recognizer.layouts_cleanup(self.boxes, clmns, 5, 0.5, boxes_index)
+        rows_index, headers_index, spans_index = BoxIndex(rows), BoxIndex(headers), BoxIndex(spans)
         for b in self.boxes:
             if b.get("layout_type", "") != "table":
                 continue
-            ii = Recognizer.find_overlapped_with_threashold(b, rows, thr=0.3)
+            ii = Recognizer.find_overlapped_with_threashold(b, rows, thr=0.3, index=rows_index)
             if ii is not None:
                 b["R"] = ii
                 b["R_top"] = rows[ii]["top"]
                 b["R_bott"] = rows[ii]["bottom"]
 
             ii = Recognizer.find_overlapped_with_threashold(
-                b, headers, thr=0.3)
+                b, headers, thr=0.3, index=headers_index)
             if ii is not None:
                 b["H_top"] = headers[ii]["top"]
                 b["H_bott"] = headers[ii]["bottom"]
@@ -285,7 +296,7 @@ class RAGFlowPdfParser:
                 b["C_left"] = clmns[ii]["x0"]
                 b["C_right"] = clmns[ii]["x1"]
 
-            ii = Recognizer.find_overlapped_with_threashold(b, spans, thr=0.3)
+            ii = Recognizer.find_overlapped_with_threashold(b, spans, thr=0.3, index=spans_index)
             if ii is not None:
                 b["H_top"] = spans[ii]["top"]
                 b["H_bott"] = spans[ii]["bottom"]
@@ -300,7 +311,7 @@ class RAGFlowPdfParser:
 
         start = timer()
         if not bxs:
-            self.boxes.append([])
+            self.boxes[pagenum - 1] = []
             return
         bxs = [(line[0], line[1][0]) for line in bxs]
         bxs = Recognizer.sort_Y_firstly(
@@ -313,8 +324,9 @@ class RAGFlowPdfParser:
         )
 
         # merge chars in the same rect
+        bxs_index = BoxIndex(bxs)
         for c in chars:
-            ii = Recognizer.find_overlapped(c, bxs)
+            ii = Recognizer.find_overlapped(c, bxs, index=bxs_index)
             if ii is None:
                 self.lefted_chars.append(c)
                 continue
@@ -358,7 +370,7 @@ class RAGFlowPdfParser:
         if self.mean_height[pagenum-1] == 0:
             self.mean_height[pagenum-1] = np.median([b["bottom"] - b["top"]
                                               for b in bxs])
-        self.boxes.append(bxs)
+        self.boxes[pagenum - 1] = bxs
 
     def _layouts_rec(self, ZM, drop=True):
         assert len(self.page_images) == len(self.boxes)
@@ -1010,31 +1022,14 @@ class RAGFlowPdfParser:
         self.page_cum_height = [0]
         self.page_layout = []
         self.page_from = page_from
-        start = timer()
-        try:
-            with sys.modules[LOCK_KEY_pdfplumber]:
-                with (pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))) as pdf:
-                    self.pdf = pdf
-                    self.page_images = [p.to_image(resolution=72 * zoomin, antialias=True).annotated for i, p in
-                                        enumerate(self.pdf.pages[page_from:page_to])]
-
-                    try:
-                        self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
-                    except Exception as e:
-                        logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
-                        self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
-
-                    self.total_page = len(self.pdf.pages)
-
-        except Exception:
-            logging.exception("RAGFlowPdfParser __images__")
-        logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
-
+        self.page_images = []
+        self.total_page = None
         self.outlines = []
         try:
             with (pdf2_read(fnm if isinstance(fnm, str)
                             else BytesIO(fnm))) as pdf:
                 self.pdf = pdf
+                self.total_page = len(self.pdf.pages)
 
                 outlines = self.pdf.outline
                 def dfs(arr, depth):
@@ -1052,12 +1047,25 @@ class RAGFlowPdfParser:
         if not self.outlines:
             logging.warning("Miss outlines")
 
+        start = timer()
+        rasterizer = PdfRasterizer(fnm, page_from, page_to, zoomin, self.total_page)
+        try:
+            self.total_page, page_chars = rasterizer.chars()
+            page_num = len(range(self.total_page)[page_from:page_to])
+            if page_chars is None:
+                page_chars = [[] for _ in range(page_num)]  # If failed to extract, using empty list instead.
+            self.page_chars = [[c for c in chars if self._has_color(c)] for chars in page_chars]
+        except Exception:
+            logging.exception("RAGFlowPdfParser __images__")
+            self.total_page, self.page_chars = 0, []
+        logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
+
         logging.debug("Images converted.")
         self.is_english = [re.search(r"[a-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join(
             random.choices([c["text"] for c in self.page_chars[i]], k=min(100, len(self.page_chars[i]))))) for i in
             range(len(self.page_chars))]
         if sum([1 if e else 0 for e in self.is_english]) > len(
-                self.page_images) / 2:
+                self.page_chars) / 2:
             self.is_english = True
         else:
             self.is_english = False
@@ -1078,8 +1086,8 @@ class RAGFlowPdfParser:
             else:
                 self.__ocr(i + 1, img, chars, zoomin, id)
 
-            if callback and i % 6 == 5:
-                callback(prog=(i + 1) * 0.6 / len(self.page_images), msg="")
+            if callback:
+                callback(prog=(i + 1) * 0.6 / len(self.page_chars), msg="")
 
         async def __img_ocr_launcher():
             def __ocr_preprocess():
@@ -1093,22 +1101,38 @@ class RAGFlowPdfParser:
                 self.page_cum_height.append(img.size[1] / zoomin)
                 return chars
 
+            async def __rasterized_pages():
+                # Pages are OCRed as they come out of the rasterizer.
+                for i in range(len(self.page_chars)):
+                    img = await trio.to_thread.run_sync(rasterizer.next_page)
+                    if img is None:
+                        break
+                    self.page_images.append(img)
+                    self.boxes.append([])
+                    yield i, img
+
             if self.parallel_limiter:
                 async with trio.open_nursery() as nursery:
-                    for i, img in enumerate(self.page_images):
+                    async for i, img in __rasterized_pages():
                         chars = __ocr_preprocess()
 
                         nursery.start_soon(__img_ocr, i, i % PARALLEL_DEVICES, img, chars,
                                            self.parallel_limiter[i % PARALLEL_DEVICES])
                         await trio.sleep(0.1)
             else:
-                for i, img in enumerate(self.page_images):
-                    chars = __ocr_preprocess()
-                    await __img_ocr(i, 0, img, chars, None)
+                # Pages in flight together let the recognizer batch text lines across them.
+                limiter = trio.CapacityLimiter(OCR_PAGE_CONCURRENCY)
+                async with trio.open_nursery() as nursery:
+                    async for i, img in __rasterized_pages():
+                        chars = __ocr_preprocess()
+                        nursery.start_soon(__img_ocr, i, 0, img, chars, limiter)
 
         start = timer()
 
-        trio.run(__img_ocr_launcher)
+        try:
+            trio.run(__img_ocr_launcher)
+        finally:
+            rasterizer.close()
 
         logging.info(f"__images__ {len(self.page_images)} pages cost {timer() - start}s")
 
@@ -0,0 +1,152 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+from PIL import Image
+
+from deepdoc import pdf_raster_worker
+
+PDF_RASTER_WORKERS = int(os.environ.get("PDF_RASTER_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PDF_RASTER_PAGES_PER_JOB = int(os.environ.get("PDF_RASTER_PAGES_PER_JOB", "4"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            ctx = pdf_raster_worker.WorkerContext()
+            ctx.set_forkserver_preload([pdf_raster_worker.__name__])
+            _pool = ProcessPoolExecutor(max_workers=max(1, PDF_RASTER_WORKERS), mp_context=ctx)
+        return _pool
+
+
+def _reset_pool(broken):
+    # A worker died (e.g. killed for memory): the executor refuses any further job, so start a new one.
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(fn, *args):
+    pool = _get_pool()
+    try:
+        return pool, pool.submit(fn, *args)
+    except BrokenProcessPool:
+        logging.warning("PDF rasterizer pool is broken, starting a new one")
+        _reset_pool(pool)
+        pool = _get_pool()
+        return pool, pool.submit(fn, *args)
+
+
+class _Job:
+    def __init__(self, fn, *args):
+        self.fn, self.args = fn, args
+        self.pool, self.future = _submit(fn, *args)
+
+    def result(self):
+        try:
+            return self.future.result()
+        except BrokenProcessPool:
+            logging.warning(f"PDF rasterizer worker died running {self.fn.__name__}{self.args[1:]}, retrying")
+            _reset_pool(self.pool)
+            self.pool, self.future = _submit(self.fn, *self.args)
+            return self.future.result()
+
+    def cancel(self):
+        return self.future.cancel()
+
+    def add_done_callback(self, fn):
+        self.future.add_done_callback(fn)
+
+
+def _take(name, mode, size, nbytes):
+    shm = SharedMemory(name=name)
+    try:
+        return Image.frombytes(mode, size, bytes(shm.buf[:nbytes]))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _discard(pages):
+    for name, _, _, _ in pages:
+        try:
+            shm = SharedMemory(name=name)
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class PdfRasterizer:
+    """
+    Renders the pages of a PDF in a process pool shared by all the parsers of the process,
+    PDF_RASTER_PAGES_PER_JOB pages per job, and hands the images over through shared memory.
+    Pages come out of next_page() in order as soon as their job is done, so OCR can start on the
+    first pages while the others are still being rendered. Characters are extracted by a job of their own.
+    """
+
+    def __init__(self, fnm, page_from, page_to, zoomin, total_page=None):
+        self._shm = None
+        if isinstance(fnm, str):
+            self.src = fnm
+        else:
+            self._shm = SharedMemory(create=True, size=max(1, len(fnm)))
+            self._shm.buf[:len(fnm)] = fnm
+            self.src = (self._shm.name, len(fnm))
+
+        self._chars = _Job(pdf_raster_worker.extract_chars, self.src, page_from, page_to)
+        # Without the page count, page_to may be far beyond the last page: render it all in one job.
+        end = page_to if total_page is None else min(page_to, total_page)
+        step = max(1, PDF_RASTER_PAGES_PER_JOB if total_page is not None else end - page_from)
+        self._jobs = deque(_Job(pdf_raster_worker.render, self.src, s, min(s + step, end), zoomin)
+                           for s in range(page_from, end, step))
+        self._pages = deque()
+
+    def chars(self):
+        """(total page number, deduplicated characters of every page or None if they can't be extracted)"""
+        return self._chars.result()
+
+    def next_page(self):
+        """The image of the next page, None after the last one."""
+        while not self._pages:
+            if not self._jobs:
+                return None
+            self._pages.extend(self._jobs.popleft().result())
+        return _take(*self._pages.popleft())
+
+    def close(self):
+        _discard(self._pages)
+        self._pages.clear()
+        for job in self._jobs:
+            if not job.cancel():
+                job.add_done_callback(lambda j: _discard(j.result()) if not j.exception() else None)
+        self._jobs.clear()
+        if self._shm:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,103 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Processes and jobs of deepdoc.parser.pdf_rasterizer. They live outside deepdoc.parser, whose package
+imports every parser and the vision models, so the workers only load pdfplumber.
+"""
+import logging
+import os
+from io import BytesIO
+from multiprocessing import context, forkserver, popen_forkserver, reduction, spawn, util
+from multiprocessing.shared_memory import SharedMemory
+
+import pdfplumber
+
+
+class WorkerPopen(popen_forkserver.Popen):
+    """
+    Forks a worker from the fork server like popen_forkserver.Popen, but without asking it to import the
+    main module of this process (the task executor, with the OCR models, tokenizer, Redis...) first:
+    the workers only need this module, which the fork server preloads.
+    """
+
+    def _launch(self, process_obj):
+        prep_data = spawn.get_preparation_data(process_obj._name)
+        prep_data.pop("init_main_from_name", None)
+        prep_data.pop("init_main_from_path", None)
+        buf = BytesIO()
+        context.set_spawning_popen(self)
+        try:
+            reduction.dump(prep_data, buf)
+            reduction.dump(process_obj, buf)
+        finally:
+            context.set_spawning_popen(None)
+
+        self.sentinel, w = forkserver.connect_to_new_process(self._fds)
+        _parent_w = os.dup(w)
+        self.finalizer = util.Finalize(self, util.close_fds, (_parent_w, self.sentinel))
+        with open(w, "wb", closefd=True) as f:
+            f.write(buf.getbuffer())
+        self.pid = forkserver.read_signed(self.sentinel)
+
+
+class WorkerProcess(context.ForkServerProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        return WorkerPopen(process_obj)
+
+
+class WorkerContext(context.ForkServerContext):
+    Process = WorkerProcess
+
+
+def _open(src):
+    # A file path, or the name and size of the shared memory block holding the PDF.
+    if isinstance(src, str):
+        return pdfplumber.open(src)
+    shm = SharedMemory(name=src[0])
+    try:
+        binary = bytes(shm.buf[:src[1]])
+    finally:
+        shm.close()
+    return pdfplumber.open(BytesIO(binary))
+
+
+def _plain(char):
+    return {k: v for k, v in char.items() if v is None or isinstance(v, (str, int, float, bool, tuple, list))}
+
+
+def extract_chars(src, page_from, page_to):
+    with _open(src) as pdf:
+        total_page = len(pdf.pages)
+        try:
+            chars = [[_plain(c) for c in page.dedupe_chars().chars] for page in pdf.pages[page_from:page_to]]
+        except Exception as e:
+            logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
+            chars = None
+    return total_page, chars
+
+
+def render(src, page_from, page_to, zoomin):
+    pages = []
+    with _open(src) as pdf:
+        for page in pdf.pages[page_from:page_to]:
+            img = page.to_image(resolution=72 * zoomin, antialias=True).annotated
+            data = img.tobytes()
+            shm = SharedMemory(create=True, size=max(1, len(data)))
+            shm.buf[:len(data)] = data
+            pages.append((shm.name, img.mode, img.size, len(data)))
+            shm.close()
+    return pages
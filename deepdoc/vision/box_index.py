@@ -0,0 +1,96 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import math
+from bisect import bisect_left
+from collections import defaultdict
+
+# Boxes spanning more cells than this are kept aside and checked on every query.
+MAX_CELLS_PER_BOX = 64
+
+
+class BoxIndex:
+    """
+    Uniform grid over boxes ({"x0", "x1", "top", "bottom"}) answering overlap, containment and
+    nearest-below queries from the cells a box spans instead of from every box. The cell size
+    defaults to the median box size, so a box lands in a handful of cells.
+    Queries return box indices in ascending order, i.e. in the order a linear scan visits them,
+    and use the same closed-interval overlap test as Recognizer.overlapped_area.
+    The boxes must not be moved or removed while the index is in use.
+    """
+
+    def __init__(self, boxes, cell_w=None, cell_h=None):
+        self.boxes = boxes
+        self.cw = cell_w or self._median([b["x1"] - b["x0"] for b in boxes])
+        self.ch = cell_h or self._median([b["bottom"] - b["top"] for b in boxes])
+        self.cells = defaultdict(list)
+        self.large = []
+        for i, b in enumerate(boxes):
+            xs, ys = self._span(b)
+            if len(xs) * len(ys) == 0 or len(xs) * len(ys) > MAX_CELLS_PER_BOX:
+                self.large.append(i)
+                continue
+            for cx in xs:
+                for cy in ys:
+                    self.cells[(cx, cy)].append(i)
+        self.by_top = sorted(range(len(boxes)), key=lambda i: boxes[i]["top"])
+        self.tops = [boxes[i]["top"] for i in self.by_top]
+
+    @staticmethod
+    def _median(values):
+        values = sorted(v for v in values if v > 0)
+        return values[len(values) // 2] if values else 1.
+
+    def _span(self, b):
+        return range(math.floor(b["x0"] / self.cw), math.floor(b["x1"] / self.cw) + 1), \
+            range(math.floor(b["top"] / self.ch), math.floor(b["bottom"] / self.ch) + 1)
+
+    @staticmethod
+    def intersects(a, b):
+        return not (b["x0"] > a["x1"] or b["x1"] < a["x0"] or b["bottom"] < a["top"] or b["top"] > a["bottom"])
+
+    def _candidates(self, box):
+        xs, ys = self._span(box)
+        if len(xs) * len(ys) == 0 or len(xs) * len(ys) > len(self.cells):
+            return range(len(self.boxes))
+        found = set(self.large)
+        for cx in xs:
+            for cy in ys:
+                found.update(self.cells.get((cx, cy), []))
+        return sorted(found)
+
+    def overlapping(self, box):
+        """Indices of the boxes sharing at least a point with `box`."""
+        return [i for i in self._candidates(box) if self.intersects(box, self.boxes[i])]
+
+    def containing(self, box):
+        """Indices of the boxes `box` lies within."""
+        return [i for i in self.overlapping(box)
+                if self.boxes[i]["x0"] <= box["x0"] and self.boxes[i]["x1"] >= box["x1"]
+                and self.boxes[i]["top"] <= box["top"] and self.boxes[i]["bottom"] >= box["bottom"]]
+
+    def contained(self, box):
+        """Indices of the boxes lying within `box`."""
+        return [i for i in self.overlapping(box)
+                if box["x0"] <= self.boxes[i]["x0"] and box["x1"] >= self.boxes[i]["x1"]
+                and box["top"] <= self.boxes[i]["top"] and box["bottom"] >= self.boxes[i]["bottom"]]
+
+    def nearest_below(self, box):
+        """Index of the box starting closest under `box` among those overlapping it horizontally."""
+        for k in range(bisect_left(self.tops, box["bottom"]), len(self.tops)):
+            b = self.boxes[self.by_top[k]]
+            if not (b["x0"] > box["x1"] or b["x1"] < box["x0"]):
+                return self.by_top[k]
+        return None
@@ -25,7 +25,9 @@ from huggingface_hub import snapshot_download
 
 from api.utils.file_utils import get_project_base_directory
 from deepdoc.vision import Recognizer
+from deepdoc.vision.box_index import BoxIndex
 from deepdoc.vision.operators import nms
+from deepdoc.vision.recognizer import RECOGNIZER_BATCH_SIZE
 
 
 class LayoutRecognizer(Recognizer):
@@ -61,7 +63,7 @@ class LayoutRecognizer(Recognizer):
             from deepdoc.vision.dla_cli import DLAClient
             self.client = DLAClient(os.environ["TENSORRT_DLA_SVR"])
 
-    def __call__(self, image_list, ocr_res, scale_factor=3, thr=0.2, batch_size=16, drop=True):
+    def __call__(self, image_list, ocr_res, scale_factor=3, thr=0.2, batch_size=RECOGNIZER_BATCH_SIZE, drop=True):
         def __is_garbage(b):
             patt = [r"^•+$", "^[0-9]{1,2} / ?[0-9]{1,2}$",
                     r"^[0-9]{1,2} of [0-9]{1,2}$", "^http://[^ ]{12,}",
@@ -97,6 +99,7 @@ class LayoutRecognizer(Recognizer):
             def findLayout(ty):
                 nonlocal bxs, lts, self
                 lts_ = [lt for lt in lts if lt["type"] == ty]
+                lts_index = BoxIndex(lts_)
                 i = 0
                 while i < len(bxs):
                     if bxs[i].get("layout_type"):
@@ -107,7 +110,7 @@ class LayoutRecognizer(Recognizer):
                         continue
 
                     ii = self.find_overlapped_with_threashold(bxs[i], lts_,
-                                                              thr=0.4)
+                                                              thr=0.4, index=lts_index)
                     if ii is None:  # belong to nothing
                         bxs[i]["layout_type"] = ""
                         i += 1
@@ -162,7 +165,7 @@ class LayoutRecognizer(Recognizer):
         ocr_res = [b for b in ocr_res if b["text"].strip() not in garbag_set]
         return ocr_res, page_layout
 
-    def forward(self, image_list, thr=0.7, batch_size=16):
+    def forward(self, image_list, thr=0.7, batch_size=RECOGNIZER_BATCH_SIZE):
         return super().__call__(image_list, thr, batch_size)
 
 
@@ -18,6 +18,7 @@ import logging
 import copy
 import time
 import os
+import threading
 
 from huggingface_hub import snapshot_download
 
@@ -34,6 +35,12 @@ from .postprocess import build_post_process
 
 loaded_models = {}
 
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", "2"))
+ONNX_INTER_OP_THREADS = int(os.environ.get("ONNX_INTER_OP_THREADS", "2"))
+OCR_REC_BATCH_SIZE = int(os.environ.get("OCR_REC_BATCH_SIZE", "16"))
+OCR_REC_SESSIONS = int(os.environ.get("OCR_REC_SESSIONS", "1"))
+OCR_REC_BATCH_WAIT_MS = int(os.environ.get("OCR_REC_BATCH_WAIT_MS", "20"))
+
 def transform(data, ops=None):
     """ transform """
     if ops is None:
@@ -67,9 +74,12 @@ def create_operators(op_param_list, global_config=None):
     return ops
 
 
-def load_model(model_dir, nm, device_id: int | None = None):
+def load_model(model_dir, nm, device_id: int | None = None, replica: int = 0):
     model_file_path = os.path.join(model_dir, nm + ".onnx")
     model_cached_tag = model_file_path + str(device_id) if device_id is not None else model_file_path
+    # Replicas are separate sessions of the same model, run concurrently.
+    if replica:
+        model_cached_tag += f"#{replica}"
 
     global loaded_models
     loaded_model = loaded_models.get(model_cached_tag)
@@ -93,8 +103,8 @@ def load_model(model_dir, nm, device_id: int | None = None):
     options = ort.SessionOptions()
     options.enable_cpu_mem_arena = False
     options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-    options.intra_op_num_threads = 2
-    options.inter_op_num_threads = 2
+    options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+    options.inter_op_num_threads = ONNX_INTER_OP_THREADS
 
     # https://github.com/microsoft/onnxruntime/issues/9509#issuecomment-951546580
     # Shrink GPU memory after execution
@@ -126,16 +136,16 @@ def load_model(model_dir, nm, device_id: int | None = None):
 
 
 class TextRecognizer:
-    def __init__(self, model_dir, device_id: int | None = None):
+    def __init__(self, model_dir, device_id: int | None = None, replica: int = 0):
         self.rec_image_shape = [int(v) for v in "3, 48, 320".split(",")]
-        self.rec_batch_num = 16
+        self.rec_batch_num = OCR_REC_BATCH_SIZE
         postprocess_params = {
             'name': 'CTCLabelDecode',
             "character_dict_path": os.path.join(model_dir, "ocr.res"),
             "use_space_char": True
         }
         self.postprocess_op = build_post_process(postprocess_params)
-        self.predictor, self.run_options = load_model(model_dir, 'rec', device_id)
+        self.predictor, self.run_options = load_model(model_dir, 'rec', device_id, replica)
         self.input_tensor = self.predictor.get_inputs()[0]
 
     def resize_norm_img(self, img, max_wh_ratio):
@@ -396,6 +406,100 @@ class TextRecognizer:
         return rec_res, time.time() - st
 
 
+class _RecognitionRequest:
+    def __init__(self, n):
+        self.results = [['', 0.0]] * n
+        self.remaining = n
+        self.error = None
+        self.done = threading.Event()
+
+
+class RecognitionBatcher:
+    """
+    Gathers the text line crops of every caller, whichever page or task they come from, and recognizes
+    them in full batches of crops with close aspect ratios. A batch is run once rec_batch_num crops are
+    pending, or OCR_REC_BATCH_WAIT_MS after the oldest one arrived; it is cut around the oldest crop so
+    none waits forever. Each recognizer, i.e. ONNX session, is driven by a thread of its own.
+    Called like a TextRecognizer; the caller blocks until all its crops are recognized.
+    """
+
+    def __init__(self, recognizers, wait=OCR_REC_BATCH_WAIT_MS / 1000.):
+        self.batch_size = recognizers[0].rec_batch_num
+        self.wait = wait
+        self.pending = []
+        self.cond = threading.Condition()
+        for rec in recognizers:
+            threading.Thread(target=self._run, args=(rec,), daemon=True).start()
+
+    def __call__(self, img_list):
+        st = time.time()
+        if not img_list:
+            return [], 0
+        req = _RecognitionRequest(len(img_list))
+        with self.cond:
+            for i, img in enumerate(img_list):
+                self.pending.append((img.shape[1] / float(img.shape[0]), time.monotonic(), img, req, i))
+            self.cond.notify_all()
+        req.done.wait()
+        if req.error:
+            raise req.error
+        return req.results, time.time() - st
+
+    def _next_batch(self):
+        with self.cond:
+            while len(self.pending) < self.batch_size:
+                if not self.pending:
+                    self.cond.wait()
+                    continue
+                remaining = self.pending[0][1] + self.wait - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            # pending is in arrival order: take the batch_size crops closest in aspect ratio to the oldest one
+            order = sorted(range(len(self.pending)), key=lambda k: self.pending[k][0])
+            pos = order.index(0)
+            start = min(max(0, pos - self.batch_size // 2), max(0, len(order) - self.batch_size))
+            chosen = set(order[start:start + self.batch_size])
+            batch = [self.pending[k] for k in sorted(chosen)]
+            self.pending = [p for k, p in enumerate(self.pending) if k not in chosen]
+            if self.pending:
+                self.cond.notify()
+            return batch
+
+    def _run(self, recognizer):
+        while True:
+            batch = self._next_batch()
+            try:
+                rec_res, _ = recognizer([img for _, _, img, _, _ in batch])
+            except Exception as e:
+                logging.exception("RecognitionBatcher")
+                rec_res = [None] * len(batch)
+                for _, _, _, req, _ in batch:
+                    req.error = e
+            with self.cond:
+                for (_, _, _, req, i), r in zip(batch, rec_res):
+                    if r is not None:
+                        req.results[i] = r
+                    req.remaining -= 1
+                    if req.remaining == 0 or req.error:
+                        req.done.set()
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_recognition_batcher(model_dir, device_id: int | None = None):
+    """The RecognitionBatcher shared by all the OCR instances of the process for a model and device."""
+    key = (model_dir, device_id)
+    with _batchers_lock:
+        if key not in _batchers:
+            _batchers[key] = RecognitionBatcher([TextRecognizer(model_dir, device_id, replica)
+                                                 for replica in range(max(1, OCR_REC_SESSIONS))])
+        return _batchers[key]
+
+
 class TextDetector:
     def __init__(self, model_dir, device_id: int | None = None):
         pre_process_list = [{
@@ -534,10 +638,10 @@ class OCR:
                     self.text_recognizer = []
                     for device_id in range(PARALLEL_DEVICES):
                         self.text_detector.append(TextDetector(model_dir, device_id))
-                        self.text_recognizer.append(TextRecognizer(model_dir, device_id))
+                        self.text_recognizer.append(get_recognition_batcher(model_dir, device_id))
                 else:
                     self.text_detector = [TextDetector(model_dir, 0)]
-                    self.text_recognizer = [TextRecognizer(model_dir, 0)]
+                    self.text_recognizer = [get_recognition_batcher(model_dir, 0)]
 
             except Exception:
                 model_dir = snapshot_download(repo_id="InfiniFlow/deepdoc",
@@ -550,10 +654,10 @@ class OCR:
                     self.text_recognizer = []
                     for device_id in range(PARALLEL_DEVICES):
                         self.text_detector.append(TextDetector(model_dir, device_id))
-                        self.text_recognizer.append(TextRecognizer(model_dir, device_id))
+                        self.text_recognizer.append(get_recognition_batcher(model_dir, device_id))
                 else:
                     self.text_detector = [TextDetector(model_dir, 0)]
-                    self.text_recognizer = [TextRecognizer(model_dir, 0)]
+                    self.text_recognizer = [get_recognition_batcher(model_dir, 0)]
 
         self.drop_score = 0.5
         self.crop_image_res_index = 0
@@ -26,8 +26,11 @@ from api.utils.file_utils import get_project_base_directory
 from .operators import *  # noqa: F403
 from .operators import preprocess
 from . import operators
+from .box_index import BoxIndex
 from .ocr import load_model
 
+RECOGNIZER_BATCH_SIZE = int(os.environ.get("RECOGNIZER_BATCH_SIZE", "16"))
+
 class Recognizer:
     def __init__(self, label_list, task_name, model_dir=None):
         """
@@ -50,6 +53,10 @@ class Recognizer:
         self.output_names = [node.name for node in self.ort_sess.get_outputs()]
         self.input_shape = self.ort_sess.get_inputs()[0].shape[2:4]
         self.label_list = label_list
+        # Images are stacked into one session run only if the batch dimension is dynamic, and not for
+        # the models taking a scale_factor input, which concatenate the boxes of the whole batch.
+        batch_dim = self.ort_sess.get_inputs()[0].shape[0]
+        self.batchable = "scale_factor" not in self.input_names and not (isinstance(batch_dim, int) and batch_dim > 0)
 
     @staticmethod
     def sort_Y_firstly(arr, threashold):
@@ -132,7 +139,7 @@ class Recognizer:
         return ov
 
     @staticmethod
-    def layouts_cleanup(boxes, layouts, far=2, thr=0.7):
+    def layouts_cleanup(boxes, layouts, far=2, thr=0.7, index=None):
         def notOverlapped(a, b):
             return any([a["x1"] < b["x0"],
                         a["x0"] > b["x1"],
@@ -161,12 +168,13 @@ class Recognizer:
                     layouts.pop(i)
                 continue
 
+            if index is None:
+                index = BoxIndex(boxes)
             area_i, area_i_1 = 0, 0
-            for b in boxes:
-                if not notOverlapped(b, layouts[i]):
-                    area_i += Recognizer.overlapped_area(b, layouts[i], False)
-                if not notOverlapped(b, layouts[j]):
-                    area_i_1 += Recognizer.overlapped_area(b, layouts[j], False)
+            for k in index.overlapping(layouts[i]):
+                area_i += Recognizer.overlapped_area(boxes[k], layouts[i], False)
+            for k in index.overlapping(layouts[j]):
+                area_i_1 += Recognizer.overlapped_area(boxes[k], layouts[j], False)
 
             if area_i > area_i_1:
                 layouts.pop(j)
@@ -215,7 +223,7 @@ class Recognizer:
         return inputs
 
     @staticmethod
-    def find_overlapped(box, boxes_sorted_by_y, naive=False):
+    def find_overlapped(box, boxes_sorted_by_y, naive=False, index=None):
         if not boxes_sorted_by_y:
             return
         bxs = boxes_sorted_by_y
@@ -240,7 +248,8 @@ class Recognizer:
             break
 
         max_overlaped_i, max_overlaped = None, 0
-        for i in range(s, e):
+        # Boxes not overlapping have no area in common: only those the index returns can win.
+        for i in ([i for i in index.overlapping(box) if s <= i < e] if index else range(s, e)):
             ov = Recognizer.overlapped_area(bxs[i], box)
             if ov <= max_overlaped:
                 continue
@@ -264,12 +273,12 @@ class Recognizer:
         return min_i
 
     @staticmethod
-    def find_overlapped_with_threashold(box, boxes, thr=0.3):
+    def find_overlapped_with_threashold(box, boxes, thr=0.3, index=None):
         if not boxes:
             return
         max_overlapped_i, max_overlapped, _max_overlapped = None, thr, 0
         s, e = 0, len(boxes)
-        for i in range(s, e):
+        for i in (index.overlapping(box) if index and thr > 0 else range(s, e)):
             ov = Recognizer.overlapped_area(box, boxes[i])
             _ov = Recognizer.overlapped_area(boxes[i], box)
             if (ov, _ov) < (max_overlapped, _max_overlapped):
@@ -406,7 +415,27 @@ class Recognizer:
             "score": float(scores[i])
         } for i in indices]
 
-    def __call__(self, image_list, thr=0.7, batch_size=16):
+    def run_batch(self, inputs, thr):
+        """
+        Runs the session once per group of same-shaped inputs, each image keeping its own
+        postprocess on its slice of the output, so the boxes are the same as with one run per image.
+        """
+        if not self.batchable:
+            return [self.postprocess(self.ort_sess.run(None, {k: v for k, v in ins.items() if k in self.input_names}, self.run_options)[0], ins, thr)
+                    for ins in inputs]
+
+        groups = {}
+        for j, ins in enumerate(inputs):
+            groups.setdefault(ins[self.input_names[0]].shape, []).append(j)
+        res = [None] * len(inputs)
+        for idx in groups.values():
+            feed = {k: np.concatenate([inputs[j][k] for j in idx]) for k in self.input_names}
+            outputs = self.ort_sess.run(None, feed, self.run_options)[0]
+            for n, j in enumerate(idx):
+                res[j] = self.postprocess(outputs[n:n + 1], inputs[j], thr)
+        return res
+
+    def __call__(self, image_list, thr=0.7, batch_size=RECOGNIZER_BATCH_SIZE):
         res = []
         imgs = []
         for i in range(len(image_list)):
@@ -422,9 +451,7 @@ class Recognizer:
             batch_image_list = imgs[start_index:end_index]
             inputs = self.preprocess(batch_image_list)
             logging.debug("preprocess")
-            for ins in inputs:
-                bb = self.postprocess(self.ort_sess.run(None, {k:v for k,v in ins.items() if k in self.input_names}, self.run_options)[0], ins, thr)
-                res.append(bb)
+            res.extend(self.run_batch(inputs, thr))
 
         #seeit.save_results(image_list, res, self.label_list, threshold=thr)
 
@@ -9,7 +9,9 @@ Reference:
 import html
 import json
 import logging
+import math
 import re
+import struct
 import time
 from collections import defaultdict
 from hashlib import md5
@@ -36,6 +38,9 @@ ErrorHandlerFn = Callable[[BaseException | None, str | None, dict | None], None]
 
 chat_limiter = trio.CapacityLimiter(int(os.environ.get('MAX_CONCURRENT_CHATS', 10)))
 
+GRAPH_BULK_SIZE = int(os.environ.get('GRAPH_BULK_SIZE', '64'))
+GRAPH_SEGMENT_NODES = int(os.environ.get('GRAPH_SEGMENT_NODES', '512'))
+
 @dataclasses.dataclass
 class GraphChange:
     removed_nodes: Set[str] = dataclasses.field(default_factory=set)
@@ -92,51 +97,111 @@ def dict_has_keys_with_types(
     return True
 
 
-def get_llm_cache(llmnm, txt, history, genconf):
+def llm_cache_key(llmnm, txt, history, genconf):
     hasher = xxhash.xxh64()
     hasher.update(str(llmnm).encode("utf-8"))
     hasher.update(str(txt).encode("utf-8"))
     hasher.update(str(history).encode("utf-8"))
     hasher.update(str(genconf).encode("utf-8"))
+    return hasher.hexdigest()
 
-    k = hasher.hexdigest()
+
+def get_llm_cache(llmnm, txt, history, genconf):
+    k = llm_cache_key(llmnm, txt, history, genconf)
     bin = REDIS_CONN.get(k)
     if not bin:
         return
     return bin
 
 
-def set_llm_cache(llmnm, txt, v, history, genconf):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
-    hasher.update(str(history).encode("utf-8"))
-    hasher.update(str(genconf).encode("utf-8"))
+def get_llm_cache_bulk(llmnm, txts, history, genconf):
+    """Cached responses of many prompts with a single MGET, None where missing."""
+    res = REDIS_CONN.mget([llm_cache_key(llmnm, txt, history, genconf) for txt in txts]) if txts else []
+    return res if res else [None] * len(txts)
 
-    k = hasher.hexdigest()
+
+def set_llm_cache(llmnm, txt, v, history, genconf):
+    k = llm_cache_key(llmnm, txt, history, genconf)
     REDIS_CONN.set(k, v.encode("utf-8"), 24*3600)
 
 
-def get_embed_cache(llmnm, txt):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
+def set_llm_cache_bulk(llmnm, txts, vs, history, genconf):
+    REDIS_CONN.mset({llm_cache_key(llmnm, txt, history, genconf): v.encode("utf-8") for txt, v in zip(txts, vs) if v}, 24*3600)
 
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
+
+EMBED_CACHE_DTYPE = os.environ.get("EMBED_CACHE_DTYPE", "float32")
+EMBED_CACHE_BATCH_SIZE = 64
+VECTOR_MAGIC = b"EV"
+VECTOR_HEADER = struct.Struct("<2sBBI")
+VECTOR_DTYPES = [np.float32, np.float16]
+
+
+def encode_vector(arr, dtype=EMBED_CACHE_DTYPE) -> bytes:
+    """Header (magic, version, dtype, dimension) followed by the raw little endian float32/float16 values."""
+    code = VECTOR_DTYPES.index(np.dtype(dtype).type)
+    arr = np.asarray(arr, dtype=np.dtype(dtype).newbyteorder("<")).ravel()
+    return VECTOR_HEADER.pack(VECTOR_MAGIC, 1, code, len(arr)) + arr.tobytes()
+
+
+def decode_vector(bin):
     if not bin:
         return
-    return np.array(json.loads(bin))
+    if bin[:2] != VECTOR_MAGIC:
+        # written as a JSON list before the binary format
+        return np.array(json.loads(bin))
+    _, _, code, dim = VECTOR_HEADER.unpack_from(bin)
+    arr = np.frombuffer(bin, dtype=np.dtype(VECTOR_DTYPES[code]).newbyteorder("<"), count=dim, offset=VECTOR_HEADER.size)
+    return arr.astype(np.float32)
 
 
-def set_embed_cache(llmnm, txt, arr):
+def embed_cache_key(llmnm, txt):
     hasher = xxhash.xxh64()
     hasher.update(str(llmnm).encode("utf-8"))
     hasher.update(str(txt).encode("utf-8"))
+    return hasher.hexdigest()
 
-    k = hasher.hexdigest()
-    arr = json.dumps(arr.tolist() if isinstance(arr, np.ndarray) else arr)
-    REDIS_CONN.set(k, arr.encode("utf-8"), 24*3600)
+
+def get_embed_cache(llmnm, txt):
+    return decode_vector(REDIS_CONN.get_bytes(embed_cache_key(llmnm, txt)))
+
+
+def get_embed_cache_bulk(llmnm, txts):
+    """Cached vectors of many texts with a single MGET, None where missing."""
+    res = REDIS_CONN.mget_bytes([embed_cache_key(llmnm, txt) for txt in txts])
+    if not res:
+        return [None] * len(txts)
+    return [decode_vector(bin) for bin in res]
+
+
+def set_embed_cache(llmnm, txt, arr):
+    REDIS_CONN.set(embed_cache_key(llmnm, txt), encode_vector(arr), 24*3600)
+
+
+def set_embed_cache_bulk(llmnm, txts, arrs):
+    REDIS_CONN.mset({embed_cache_key(llmnm, txt): encode_vector(arr) for txt, arr in zip(txts, arrs)}, 24*3600)
+
+
+async def encode_with_cache(embd_mdl, keys, txts=None):
+    """
+    Vectors of `txts`, cached under `keys` (the texts themselves by default).
+    Cached vectors are fetched with one MGET, the missing ones encoded in batches and stored with one pipeline per batch.
+    """
+    txts = keys if txts is None else txts
+    vectors = get_embed_cache_bulk(embd_mdl.llm_name, keys)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+
+    async def encode_batch(batch):
+        ebds, _ = await trio.to_thread.run_sync(lambda: embd_mdl.encode([txts[i] for i in batch]))
+        if len(ebds) != len(batch):
+            raise Exception("Embedding error: ")
+        for i, ebd in zip(batch, ebds):
+            vectors[i] = ebd
+        set_embed_cache_bulk(embd_mdl.llm_name, [keys[i] for i in batch], ebds)
+
+    async with trio.open_nursery() as nursery:
+        for b in range(0, len(missing), EMBED_CACHE_BATCH_SIZE):
+            nursery.start_soon(encode_batch, missing[b:b + EMBED_CACHE_BATCH_SIZE])
+    return vectors
 
 
 def get_tags_from_cache(kb_ids):
@@ -157,9 +222,10 @@ def set_tags_to_cache(kb_ids, tags):
     k = hasher.hexdigest()
     REDIS_CONN.set(k, json.dumps(tags).encode("utf-8"), 600)
 
-def tidy_graph(graph: nx.Graph, callback):
+def tidy_graph(graph: nx.Graph, callback, change: GraphChange | None = None):
     """
     Ensure all nodes and edges in the graph have some essential attribute.
+    The purged nodes and edges, and the edges given default attributes, are recorded in `change` if given.
     """
     def is_valid_node(node_attrs: dict) -> bool:
         valid_node = True
@@ -173,6 +239,9 @@ def tidy_graph(graph: nx.Graph, callback):
         if not is_valid_node(node_attrs):
             purged_nodes.append(node)
     for node in purged_nodes:
+        if change is not None:
+            change.removed_nodes.add(node)
+            change.removed_edges.update(get_from_to(node, neighbor) for neighbor in graph.neighbors(node))
         graph.remove_node(node)
     if purged_nodes and callback:
         callback(msg=f"Purged {len(purged_nodes)} nodes from graph due to missing essential attributes.")
@@ -181,10 +250,14 @@ def tidy_graph(graph: nx.Graph, callback):
     for source, target, attr in graph.edges(data=True):
         if not is_valid_node(attr):
             purged_edges.append((source, target))
-        if "keywords" not in attr:
+        elif "keywords" not in attr:
             attr["keywords"] = []
+            if change is not None:
+                change.added_updated_edges.add(get_from_to(source, target))
     for source, target in purged_edges:
         graph.remove_edge(source, target)
+        if change is not None:
+            change.removed_edges.add(get_from_to(source, target))
     if purged_edges and callback:
         callback(msg=f"Purged {len(purged_edges)} edges from graph due to missing essential attributes.")
 
@@ -299,7 +372,7 @@ def chunk_id(chunk):
     return xxhash.xxh64((chunk["content_with_weight"] + chunk["kb_id"]).encode("utf-8")).hexdigest()
 
 
-async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
+async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks, ebd=None):
     chunk = {
         "id": get_uuid(),
         "important_kwd": [ent_name],
@@ -314,7 +387,8 @@ async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
         "available_int": 0
     }
     chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(chunk["content_ltks"])
-    ebd = get_embed_cache(embd_mdl.llm_name, ent_name)
+    if ebd is None:
+        ebd = get_embed_cache(embd_mdl.llm_name, ent_name)
     if ebd is None:
         ebd, _ = await trio.to_thread.run_sync(lambda: embd_mdl.encode([ent_name]))
         ebd = ebd[0]
@@ -351,7 +425,7 @@ def get_relation(tenant_id, kb_id, from_ent_name, to_ent_name, size=1):
     return res
 
 
-async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta, chunks):
+async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta, chunks, ebd=None):
     chunk = {
         "id": get_uuid(),
         "from_entity_kwd": from_ent_name,
@@ -367,7 +441,8 @@ async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta,
     }
     chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(chunk["content_ltks"])
     txt = f"{from_ent_name}->{to_ent_name}"
-    ebd = get_embed_cache(embd_mdl.llm_name, txt)
+    if ebd is None:
+        ebd = get_embed_cache(embd_mdl.llm_name, txt)
     if ebd is None:
         ebd, _ = await trio.to_thread.run_sync(lambda: embd_mdl.encode([txt+f": {meta['description']}"]))
         ebd = ebd[0]
@@ -417,7 +492,8 @@ async def get_graph(tenant_id, kb_id, exclude_rebuild=None):
         for id in res.ids:
             try:
                 if res.field[id]["removed_kwd"] == "N":
-                    g = json_graph.node_link_graph(json.loads(res.field[id]["content_with_weight"]), edges="edges")
+                    data = await trio.to_thread.run_sync(lambda: load_graph_snapshot(tenant_id, kb_id, res.field[id]["content_with_weight"]))
+                    g = json_graph.node_link_graph(data, edges="edges")
                     if "source_id" not in g.graph:
                         g.graph["source_id"] = res.field[id]["source_id"]
                 else:
@@ -429,36 +505,178 @@ async def get_graph(tenant_id, kb_id, exclude_rebuild=None):
     return result
 
 
+def graph_segment_number(graph: nx.Graph):
+    """Segments of about GRAPH_SEGMENT_NODES nodes, rounded to a power of two so it only changes when the graph doubles or halves."""
+    n = max(1, math.ceil(len(graph) / max(1, GRAPH_SEGMENT_NODES)))
+    return 1 << (n - 1).bit_length()
+
+
+def graph_segment_of(node, segments):
+    return xxhash.xxh64(str(node).encode("utf-8")).intdigest() % segments
+
+
+def graph_chunk_id(kb_id, name):
+    return xxhash.xxh64(f"{kb_id}_graph_{name}".encode("utf-8")).hexdigest()
+
+
+def graph_snapshot_chunks(kb_id, graph: nx.Graph, segments, dirty=None):
+    """
+    The chunks of the snapshot of `graph`: a "graph" head holding the graph attributes, the "graph_segment"
+    chunks holding the nodes and edges hashed to them (an edge goes with its lesser end) and one holding
+    the pageranks, which change with every merge. Ids are fixed, so writing a chunk replaces its old version.
+    With `dirty`, only the segments of those numbers are produced besides the head and the pageranks.
+    """
+    nodes, edges, pagerank = defaultdict(list), defaultdict(list), {}
+    for n, attrs in graph.nodes(data=True):
+        if "pagerank" in attrs:
+            pagerank[n] = attrs["pagerank"]
+        k = graph_segment_of(n, segments)
+        if dirty is None or k in dirty:
+            nodes[k].append({**{a: v for a, v in attrs.items() if a != "pagerank"}, "id": n})
+    for u, v, attrs in graph.edges(data=True):
+        k = graph_segment_of(get_from_to(u, v)[0], segments)
+        if dirty is None or k in dirty:
+            edges[k].append({**attrs, "source": u, "target": v})
+
+    def snapshot_chunk(name, content, knowledge_graph_kwd="graph_segment", **kwargs):
+        return {
+            "id": graph_chunk_id(kb_id, name),
+            "content_with_weight": json.dumps(content, ensure_ascii=False),
+            "knowledge_graph_kwd": knowledge_graph_kwd,
+            "kb_id": kb_id,
+            "available_int": 0,
+            "removed_kwd": "N",
+            **kwargs
+        }
+
+    head = {"directed": graph.is_directed(), "multigraph": graph.is_multigraph(), "graph": graph.graph, "segments": segments}
+    chunks = [snapshot_chunk("head", head, "graph", source_id=graph.graph.get("source_id", []))]
+    for k in (range(segments) if dirty is None else sorted(dirty)):
+        chunks.append(snapshot_chunk(k, {"nodes": nodes[k], "edges": edges[k]}))
+    chunks.append(snapshot_chunk("pagerank", {"pagerank": pagerank}))
+    return chunks
+
+
+def load_graph_snapshot(tenant_id, kb_id, content):
+    """The node_link_data of the graph whose "graph" chunk has `content`, reading its segments in if it is segmented."""
+    data = json.loads(content)
+    if "segments" not in data:
+        return data
+    data["nodes"], data["edges"], pagerank = [], [], {}
+    flds = ["content_with_weight"]
+    bs = 256
+    for i in range(0, 1024*bs, bs):
+        es_res = settings.docStoreConn.search(flds, [],
+                                              {"kb_id": kb_id, "knowledge_graph_kwd": ["graph_segment"]},
+                                              [],
+                                              OrderByExpr(),
+                                              i, bs, search.index_name(tenant_id), [kb_id]
+                                              )
+        es_res = settings.docStoreConn.getFields(es_res, flds)
+        if len(es_res) == 0:
+            break
+        for d in es_res.values():
+            seg = json.loads(d["content_with_weight"])
+            data["nodes"].extend(seg.get("nodes", []))
+            data["edges"].extend(seg.get("edges", []))
+            pagerank.update(seg.get("pagerank", {}))
+
+    names = set()
+    for n in data["nodes"]:
+        names.add(n["id"])
+        if n["id"] in pagerank:
+            n["pagerank"] = pagerank[n["id"]]
+    # An edge whose segment outlived the removal of one of its ends would bring the node back bare.
+    data["edges"] = [e for e in data["edges"] if e["source"] in names and e["target"] in names]
+    del data["segments"]
+    return data
+
+
+def get_graph_snapshot_segments(tenant_id, kb_id):
+    """Segment number of the stored graph snapshot, None unless it is a live segmented one that can be updated in place."""
+    flds = ["content_with_weight", "removed_kwd"]
+    res = settings.docStoreConn.search(flds, [], {"kb_id": kb_id, "knowledge_graph_kwd": ["graph"]}, [], OrderByExpr(), 0, 2,
+                                       search.index_name(tenant_id), [kb_id])
+    res = settings.docStoreConn.getFields(res, flds)
+    if list(res.keys()) != [graph_chunk_id(kb_id, "head")]:
+        return None
+    d = list(res.values())[0]
+    if d.get("removed_kwd") != "N":
+        return None
+    try:
+        return json.loads(d["content_with_weight"]).get("segments")
+    except Exception:
+        return None
+
+
+def get_entity_sources(tenant_id, kb_id, ent_names):
+    flds = ["source_id"]
+    res = settings.docStoreConn.search(flds, [], {"kb_id": kb_id, "knowledge_graph_kwd": ["entity"], "entity_kwd": sorted(ent_names)},
+                                       [], OrderByExpr(), 0, len(ent_names), search.index_name(tenant_id), [kb_id])
+    sources = set()
+    for d in settings.docStoreConn.getFields(res, flds).values():
+        sources.update(d.get("source_id") or [])
+    return sources
+
+
 async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, change: GraphChange, callback):
     start = trio.current_time()
 
-    await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["graph", "subgraph"]}, search.index_name(tenant_id), kb_id))
+    # The stored snapshot is `graph` before `change` unless it's missing, marked removed or segmented otherwise:
+    # then everything is written again.
+    segments = graph_segment_number(graph)
+    incremental = await trio.to_thread.run_sync(lambda: get_graph_snapshot_segments(tenant_id, kb_id)) == segments
+    sources = graph.graph.get("source_id", [])
+    if incremental:
+        ends = {n for e in change.added_updated_edges | change.removed_edges for n in e}
+        dirty = {graph_segment_of(n, segments) for n in change.added_updated_nodes | change.removed_nodes | ends}
+        dirty |= {graph_segment_of(get_from_to(*e)[0], segments) for e in change.added_updated_edges | change.removed_edges}
+        touched = set()
+        for n in change.added_updated_nodes | ends:
+            if graph.has_node(n):
+                touched.update(graph.nodes[n].get("source_id", []))
+        if change.removed_nodes:
+            try:
+                touched |= await trio.to_thread.run_sync(lambda: get_entity_sources(tenant_id, kb_id, change.removed_nodes))
+            except Exception:
+                logging.exception("set_graph can't tell the sources of the removed nodes, rewriting all subgraphs")
+                touched = set(sources)
+        touched &= set(sources)
+        if touched:
+            await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["subgraph"], "source_id": sorted(touched)}, search.index_name(tenant_id), kb_id))
+    else:
+        dirty = None
+        touched = set(sources)
+        await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["graph", "graph_segment", "subgraph"]}, search.index_name(tenant_id), kb_id))
 
     if change.removed_nodes:
         await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["entity"], "entity_kwd": sorted(change.removed_nodes)}, search.index_name(tenant_id), kb_id))
 
     if change.removed_edges:
+        # One delete per source entity, for all the removed edges it starts.
+        to_nodes = defaultdict(set)
+        for from_node, to_node in change.removed_edges:
+            to_nodes[from_node].add(to_node)
         async with trio.open_nursery() as nursery:
-            for from_node, to_node in change.removed_edges:
-                 nursery.start_soon(lambda from_node=from_node, to_node=to_node: trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["relation"], "from_entity_kwd": from_node, "to_entity_kwd": to_node}, search.index_name(tenant_id), kb_id)))
+            for from_node, to_node in to_nodes.items():
+                nursery.start_soon(lambda from_node=from_node, to_node=sorted(to_node): trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"knowledge_graph_kwd": ["relation"], "from_entity_kwd": from_node, "to_entity_kwd": to_node}, search.index_name(tenant_id), kb_id)))
     now = trio.current_time()
     if callback:
         callback(msg=f"set_graph removed {len(change.removed_nodes)} nodes and {len(change.removed_edges)} edges from index in {now - start:.2f}s.")
     start = now
 
-    chunks = [{
-        "id": get_uuid(),
-        "content_with_weight": json.dumps(nx.node_link_data(graph, edges="edges"), ensure_ascii=False),
-        "knowledge_graph_kwd": "graph",
-        "kb_id": kb_id,
-        "source_id": graph.graph.get("source_id", []),
-        "available_int": 0,
-        "removed_kwd": "N"
-    }]
-    
-    # generate updated subgraphs
-    for source in graph.graph["source_id"]:
-        subgraph = graph.subgraph([n for n in graph.nodes if source in graph.nodes[n]["source_id"]]).copy()
+    chunks = graph_snapshot_chunks(kb_id, graph, segments, dirty)
+
+    # generate updated subgraphs of the sources the change touches
+    members = defaultdict(dict)
+    for n, attrs in graph.nodes(data=True):
+        for source in attrs.get("source_id", []):
+            if source in touched:
+                members[source][n] = None
+    for source in sources:
+        if source not in touched:
+            continue
+        subgraph = graph.subgraph(list(members[source])).copy()
         subgraph.graph["source_id"] = [source]
         for n in subgraph.nodes:
             subgraph.nodes[n]["source_id"] = [source]
@@ -472,24 +690,26 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
             "removed_kwd": "N"
         })
     
+    nodes = list(change.added_updated_nodes)
+    # added_updated_edges could record a non-existing edge if both from_node and to_node participate in nodes merging.
+    edges = [(from_node, to_node, graph.get_edge_data(from_node, to_node)) for from_node, to_node in change.added_updated_edges]
+    edges = [(from_node, to_node, edge_attrs) for from_node, to_node, edge_attrs in edges if edge_attrs]
+    node_ebds = await encode_with_cache(embd_mdl, nodes)
+    edge_ebds = await encode_with_cache(embd_mdl, [f"{from_node}->{to_node}" for from_node, to_node, _ in edges],
+                                        [f"{from_node}->{to_node}: {edge_attrs['description']}" for from_node, to_node, edge_attrs in edges])
     async with trio.open_nursery() as nursery:
-        for node in change.added_updated_nodes:
+        for node, ebd in zip(nodes, node_ebds):
             node_attrs = graph.nodes[node]
-            nursery.start_soon(graph_node_to_chunk, kb_id, embd_mdl, node, node_attrs, chunks)
-        for from_node, to_node in change.added_updated_edges:
-            edge_attrs = graph.get_edge_data(from_node, to_node)
-            if not edge_attrs:
-                # added_updated_edges could record a non-existing edge if both from_node and to_node participate in nodes merging.
-                continue
-            nursery.start_soon(graph_edge_to_chunk, kb_id, embd_mdl, from_node, to_node, edge_attrs, chunks)
+            nursery.start_soon(graph_node_to_chunk, kb_id, embd_mdl, node, node_attrs, chunks, ebd)
+        for (from_node, to_node, edge_attrs), ebd in zip(edges, edge_ebds):
+            nursery.start_soon(graph_edge_to_chunk, kb_id, embd_mdl, from_node, to_node, edge_attrs, chunks, ebd)
     now = trio.current_time()
     if callback:
         callback(msg=f"set_graph converted graph change to {len(chunks)} chunks in {now - start:.2f}s.")
     start = now
 
-    es_bulk_size = 4
-    for b in range(0, len(chunks), es_bulk_size):
-        doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + es_bulk_size], search.index_name(tenant_id), kb_id))
+    for b in range(0, len(chunks), GRAPH_BULK_SIZE):
+        doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + GRAPH_BULK_SIZE], search.index_name(tenant_id), kb_id))
         if doc_store_result:
             error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
             raise Exception(error_message)
@@ -14,9 +14,7 @@
 #  limitations under the License.
 #
 
-import copy
 import re
-from io import BytesIO
 from xpinyin import Pinyin
 import numpy as np
 import pandas as pd
@@ -32,39 +30,29 @@ from deepdoc.parser import ExcelParser
 class Excel(ExcelParser):
     def __call__(self, fnm, binary=None, from_page=0,
                  to_page=10000000000, callback=None):
-        if not binary:
-            wb = Excel._load_excel_to_workbook(fnm)
-        else:
-            wb = Excel._load_excel_to_workbook(BytesIO(binary))
-        total = 0
-        for sheetname in wb.sheetnames:
-            total += len(list(wb[sheetname].rows))
-
         res, fails, done = [], [], 0
         rn = 0
-        for sheetname in wb.sheetnames:
-            ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows:
+        for sheetname, rows in Excel._iter_sheets(binary if binary else fnm):
+            # Rows are streamed, so a task stops reading once past its window.
+            if rn >= to_page:
+                break
+            header = next(rows, None)
+            if header is None:
                 continue
-            headers = [cell.value for cell in rows[0]]
-            missed = set([i for i, h in enumerate(headers) if h is None])
-            headers = [
-                cell.value for i,
-                cell in enumerate(
-                    rows[0]) if i not in missed]
+            missed = set([i for i, h in enumerate(header) if h is None])
+            headers = [h for i, h in enumerate(header) if i not in missed]
             if not headers:
                 continue
             data = []
-            for i, r in enumerate(rows[1:]):
+            for i, r in enumerate(rows):
                 rn += 1
                 if rn - 1 < from_page:
                     continue
                 if rn - 1 >= to_page:
                     break
                 row = [
-                    cell.value for ii,
-                    cell in enumerate(r) if ii not in missed]
+                    v for ii,
+                    v in enumerate(Excel._fit(r, len(header))[:len(header)]) if ii not in missed]
                 if len(row) != len(headers):
                     fails.append(str(i))
                     continue
@@ -99,28 +87,35 @@ def column_data_type(arr):
     counts = {"int": 0, "float": 0, "text": 0, "datetime": 0, "bool": 0}
     trans = {t: f for f, t in
              [(int, "int"), (float, "float"), (trans_datatime, "datetime"), (trans_bool, "bool"), (str, "text")]}
-    for a in arr:
-        if a is None:
-            continue
-        if re.match(r"[+-]?[0-9]{,19}(\.0+)?$", str(a).replace("%%", "")):
-            counts["int"] += 1
-        elif re.match(r"[+-]?[0-9.]{,19}$", str(a).replace("%%", "")):
-            counts["float"] += 1
-        elif re.match(r"(true|yes|是|\*|✓|✔|☑|✅|√|false|no|否|⍻|×)$", str(a), flags=re.IGNORECASE):
-            counts["bool"] += 1
-        elif trans_datatime(str(a)):
-            counts["datetime"] += 1
-        else:
-            counts["text"] += 1
+    # Cells are typed and converted once per distinct value rather than once per cell.
+    idx = [i for i, a in enumerate(arr) if a is not None]
+    strs = [str(arr[i]) for i in idx]
+    uniq = pd.Series(strs, dtype=object).value_counts(sort=False)
+    vals = pd.Series(uniq.index, dtype=object)
+    n = uniq.values
+    plain = vals.str.replace("%%", "", regex=False)
+    is_int = plain.str.match(r"[+-]?[0-9]{,19}(\.0+)?$").values.astype(bool)
+    is_float = ~is_int & plain.str.match(r"[+-]?[0-9.]{,19}$").values.astype(bool)
+    is_bool = ~is_int & ~is_float & vals.str.match(r"(true|yes|是|\*|✓|✔|☑|✅|√|false|no|否|⍻|×)$",
+                                                   flags=re.IGNORECASE).values.astype(bool)
+    rest = ~(is_int | is_float | is_bool)
+    is_dt = np.zeros(len(vals), dtype=bool)
+    is_dt[rest] = [bool(trans_datatime(v)) for v in vals[rest]]
+    counts["int"] = int(n[is_int].sum())
+    counts["float"] = int(n[is_float].sum())
+    counts["bool"] = int(n[is_bool].sum())
+    counts["datetime"] = int(n[is_dt].sum())
+    counts["text"] = int(n[rest & ~is_dt].sum())
     counts = sorted(counts.items(), key=lambda x: x[1] * -1)
     ty = counts[0][0]
-    for i in range(len(arr)):
-        if arr[i] is None:
-            continue
+    conv = {}
+    for v in vals:
         try:
-            arr[i] = trans[ty](str(arr[i]))
+            conv[v] = trans[ty](v)
         except Exception:
-            arr[i] = None
+            conv[v] = None
+    for i, v in zip(idx, strs):
+        arr[i] = conv[v]
     # if ty == "text":
     #    if len(arr) > 128 and uni / len(arr) < 0.1:
     #        ty = "keyword"
@@ -196,7 +191,6 @@ def chunk(filename, binary=None, from_page=0, to_page=10000000000,
         if len(clmns) != len(set(clmns)):
             duplicates = [col for col in clmns if list(clmns).count(col) > 1]
             raise ValueError(f"Duplicate column names detected: {set(duplicates)}")
-        txts = list(copy.deepcopy(clmns))
         py_clmns = [
             PY.get_pinyins(
                 re.sub(
@@ -209,31 +203,41 @@ def chunk(filename, binary=None, from_page=0, to_page=10000000000,
             cln, ty = column_data_type(df[clmns[j]])
             clmn_tys.append(ty)
             df[clmns[j]] = cln
-            if ty == "text":
-                txts.extend([str(c) for c in cln if c])
         clmns_map = [(py_clmns[i].lower() + fieds_map[clmn_tys[i]], str(clmns[i]).replace("_", " "))
                      for i in range(len(clmns))]
 
-        eng = lang.lower() == "english"  # is_english(txts)
-        for ii, row in df.iterrows():
+        eng = lang.lower() == "english"
+        title_tks = rag_tokenizer.tokenize(re.sub(r"\.[a-zA-Z]+$", "", filename))
+        # Fields are gathered column by column from the same values df.iterrows() would give,
+        # tokenizing each distinct text once.
+        values = df.values
+        row_flds = [[] for _ in range(len(values))]
+        row_txts = [[] for _ in range(len(values))]
+        tks = {}
+        for j in range(len(clmns)):
+            col = values[:, j]
+            keep = ~pd.isna(col)
+            if col.dtype == object:
+                keep &= np.array([not isinstance(v, str) or v != "" for v in col], dtype=bool)
+            fld = clmns_map[j][0]
+            for i in np.flatnonzero(keep):
+                v = col[i]
+                if clmn_tys[j] == "text":
+                    if v not in tks:
+                        tks[v] = rag_tokenizer.tokenize(v)
+                    row_flds[i].append((fld, tks[v]))
+                else:
+                    row_flds[i].append((fld, v))
+                row_txts[i].append("{}:{}".format(clmns[j], v))
+
+        for flds, row_txt in zip(row_flds, row_txts):
+            if not row_txt:
+                continue
             d = {
                 "docnm_kwd": filename,
-                "title_tks": rag_tokenizer.tokenize(re.sub(r"\.[a-zA-Z]+$", "", filename))
+                "title_tks": title_tks
             }
-            row_txt = []
-            for j in range(len(clmns)):
-                if row[clmns[j]] is None:
-                    continue
-                if not str(row[clmns[j]]):
-                    continue
-                if not isinstance(row[clmns[j]], pd.Series) and pd.isna(row[clmns[j]]):
-                    continue
-                fld = clmns_map[j][0]
-                d[fld] = row[clmns[j]] if clmn_tys[j] != "text" else rag_tokenizer.tokenize(
-                    row[clmns[j]])
-                row_txt.append("{}:{}".format(clmns[j], row[clmns[j]]))
-            if not row_txt:
-                continue
+            d.update(flds)
             tokenize(d, "; ".join(row_txt), eng)
             res.append(d)
 
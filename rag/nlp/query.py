@@ -17,7 +17,8 @@
 import logging
 import json
 import re
-from collections import defaultdict
+
+import numpy as np
 
 from rag.utils.doc_store_conn import MatchTextExpr
 from rag.nlp import rag_tokenizer, term_weight, synonym
@@ -205,28 +206,49 @@ class FulltextQueryer:
         return None, keywords
 
     def hybrid_similarity(self, avec, bvecs, atks, btkss, tkweight=0.3, vtweight=0.7):
-        from sklearn.metrics.pairwise import cosine_similarity as CosineSimilarity
-        import numpy as np
-
-        sims = CosineSimilarity([avec], bvecs)
+        sims = self.vector_similarity(avec, bvecs)
         tksim = self.token_similarity(atks, btkss)
-        if np.sum(sims[0]) == 0:
-            return np.array(tksim), tksim, sims[0]
-        return np.array(sims[0]) * vtweight + np.array(tksim) * tkweight, tksim, sims[0]
+        if np.sum(sims) == 0:
+            return np.array(tksim), tksim, sims
+        return sims * vtweight + tksim * tkweight, tksim, sims
+
+    @staticmethod
+    def vector_similarity(avec, bvecs):
+        """Cosine similarity between avec and every row of bvecs, 0 for zero vectors."""
+        avec = np.asarray(avec, dtype=np.float64)
+        bvecs = np.asarray(bvecs, dtype=np.float64).reshape(-1, avec.shape[0])
+        anorm = np.linalg.norm(avec)
+        bnorms = np.linalg.norm(bvecs, axis=1)
+        bnorms[bnorms == 0] = 1.0
+        return (bvecs @ avec) / bnorms / (anorm if anorm else 1.0)
 
     def token_similarity(self, atks, btkss):
-        def toDict(tks):
+        """
+        Share of the query term weight found in each candidate, as in `similarity`.
+        Query terms are weighted once and mapped to columns, then every candidate is a sparse
+        row of the query terms it contains: the scores are one sparse dot product.
+        """
+        if isinstance(atks, str):
+            atks = atks.split()
+        vocab, qw = {}, []
+        for t, w in self.tw.weights(atks, preprocess=False):
+            if t not in vocab:
+                vocab[t] = len(qw)
+                qw.append(0.)
+            qw[vocab[t]] += w
+        qw = np.array(qw, dtype=np.float64)
+
+        rows, cols = [], []
+        for i, tks in enumerate(btkss):
             if isinstance(tks, str):
                 tks = tks.split()
-            d = defaultdict(int)
-            wts = self.tw.weights(tks, preprocess=False)
-            for i, (t, c) in enumerate(wts):
-                d[t] += c
-            return d
-
-        atks = toDict(atks)
-        btkss = [toDict(tks) for tks in btkss]
-        return [self.similarity(atks, btks) for btks in btkss]
+            for j in {vocab[t] for t in tks if t in vocab}:
+                rows.append(i)
+                cols.append(j)
+        rows = np.array(rows, dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+        s = np.bincount(rows, weights=qw[cols], minlength=len(btkss))
+        return (s + 1e-9) / (np.sum(qw) + 1e-9)
 
     def similarity(self, qtwt, dtwt):
         if isinstance(dtwt, type("")):
@@ -17,11 +17,15 @@
 import logging
 import copy
 import datrie
+import functools
 import math
 import os
 import re
 import string
 import sys
+import threading
+from cachetools import LRUCache, cached
+from cachetools.keys import hashkey
 from hanziconv import HanziConv
 from nltk import word_tokenize
 from nltk.stem import PorterStemmer, WordNetLemmatizer
@@ -197,6 +201,90 @@ class RagTokenizer:
         _memo[state_key] = result
         return result
 
+    def _candidates(self, chars, s, after_singles):
+        """Tokens `dfs_` may take at `s`, shortest first, as (end, (token, (freq, tag)))."""
+        N = len(chars)
+        if s < N - 4 and chars[s + 1:s + 5] == chars[s] * 4:
+            end = s
+            while end < N and chars[end] == chars[s]:
+                end += 1
+            mid = s + min(10, end - s)
+            t = chars[s:mid]
+            k = self.key_(t)
+            return [(mid, (t, self.trie_[k] if k in self.trie_ else (-12, '')))]
+
+        S = s + 1
+        if s + 2 <= N:
+            if self.trie_.has_keys_with_prefix(self.key_(chars[s])) and \
+                    not self.trie_.has_keys_with_prefix(self.key_(chars[s:s + 2])):
+                S = s + 2
+        if after_singles and self.trie_.has_keys_with_prefix(self.key_(chars[s - 1:s + 1])):
+            S = s + 2
+
+        res = []
+        for e in range(S, N + 1):
+            t = chars[s:e]
+            k = self.key_(t)
+            if e > s + 1 and not self.trie_.has_keys_with_prefix(k):
+                break
+            if k in self.trie_:
+                res.append((e, (t, self.trie_[k])))
+        if res:
+            return res
+        t = chars[s]
+        k = self.key_(t)
+        return [(s + 1, (t, self.trie_[k] if k in self.trie_ else (-12, '')))]
+
+    def dp_(self, chars, topn=2):
+        """
+        Best `topn` segmentations of `chars`, as `sortTks_(tkslist)[:topn]` after `dfs_` would return them.
+        `score_` is B / n + L / n + F, so once the token count n and the count of multi-char tokens L are
+        fixed the ranking only depends on the frequency sum F. Partial segmentations are therefore merged
+        per (position, n, L, trailing single chars) keeping the `topn` best by F, ties broken by the order
+        `dfs_` enumerates them in (shorter tokens first). `dfs_` stops at 11 tokens and lumps the remainder
+        into one token, dropping the segmentations ending right at the 11th token; that is kept as is.
+        """
+        MAX_DEPTH = 10
+        N = len(chars)
+        layers = [{} for _ in range(N + 1)]
+        layers[0][(0, 0, 0)] = [(0, (), ())]
+        cands = {}
+        finals = []
+
+        def push(e, state, item):
+            best = layers[e].setdefault(state, [])
+            best.append(item)
+            if len(best) > topn:
+                best.sort(key=lambda x: (-x[0], x[1]))
+                best.pop()
+
+        for s in range(N + 1):
+            for (n, L, singles), items in layers[s].items():
+                if n > MAX_DEPTH:
+                    if s < N:
+                        tk = (chars[s:], (-12, ''))
+                        finals.extend(((ends + (N,), tfts + (tk,)) for _, ends, tfts in items))
+                    continue
+                if s >= N:
+                    finals.extend(((ends, tfts) for _, ends, tfts in items))
+                    continue
+                after_singles = singles >= 3
+                if (s, after_singles) not in cands:
+                    cands[(s, after_singles)] = self._candidates(chars, s, after_singles)
+                for e, tk in cands[(s, after_singles)]:
+                    single = len(tk[0]) == 1
+                    state = (n + 1, L + (0 if len(tk[0]) < 2 else 1), min(3, singles + 1) if single else 0)
+                    for F, ends, tfts in items:
+                        push(e, state, (F + tk[1][0], ends + (e,), tfts + (tk,)))
+            layers[s] = None
+
+        res = []
+        for ends, tfts in finals:
+            tks, sc = self.score_(tfts)
+            res.append((sc, ends, tks))
+        res.sort(key=lambda x: (-x[0], x[1]))
+        return [(tks, sc) for sc, _, tks in res[:topn]]
+
     def freq(self, tk):
         k = self.key_(tk)
         if k not in self.trie_:
@@ -367,9 +455,7 @@ class RagTokenizer:
                     j += 1
                     continue
                 # backward tokens from_i to i are different from forward tokens from _j to j.
-                tkslist = []
-                self.dfs_("".join(tks[_j:j]), 0, [], tkslist)
-                res.append(" ".join(self.sortTks_(tkslist)[0][0]))
+                res.append(" ".join(self.dp_("".join(tks[_j:j]), 1)[0][0]))
 
                 same = 1
                 while i + same < len(tks1) and j + same < len(tks) and tks1[i + same] == tks[j + same]:
@@ -383,9 +469,7 @@ class RagTokenizer:
             if _i < len(tks1):
                 assert _j < len(tks)
                 assert "".join(tks1[_i:]) == "".join(tks[_j:])
-                tkslist = []
-                self.dfs_("".join(tks[_j:]), 0, [], tkslist)
-                res.append(" ".join(self.sortTks_(tkslist)[0][0]))
+                res.append(" ".join(self.dp_("".join(tks[_j:]), 1)[0][0]))
 
         res = " ".join(res)
         logging.debug("[TKS] {}".format(self.merge_(res)))
@@ -405,15 +489,14 @@ class RagTokenizer:
             if len(tk) < 3 or re.match(r"[0-9,\.-]+$", tk):
                 res.append(tk)
                 continue
-            tkslist = []
             if len(tk) > 10:
-                tkslist.append(tk)
-            else:
-                self.dfs_(tk, 0, [], tkslist)
+                res.append(tk)
+                continue
+            tkslist = self.dp_(tk, 2)
             if len(tkslist) < 2:
                 res.append(tk)
                 continue
-            stk = self.sortTks_(tkslist)[1][0]
+            stk = tkslist[1][0]
             if len(stk) == len(tk):
                 stk = tk
             else:
@@ -464,16 +547,63 @@ def naiveQie(txt):
     return tks
 
 
+TOKENIZE_CACHE_SIZE = int(os.environ.get("TOKENIZE_CACHE_SIZE", 100000))
+TOKENIZE_CACHE_MAX_LEN = int(os.environ.get("TOKENIZE_CACHE_MAX_LEN", 256))
+_memoized = []
+
+
+def memoize(maxsize=TOKENIZE_CACHE_SIZE, key=hashkey, max_len=TOKENIZE_CACHE_MAX_LEN):
+    """
+    LRU cache for functions whose result only depends on their arguments and the tokenizer dictionary.
+    The caches are dropped whenever the dictionary changes through `loadUserDict` or `addUserDict`.
+    Calls with a string, tuple or list argument longer than `max_len`, such as whole chunk contents or their
+    tokens, which rarely repeat, bypass the cache, so it holds at most `maxsize` short entries.
+    """
+    def decorator(func):
+        cached_func = cached(LRUCache(maxsize=maxsize), key=key, lock=threading.Lock(), info=True)(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if any(isinstance(a, (str, tuple, list)) and len(a) > max_len for a in (*args, *kwargs.values())):
+                return func(*args, **kwargs)
+            return cached_func(*args, **kwargs)
+
+        wrapper.cache_clear = cached_func.cache_clear
+        wrapper.cache_info = cached_func.cache_info
+        _memoized.append(wrapper)
+        return wrapper
+    return decorator
+
+
+def cache_clear():
+    for func in _memoized:
+        func.cache_clear()
+
+
+def cache_info():
+    """Per-process hit/miss counters of the memoized functions, by function name."""
+    return {func.__qualname__: func.cache_info()._asdict() for func in _memoized}
+
+
 tokenizer = RagTokenizer()
-tokenize = tokenizer.tokenize
-fine_grained_tokenize = tokenizer.fine_grained_tokenize
-tag = tokenizer.tag
-freq = tokenizer.freq
-loadUserDict = tokenizer.loadUserDict
-addUserDict = tokenizer.addUserDict
+tokenize = memoize()(tokenizer.tokenize)
+fine_grained_tokenize = memoize()(tokenizer.fine_grained_tokenize)
+tag = memoize()(tokenizer.tag)
+freq = memoize()(tokenizer.freq)
 tradi2simp = tokenizer._tradi2simp
 strQ2B = tokenizer._strQ2B
 
+
+def loadUserDict(fnm):
+    tokenizer.loadUserDict(fnm)
+    cache_clear()
+
+
+def addUserDict(fnm):
+    tokenizer.addUserDict(fnm)
+    cache_clear()
+
+
 if __name__ == '__main__':
     tknzr = RagTokenizer(debug=True)
     # huqie.addUserDict("/tmp/tmp.new.tks.dict")
@@ -16,7 +16,6 @@
 import logging
 import re
 import math
-from collections import OrderedDict
 from dataclasses import dataclass
 
 from rag.settings import TAG_FLD, PAGERANK_FLD
@@ -24,6 +23,7 @@ from rag.utils import rmSpace, get_float
 from rag.nlp import rag_tokenizer, query
 import numpy as np
 from rag.utils.doc_store_conn import DocStoreConnection, MatchDenseExpr, FusionExpr, OrderByExpr
+from rag.utils.retrieval_cache import retrieval_cache
 
 
 def index_name(uid): return f"ragflow_{uid}"
@@ -297,14 +297,14 @@ class Dealer:
         for i in sres.ids:
             if isinstance(sres.field[i].get("important_kwd", []), str):
                 sres.field[i]["important_kwd"] = [sres.field[i]["important_kwd"]]
+        # Token similarity only checks which query terms a chunk contains, so no need to repeat or dedupe tokens.
         ins_tw = []
         for i in sres.ids:
-            content_ltks = list(OrderedDict.fromkeys(sres.field[i][cfield].split()))
-            title_tks = [t for t in sres.field[i].get("title_tks", "").split() if t]
-            question_tks = [t for t in sres.field[i].get("question_tks", "").split() if t]
+            content_ltks = sres.field[i][cfield].split()
+            title_tks = sres.field[i].get("title_tks", "").split()
+            question_tks = sres.field[i].get("question_tks", "").split()
             important_kwd = sres.field[i].get("important_kwd", [])
-            tks = content_ltks + title_tks * 2 + important_kwd * 5 + question_tks * 6
-            ins_tw.append(tks)
+            ins_tw.append(content_ltks + title_tks + important_kwd + question_tks)
 
         ## For rank feature(tag_fea) scores.
         rank_fea = self._rank_feature_scores(rank_feature, sres)
@@ -348,11 +348,21 @@ class Dealer:
     def retrieval(self, question, embd_mdl, tenant_ids, kb_ids, page, page_size, similarity_threshold=0.2,
                   vector_similarity_weight=0.3, top=1024, doc_ids=None, aggs=True,
                   rerank_mdl=None, highlight=False,
-                  rank_feature: dict | None = {PAGERANK_FLD: 10}):
+                  rank_feature: dict | None = {PAGERANK_FLD: 10}, use_cache=True):
         ranks = {"total": 0, "chunks": [], "doc_aggs": {}}
         if not question:
             return ranks
 
+        cache_key = None
+        if use_cache and kb_ids and hasattr(embd_mdl, "model_key"):
+            cache_key = retrieval_cache.key(kb_ids, question, tenant_ids, doc_ids, page, page_size, similarity_threshold,
+                                            vector_similarity_weight, top, aggs, highlight, rank_feature,
+                                            embd_mdl.model_key, getattr(rerank_mdl, "model_key", None))
+        if cache_key:
+            cached = retrieval_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         RERANK_LIMIT = 64
         RERANK_LIMIT = int(RERANK_LIMIT//page_size + ((RERANK_LIMIT%page_size)/(page_size*1.) + 0.5)) * page_size if page_size>1 else 1
         if RERANK_LIMIT < 1: ## when page_size is very large the RERANK_LIMIT will be 0.
@@ -435,6 +445,8 @@ class Dealer:
                                                                    key=lambda x: x[1]["count"] * -1)]
         ranks["chunks"] = ranks["chunks"][:page_size]
 
+        if cache_key:
+            retrieval_cache.put(cache_key, ranks)
         return ranks
 
     def sql_retrieval(self, sql, fetch_size=128, format="json"):
@@ -20,6 +20,7 @@ import json
 import re
 import os
 import numpy as np
+from cachetools.keys import hashkey
 from rag.nlp import rag_tokenizer
 from api.utils.file_utils import get_project_base_directory
 
@@ -160,6 +161,11 @@ class Dealer:
         return tks
 
     def weights(self, tks, preprocess=True):
+        return list(self._weights(tuple(tks), preprocess))
+
+    # Every Dealer loads the same ner.json and term.freq, so the cache is shared and keyed without `self`.
+    @rag_tokenizer.memoize(key=lambda self, tks, preprocess: hashkey(tks, preprocess))
+    def _weights(self, tks, preprocess):
         def skill(t):
             if t not in self.sk:
                 return 1
@@ -22,9 +22,8 @@ import trio
 
 from graphrag.utils import (
     get_llm_cache,
-    get_embed_cache,
-    set_embed_cache,
     set_llm_cache,
+    encode_with_cache,
     chat_limiter,
 )
 from rag.utils import truncate
@@ -54,15 +53,10 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
         set_llm_cache(self._llm_model.llm_name, system, response, history, gen_conf)
         return response
 
-    async def _embedding_encode(self, txt):
-        response = get_embed_cache(self._embd_model.llm_name, txt)
-        if response is not None:
-            return response
-        embds, _ = await trio.to_thread.run_sync(lambda: self._embd_model.encode([txt]))
-        if len(embds) < 1 or len(embds[0]) < 1:
+    async def _embedding_encode(self, txts):
+        embds = await encode_with_cache(self._embd_model, txts)
+        if any(len(e) < 1 for e in embds):
             raise Exception("Embedding error: ")
-        embds = embds[0]
-        set_embed_cache(self._embd_model.llm_name, txt, embds)
         return embds
 
     def _get_optimal_clusters(self, embeddings: np.ndarray, random_state: int):
@@ -82,9 +76,9 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
         chunks = [(s, a) for s, a in chunks if s and len(a) > 0]
         layers = [(0, len(chunks))]
         start, end = 0, len(chunks)
+        summaries = []
 
         async def summarize(ck_idx: list[int]):
-            nonlocal chunks
             texts = [chunks[i][0] for i in ck_idx]
             len_per_chunk = int(
                 (self._llm_model.max_length - self._max_token) / len(texts)
@@ -111,14 +105,20 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                 cnt,
             )
             logging.debug(f"SUM: {cnt}")
-            embds = await self._embedding_encode(cnt)
-            chunks.append((cnt, embds))
+            summaries.append(cnt)
+
+        async def embed_summaries():
+            # One batched cache lookup / encode for the whole layer instead of one per summary.
+            embds = await self._embedding_encode(summaries)
+            chunks.extend(zip(summaries, embds))
+            summaries.clear()
 
         labels = []
         while end - start > 1:
             embeddings = [embd for _, embd in chunks[start:end]]
             if len(embeddings) == 2:
                 await summarize([start, start + 1])
+                await embed_summaries()
                 if callback:
                     callback(
                         msg="Cluster one layer: {} -> {}".format(
@@ -153,6 +153,7 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                     assert len(ck_idx) > 0
                     async with chat_limiter:
                         nursery.start_soon(summarize, ck_idx)
+            await embed_summaries()
 
             assert len(chunks) - end == n_clusters, "{} vs. {}".format(
                 len(chunks) - end, n_clusters
@@ -27,6 +27,7 @@ DOC_ENGINE = os.getenv('DOC_ENGINE', 'elasticsearch')
 
 ES = {}
 INFINITY = {}
+EMBEDDED = {}
 AZURE = {}
 S3 = {}
 MINIO = {}
@@ -40,6 +41,8 @@ elif DOC_ENGINE == 'opensearch':
     OS = get_base_config("os", {})
 elif DOC_ENGINE == 'infinity':
     INFINITY = get_base_config("infinity", {"uri": "infinity:23817"})
+elif DOC_ENGINE == 'embedded':
+    EMBEDDED = get_base_config("embedded", {"path": os.path.join(get_project_base_directory(), "data", "embedded")})
 
 if STORAGE_IMPL_TYPE in ['AZURE_SPN', 'AZURE_SAS']:
     AZURE = get_base_config("azure", {})
@@ -56,9 +59,12 @@ except Exception:
     REDIS = {}
     pass
 DOC_MAXIMUM_SIZE = int(os.environ.get("MAX_CONTENT_LENGTH", 128 * 1024 * 1024))
+# Part size of the multipart uploads streamed into the object storage
+STORAGE_PART_SIZE = int(os.environ.get("STORAGE_PART_SIZE", 16 * 1024 * 1024))
 
 SVR_QUEUE_NAME = "rag_flow_svr_queue"
 SVR_CONSUMER_GROUP_NAME = "rag_flow_svr_task_broker"
+SVR_QUEUE_PRIORITIES = [1, 0]
 PAGERANK_FLD = "pagerank_fea"
 TAG_FLD = "tag_feas"
 
@@ -81,4 +87,4 @@ def get_svr_queue_name(priority: int) -> str:
     return f"{SVR_QUEUE_NAME}_{priority}"
 
 def get_svr_queue_names():
-    return [get_svr_queue_name(priority) for priority in [1, 0]]
+    return [get_svr_queue_name(priority) for priority in SVR_QUEUE_PRIORITIES]
@@ -0,0 +1,160 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import os
+from timeit import default_timer as timer
+
+import numpy as np
+import trio
+
+from rag.utils import num_tokens_from_string
+
+EMBEDDING_BATCH_TOKENS = int(os.environ.get('EMBEDDING_BATCH_TOKENS', '8192'))
+EMBEDDING_BATCH_MAX_WAIT = float(os.environ.get('EMBEDDING_BATCH_MAX_WAIT', '0.05'))
+MAX_CONCURRENT_EMBEDDINGS = int(os.environ.get('MAX_CONCURRENT_EMBEDDINGS', '4'))
+
+
+class _Slot:
+    def __init__(self, text):
+        self.text = text
+        self.tokens = num_tokens_from_string(text)
+        self.done = trio.Event()
+        self.vector = None
+        self.used_tokens = 0
+        self.error = None
+
+
+class _ModelQueue:
+    def __init__(self, mdl):
+        self.mdl = mdl
+        self.pending = {}
+        self.pending_tokens = 0
+        self.full = trio.Event()
+        self.has_leader = False
+        self.limiter = trio.CapacityLimiter(MAX_CONCURRENT_EMBEDDINGS)
+        self.stats = {"requests": 0, "texts": 0, "deduped": 0, "batches": 0, "tokens": 0, "seconds": 0.}
+
+
+class EmbeddingScheduler:
+    """
+    Coalesces the `encode` calls of all the tasks of the process into model sized batches.
+    Texts are queued per tenant and model, identical texts share one slot, and the first waiting request
+    encodes everything queued once EMBEDDING_BATCH_TOKENS are reached or EMBEDDING_BATCH_MAX_WAIT elapsed.
+    """
+
+    def __init__(self, batch_tokens=EMBEDDING_BATCH_TOKENS, max_wait=EMBEDDING_BATCH_MAX_WAIT):
+        self.batch_tokens = batch_tokens
+        self.max_wait = max_wait
+        self.queues = {}
+
+    @staticmethod
+    def model_key(mdl):
+        return getattr(mdl, "tenant_id", ""), getattr(mdl, "model_key", None) or getattr(mdl, "llm_name", str(id(mdl)))
+
+    async def encode(self, mdl, texts: list):
+        """Same as `mdl.encode(texts)`: the vectors and the (prorated) token usage."""
+        if not texts:
+            return np.array([]), 0
+        key = self.model_key(mdl)
+        q = self.queues.get(key)
+        if q is None:
+            q = self.queues[key] = _ModelQueue(mdl)
+        q.stats["requests"] += 1
+        q.stats["texts"] += len(texts)
+
+        slots = []
+        for t in texts:
+            slot = q.pending.get(t)
+            if slot is None:
+                slot = q.pending[t] = _Slot(t)
+                q.pending_tokens += slot.tokens
+            else:
+                q.stats["deduped"] += 1
+            slots.append(slot)
+        if q.pending_tokens >= self.batch_tokens:
+            q.full.set()
+
+        if not q.has_leader:
+            q.has_leader = True
+            try:
+                with trio.move_on_after(self.max_wait):
+                    await q.full.wait()
+            finally:
+                with trio.CancelScope(shield=True):
+                    await self._flush(q)
+
+        for slot in slots:
+            await slot.done.wait()
+        for slot in slots:
+            if slot.error is not None:
+                raise slot.error
+        used_tokens = sum(slot.used_tokens for slot in set(slots))
+        return np.array([slot.vector for slot in slots]), int(round(used_tokens))
+
+    async def _flush(self, q):
+        pending = list(q.pending.values())
+        q.pending, q.pending_tokens = {}, 0
+        q.full = trio.Event()
+        q.has_leader = False
+
+        batches, batch, batch_tokens = [], [], 0
+        for slot in pending:
+            if batch and batch_tokens + slot.tokens > self.batch_tokens:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(slot)
+            batch_tokens += slot.tokens
+        if batch:
+            batches.append(batch)
+
+        async with trio.open_nursery() as nursery:
+            for batch in batches:
+                nursery.start_soon(self._encode_batch, q, batch)
+
+    async def _encode_batch(self, q, batch):
+        try:
+            async with q.limiter:
+                st = timer()
+                vts, used_tokens = await trio.to_thread.run_sync(lambda: q.mdl.encode([slot.text for slot in batch]))
+            q.stats["batches"] += 1
+            q.stats["tokens"] += used_tokens
+            q.stats["seconds"] += timer() - st
+            total = sum(slot.tokens for slot in batch) or 1
+            for slot, v in zip(batch, vts):
+                slot.vector = v
+                slot.used_tokens = used_tokens * slot.tokens / total
+        except Exception as e:
+            logging.exception("EmbeddingScheduler encode {} texts got exception".format(len(batch)))
+            for slot in batch:
+                slot.error = e
+        finally:
+            for slot in batch:
+                slot.done.set()
+
+    def stats(self):
+        """Per model throughput: requests, texts, deduplicated texts, model calls, tokens, texts/s."""
+        res = {}
+        for (_, model), q in self.queues.items():
+            st = res.setdefault(model, {k: 0 for k in q.stats})
+            for k, v in q.stats.items():
+                st[k] += v
+        for st in res.values():
+            st["texts_per_second"] = round((st["texts"] - st["deduped"]) / st["seconds"], 2) if st["seconds"] else 0
+            st["seconds"] = round(st["seconds"], 3)
+        return res
+
+
+embedding_scheduler = EmbeddingScheduler()
@@ -0,0 +1,81 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import os
+import threading
+import time
+
+from api.db.db_models import close_connection
+from api.db.services.task_service import TaskService
+
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get('PROGRESS_FLUSH_INTERVAL', '1.0'))
+
+
+class ProgressReporter:
+    """
+    Buffers the progress of all the tasks of the process and writes it to the database in batches.
+    Messages are appended in order and the latest progress value wins. Pending updates are flushed every
+    PROGRESS_FLUSH_INTERVAL seconds, and immediately when a task fails or completes.
+    """
+
+    def __init__(self, interval=PROGRESS_FLUSH_INTERVAL):
+        self.interval = interval
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.stats = {"reports": 0, "flushes": 0, "writes": 0}
+
+    def report(self, task_id, prog=None, msg="", flush=False):
+        """Queue a progress update, written right away for failures, completion or when `flush` is set."""
+        with self.lock:
+            self.stats["reports"] += 1
+            info = self.pending.setdefault(task_id, {"progress_msg": []})
+            if msg:
+                info["progress_msg"].append(msg)
+            if prog is not None:
+                info["progress"] = prog
+            if self.thread is None:
+                self.thread = threading.Thread(name="ProgressReporter", target=self._run, daemon=True)
+                self.thread.start()
+        if flush or (prog is not None and (prog < 0 or prog >= 1)):
+            self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            if not pending:
+                return
+            infos = {}
+            for task_id, info in pending.items():
+                infos[task_id] = dict(info, progress_msg="\n".join(info["progress_msg"]))
+            try:
+                TaskService.update_progress_batch(infos)
+                self.stats["flushes"] += 1
+                self.stats["writes"] += len(infos)
+            except Exception:
+                logging.exception(f"ProgressReporter flush of {len(infos)} tasks got exception")
+            finally:
+                close_connection()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+progress_reporter = ProgressReporter()
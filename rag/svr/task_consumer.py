@@ -0,0 +1,103 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import os
+import time
+from collections import deque
+
+import trio
+
+from rag.settings import SVR_QUEUE_PRIORITIES, get_svr_queue_name
+from rag.utils.redis_conn import REDIS_CONN
+
+TASK_CONSUMER_BLOCK_MS = int(os.environ.get('TASK_CONSUMER_BLOCK_MS', '1000'))
+PRIORITY_QUEUE_WEIGHT = int(os.environ.get('PRIORITY_QUEUE_WEIGHT', '4'))
+
+
+class TaskConsumer:
+    """
+    Prefetches task messages from the priority queues, reading no more than there are free task slots, and hands
+    them out with smooth weighted round-robin between the priorities: a queue of priority p weighs
+    PRIORITY_QUEUE_WEIGHT ** p, so low priority work is delayed but never starved. The queue read first takes
+    turns the same way, so the higher priorities can't take every free slot.
+    The messages left unacked by a previous run of this consumer are handed out first.
+    """
+
+    def __init__(self, group_name, consumer_name, block=TASK_CONSUMER_BLOCK_MS):
+        self.group_name = group_name
+        self.consumer_name = consumer_name
+        self.block = block
+        self.weights = {get_svr_queue_name(p): PRIORITY_QUEUE_WEIGHT ** p for p in SVR_QUEUE_PRIORITIES}
+        self.buffers = {q: deque() for q in self.weights}
+        self.credits = {q: 0 for q in self.weights}
+        self.fetch_credits = {q: 0 for q in self.weights}
+        self.unacked = None
+        self.stats = {q: {"received": 0, "wait_avg": 0., "wait_max": 0.} for q in self.weights}
+
+    def buffered(self):
+        return sum(len(b) for b in self.buffers.values())
+
+    async def get(self, free=1):
+        """The next message to process, None if nothing arrived within the blocking time."""
+        if not self.buffered():
+            msgs = await trio.to_thread.run_sync(self._fetch, max(1, free))
+            if msgs is None:
+                await trio.sleep(1)
+                return None
+            for msg in msgs:
+                self.buffers.setdefault(msg.get_queue_name(), deque()).append(msg)
+        return self._pick()
+
+    def _fetch(self, count):
+        if self.unacked is None:
+            self.unacked = REDIS_CONN.get_unacked_iterator(list(self.weights), self.group_name, self.consumer_name)
+        if self.unacked:
+            msg = next(self.unacked, None)
+            if msg:
+                return [msg]
+            self.unacked = False
+        return REDIS_CONN.queue_consumer_batch(self._fetch_order(), self.group_name, self.consumer_name, count, self.block)
+
+    def _fetch_order(self):
+        total = sum(self.weights.values())
+        for q, w in self.weights.items():
+            self.fetch_credits[q] += w
+        first = max(self.weights, key=lambda q: self.fetch_credits[q])
+        self.fetch_credits[first] -= total
+        return [first] + sorted((q for q in self.weights if q != first), key=lambda q: self.weights[q], reverse=True)
+
+    def _pick(self):
+        ready = [q for q, b in self.buffers.items() if b]
+        if not ready:
+            return None
+        total = 0
+        for q in ready:
+            self.credits[q] = self.credits.get(q, 0) + self.weights.get(q, 1)
+            total += self.weights.get(q, 1)
+        q = max(ready, key=lambda q: self.credits[q])
+        self.credits[q] -= total
+        msg = self.buffers[q].popleft()
+        try:
+            self._record_wait(q, time.time() - msg.get_enqueue_time())
+        except Exception:
+            logging.warning(f"TaskConsumer can't tell the enqueue time of {msg.get_msg_id()}")
+        return msg
+
+    def _record_wait(self, queue_name, wait):
+        st = self.stats.setdefault(queue_name, {"received": 0, "wait_avg": 0., "wait_max": 0.})
+        st["received"] += 1
+        st["wait_avg"] += (wait - st["wait_avg"]) / st["received"]
+        st["wait_max"] = max(st["wait_max"], wait)
@@ -23,7 +23,7 @@ import time
 
 from api.utils.log_utils import initRootLogger, get_project_base_directory
 from graphrag.general.index import run_graphrag
-from graphrag.utils import get_llm_cache, set_llm_cache, get_tags_from_cache, set_tags_to_cache
+from graphrag.utils import get_llm_cache, get_llm_cache_bulk, set_llm_cache, set_llm_cache_bulk, get_tags_from_cache, set_tags_to_cache
 from rag.prompts import keyword_extraction, question_proposal, content_tagging
 
 import logging
@@ -46,22 +46,25 @@ import faulthandler
 import numpy as np
 from peewee import DoesNotExist
 
-from api.db import LLMType, ParserType, TaskStatus
+from api.db import LLMType, ParserType
 from api.db.services.document_service import DocumentService
 from api.db.services.llm_service import LLMBundle
 from api.db.services.task_service import TaskService
 from api.db.services.file2document_service import File2DocumentService
 from api import settings
 from api.versions import get_ragflow_version
-from api.db.db_models import close_connection
 from rag.app import laws, paper, presentation, manual, qa, table, book, resume, picture, naive, one, audio, \
     email, tag
 from rag.nlp import search, rag_tokenizer
 from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor
+from rag.svr.embedding_scheduler import embedding_scheduler, MAX_CONCURRENT_EMBEDDINGS
+from rag.svr.progress_reporter import progress_reporter
+from rag.svr.task_consumer import TaskConsumer
 from rag.settings import DOC_MAXIMUM_SIZE, SVR_CONSUMER_GROUP_NAME, get_svr_queue_name, get_svr_queue_names, print_rag_settings, TAG_FLD, PAGERANK_FLD
 from rag.utils import num_tokens_from_string, truncate
 from rag.utils.redis_conn import REDIS_CONN, RedisDistributedLock
 from rag.utils.storage_factory import STORAGE_IMPL
+from rag.utils.task_cancel import cancel_listener, cancel_documents
 from graphrag.utils import chat_limiter
 
 BATCH_SIZE = 64
@@ -85,8 +88,6 @@ FACTORY = {
     ParserType.TAG.value: tag
 }
 
-UNACKED_ITERATOR = None
-
 CONSUMER_NO = "0" if len(sys.argv) < 2 else sys.argv[1]
 CONSUMER_NAME = "task_executor_" + CONSUMER_NO
 BOOT_AT = datetime.now().astimezone().isoformat(timespec="milliseconds")
@@ -96,13 +97,23 @@ DONE_TASKS = 0
 FAILED_TASKS = 0
 
 CURRENT_TASKS = {}
+task_consumer = TaskConsumer(SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME)
 
 MAX_CONCURRENT_TASKS = int(os.environ.get('MAX_CONCURRENT_TASKS', "5"))
 MAX_CONCURRENT_CHUNK_BUILDERS = int(os.environ.get('MAX_CONCURRENT_CHUNK_BUILDERS', "1"))
 MAX_CONCURRENT_MINIO = int(os.environ.get('MAX_CONCURRENT_MINIO', '10'))
+MAX_CONCURRENT_DOC_STORE_BULK = int(os.environ.get('MAX_CONCURRENT_DOC_STORE_BULK', '4'))
+DOC_BULK_SIZE = int(os.environ.get('DOC_BULK_SIZE', '64'))
+DOC_BULK_BYTES = int(os.environ.get('DOC_BULK_BYTES', str(8 * 1024 * 1024)))
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', '16'))
+STREAM_CHUNKS = int(os.environ.get('STREAM_CHUNKS', '1'))
+PIPELINE_CHANNEL_SIZE = int(os.environ.get('PIPELINE_CHANNEL_SIZE', '128'))
+# Chunks whose keywords and questions are looked up in, and written to, the LLM cache at once.
+ENRICH_BATCH_SIZE = int(os.environ.get('ENRICH_BATCH_SIZE', '16'))
 task_limiter = trio.CapacityLimiter(MAX_CONCURRENT_TASKS)
 chunk_limiter = trio.CapacityLimiter(MAX_CONCURRENT_CHUNK_BUILDERS)
 minio_limiter = trio.CapacityLimiter(MAX_CONCURRENT_MINIO)
+bulk_limiter = trio.CapacityLimiter(MAX_CONCURRENT_DOC_STORE_BULK)
 WORKER_HEARTBEAT_TIMEOUT = int(os.environ.get('WORKER_HEARTBEAT_TIMEOUT', '120'))
 stop_event = threading.Event()
 
@@ -151,11 +162,16 @@ class TaskCanceledException(Exception):
         self.msg = msg
 
 
+def check_canceled(task_id):
+    if task_id and cancel_listener.is_canceled(task_id):
+        raise TaskCanceledException(f"Task {task_id} has been canceled.")
+
+
 def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing..."):
     try:
         if prog is not None and prog < 0:
             msg = "[ERROR]" + msg
-        cancel = TaskService.do_cancel(task_id)
+        cancel = cancel_listener.is_canceled(task_id)
 
         if cancel:
             msg += " [Canceled]"
@@ -167,35 +183,22 @@ def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing...
                     msg = f"Page({from_page + 1}~{to_page + 1}): " + msg
         if msg:
             msg = datetime.now().strftime("%H:%M:%S") + " " + msg
-        d = {"progress_msg": msg}
-        if prog is not None:
-            d["progress"] = prog
+        progress_reporter.report(task_id, prog, msg)
 
-        TaskService.update_progress(task_id, d)
-
-        close_connection()
         if cancel:
             raise TaskCanceledException(msg)
         logging.info(f"set_progress({task_id}), progress: {prog}, progress_msg: {msg}")
+    except TaskCanceledException:
+        raise
     except DoesNotExist:
         logging.warning(f"set_progress({task_id}) got exception DoesNotExist")
     except Exception:
         logging.exception(f"set_progress({task_id}), progress: {prog}, progress_msg: {msg}, got exception")
 
-async def collect():
-    global CONSUMER_NAME, DONE_TASKS, FAILED_TASKS
-    global UNACKED_ITERATOR
-    svr_queue_names = get_svr_queue_names()
+async def collect(free=1):
+    global FAILED_TASKS
     try:
-        if not UNACKED_ITERATOR:
-            UNACKED_ITERATOR = REDIS_CONN.get_unacked_iterator(svr_queue_names, SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME)
-        try:
-            redis_msg = next(UNACKED_ITERATOR)
-        except StopIteration:
-            for svr_queue_name in svr_queue_names:
-                redis_msg = REDIS_CONN.queue_consumer(svr_queue_name, SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME)
-                if redis_msg:
-                    break
+        redis_msg = await task_consumer.get(free)
     except Exception:
         logging.exception("collect got exception")
         return None, None
@@ -211,10 +214,12 @@ async def collect():
     canceled = False
     task = TaskService.get_task(msg["id"])
     if task:
-        _, doc = DocumentService.get_by_id(task["doc_id"])
-        canceled = doc.run == TaskStatus.CANCEL.value or doc.progress < 0
+        cancel_listener.watch(task["id"], task["doc_id"])
+        canceled = cancel_listener.is_canceled(task["id"])
     if not task or canceled:
         state = "is unknown" if not task else "has been cancelled"
+        if task:
+            cancel_listener.unwatch(task["id"])
         FAILED_TASKS += 1
         logging.warning(f"collect task {msg['id']} {state}")
         redis_msg.ack()
@@ -227,7 +232,7 @@ async def get_storage_binary(bucket, name):
     return await trio.to_thread.run_sync(lambda: STORAGE_IMPL.get(bucket, name))
 
 
-async def build_chunks(task, progress_callback):
+async def chunk_document(task, progress_callback):
     if task["size"] > DOC_MAXIMUM_SIZE:
         set_progress(task["id"], prog=-1, msg="File size exceeds( <= %dMb )" %
                                               (int(DOC_MAXIMUM_SIZE / 1024 / 1024)))
@@ -264,48 +269,106 @@ async def build_chunks(task, progress_callback):
         progress_callback(-1, "Internal server error while chunking: %s" % str(e).replace("'", ""))
         logging.exception("Chunking {}/{} got exception".format(task["location"], task["name"]))
         raise
+    return cks
 
-    docs = []
+
+def chunk_base_doc(task):
     doc = {
         "doc_id": task["doc_id"],
         "kb_id": str(task["kb_id"])
     }
     if task["pagerank"]:
         doc[PAGERANK_FLD] = int(task["pagerank"])
+    return doc
+
+
+async def upload_to_minio(task, document, chunk):
+    try:
+        async with minio_limiter:
+            d = copy.deepcopy(document)
+            d.update(chunk)
+            d["id"] = xxhash.xxh64((chunk["content_with_weight"] + str(d["doc_id"])).encode("utf-8")).hexdigest()
+            d["create_time"] = str(datetime.now()).replace("T", " ")[:19]
+            d["create_timestamp_flt"] = datetime.now().timestamp()
+            if not d.get("image"):
+                _ = d.pop("image", None)
+                d["img_id"] = ""
+                return d
+
+            output_buffer = BytesIO()
+            if isinstance(d["image"], bytes):
+                output_buffer = BytesIO(d["image"])
+            else:
+                d["image"].save(output_buffer, format='JPEG')
+            await trio.to_thread.run_sync(lambda: STORAGE_IMPL.put(task["kb_id"], d["id"], output_buffer.getvalue()))
+
+            d["img_id"] = "{}-{}".format(task["kb_id"], d["id"])
+            del d["image"]
+            return d
+    except Exception:
+        logging.exception(
+            "Saving image of chunk {}/{}/{} got exception".format(task["location"], task["name"], d["id"]))
+        raise
+
+
+async def doc_keyword_extraction(chat_mdl, d, topn, cached=None, task_id=None):
+    """Set the keywords of `d` from `cached` or the LLM. Returns the ones the LLM generated, to be cached."""
+    generated = None
+    if not cached:
+        async with chat_limiter:
+            check_canceled(task_id)
+            cached = generated = await trio.to_thread.run_sync(lambda: keyword_extraction(chat_mdl, d["content_with_weight"], topn))
+    if cached:
+        d["important_kwd"] = cached.split(",")
+        d["important_tks"] = rag_tokenizer.tokenize(" ".join(d["important_kwd"]))
+    return generated
+
+
+async def doc_question_proposal(chat_mdl, d, topn, cached=None, task_id=None):
+    """Set the questions of `d` from `cached` or the LLM. Returns the ones the LLM generated, to be cached."""
+    generated = None
+    if not cached:
+        async with chat_limiter:
+            check_canceled(task_id)
+            cached = generated = await trio.to_thread.run_sync(lambda: question_proposal(chat_mdl, d["content_with_weight"], topn))
+    if cached:
+        d["question_kwd"] = cached.split("\n")
+        d["question_tks"] = rag_tokenizer.tokenize("\n".join(d["question_kwd"]))
+    return generated
+
+
+async def docs_enrichment(enrich, history, chat_mdl, docs, topn, task_id=None):
+    """
+    Run `doc_keyword_extraction` or `doc_question_proposal` on a batch of chunks, reading the LLM cache with one
+    MGET and writing what the LLM generated back with one pipelined round trip.
+    """
+    txts = [d["content_with_weight"] for d in docs]
+    cached = get_llm_cache_bulk(chat_mdl.llm_name, txts, history, {"topn": topn})
+    generated = [None] * len(docs)
+
+    async def run(i):
+        generated[i] = await enrich(chat_mdl, docs[i], topn, cached[i] or "", task_id)
+
+    async with trio.open_nursery() as nursery:
+        for i in range(len(docs)):
+            nursery.start_soon(run, i)
+    set_llm_cache_bulk(chat_mdl.llm_name, txts, generated, history, {"topn": topn})
+
+
+async def build_chunks(task, progress_callback):
+    cks = await chunk_document(task, progress_callback)
+    if not cks:
+        return []
+    doc = chunk_base_doc(task)
+    docs = []
     st = timer()
 
-    async def upload_to_minio(document, chunk):
-        try:
-            async with minio_limiter:
-                d = copy.deepcopy(document)
-                d.update(chunk)
-                d["id"] = xxhash.xxh64((chunk["content_with_weight"] + str(d["doc_id"])).encode("utf-8")).hexdigest()
-                d["create_time"] = str(datetime.now()).replace("T", " ")[:19]
-                d["create_timestamp_flt"] = datetime.now().timestamp()
-                if not d.get("image"):
-                    _ = d.pop("image", None)
-                    d["img_id"] = ""
-                    docs.append(d)
-                    return
-
-                output_buffer = BytesIO()
-                if isinstance(d["image"], bytes):
-                    output_buffer = BytesIO(d["image"])
-                else:
-                    d["image"].save(output_buffer, format='JPEG')
-                await trio.to_thread.run_sync(lambda: STORAGE_IMPL.put(task["kb_id"], d["id"], output_buffer.getvalue()))
-
-                d["img_id"] = "{}-{}".format(task["kb_id"], d["id"])
-                del d["image"]
-                docs.append(d)
-        except Exception:
-            logging.exception(
-                "Saving image of chunk {}/{}/{} got exception".format(task["location"], task["name"], d["id"]))
-            raise
+    async def upload(ck):
+        docs.append(await upload_to_minio(task, doc, ck))
 
     async with trio.open_nursery() as nursery:
         for ck in cks:
-            nursery.start_soon(upload_to_minio, doc, ck)
+            nursery.start_soon(upload, ck)
 
     el = timer() - st
     logging.info("MINIO PUT({}) cost {:.3f} s".format(task["name"], el))
@@ -314,39 +377,16 @@ async def build_chunks(task, progress_callback):
         st = timer()
         progress_callback(msg="Start to generate keywords for every chunk ...")
         chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
-        async def doc_keyword_extraction(chat_mdl, d, topn):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "keywords", {"topn": topn})
-            if not cached:
-                async with chat_limiter:
-                    cached = await trio.to_thread.run_sync(lambda: keyword_extraction(chat_mdl, d["content_with_weight"], topn))
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "keywords", {"topn": topn})
-            if cached:
-                d["important_kwd"] = cached.split(",")
-                d["important_tks"] = rag_tokenizer.tokenize(" ".join(d["important_kwd"]))
-            return
-        async with trio.open_nursery() as nursery:
-            for d in docs:
-                nursery.start_soon(doc_keyword_extraction, chat_mdl, d, task["parser_config"]["auto_keywords"])
+        topn = task["parser_config"]["auto_keywords"]
+        await docs_enrichment(doc_keyword_extraction, "keywords", chat_mdl, docs, topn, task["id"])
         progress_callback(msg="Keywords generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     if task["parser_config"].get("auto_questions", 0):
         st = timer()
         progress_callback(msg="Start to generate questions for every chunk ...")
         chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
-        async def doc_question_proposal(chat_mdl, d, topn):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "question", {"topn": topn})
-            if not cached:
-                async with chat_limiter:
-                    cached = await trio.to_thread.run_sync(lambda: question_proposal(chat_mdl, d["content_with_weight"], topn))
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "question", {"topn": topn})
-            if cached:
-                d["question_kwd"] = cached.split("\n")
-                d["question_tks"] = rag_tokenizer.tokenize("\n".join(d["question_kwd"]))
-        async with trio.open_nursery() as nursery:
-            for d in docs:
-                nursery.start_soon(doc_question_proposal, chat_mdl, d, task["parser_config"]["auto_questions"])
+        topn = task["parser_config"]["auto_questions"]
+        await docs_enrichment(doc_question_proposal, "question", chat_mdl, docs, topn, task["id"])
         progress_callback(msg="Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     if task["kb_parser_config"].get("tag_kb_ids", []):
@@ -380,6 +420,7 @@ async def build_chunks(task, progress_callback):
                 if not picked_examples:
                     picked_examples.append({"content": "This is an example", TAG_FLD: {'example': 1}})
                 async with chat_limiter:
+                    check_canceled(task["id"])
                     cached = await trio.to_thread.run_sync(lambda: content_tagging(chat_mdl, d["content_with_weight"], all_tags, picked_examples, topn=topn_tags))
                 if cached:
                     cached = json.dumps(cached)
@@ -399,10 +440,10 @@ def init_kb(row, vector_size: int):
     return settings.docStoreConn.createIdx(idxnm, row.get("kb_id", ""), vector_size)
 
 
-async def embedding(docs, mdl, parser_config=None, callback=None):
+async def embedding(docs, mdl, parser_config=None, callback=None, title_vts=None):
     if parser_config is None:
         parser_config = {}
-    batch_size = 16
+    batch_size = EMBEDDING_BATCH_SIZE
     tts, cnts = [], []
     for d in docs:
         tts.append(d.get("docnm_kwd", "Title"))
@@ -416,20 +457,28 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
 
     tk_count = 0
     if len(tts) == len(cnts):
-        vts, c = await trio.to_thread.run_sync(lambda: mdl.encode(tts[0: 1]))
-        tts = np.concatenate([vts for _ in range(len(tts))], axis=0)
+        if title_vts is None:
+            title_vts, c = await embedding_scheduler.encode(mdl, tts[0: 1])
+            tk_count += c
+        tts = np.concatenate([title_vts for _ in range(len(tts))], axis=0)
+
+    # All the batches are queued at once, the scheduler packs them with the other tasks' into model sized calls.
+    cnts_ = [None] * ((len(cnts) + batch_size - 1) // batch_size)
+    encoded = 0
+
+    async def encode_batch(i):
+        nonlocal tk_count, encoded
+        vts, c = await embedding_scheduler.encode(mdl, [truncate(c, mdl.max_length-10) for c in cnts[i: i + batch_size]])
+        cnts_[i // batch_size] = vts
         tk_count += c
+        encoded += len(vts)
+        if callback:
+            callback(prog=0.7 + 0.2 * encoded / len(cnts), msg="")
 
-    cnts_ = np.array([])
-    for i in range(0, len(cnts), batch_size):
-        vts, c = await trio.to_thread.run_sync(lambda: mdl.encode([truncate(c, mdl.max_length-10) for c in cnts[i: i + batch_size]]))
-        if len(cnts_) == 0:
-            cnts_ = vts
-        else:
-            cnts_ = np.concatenate((cnts_, vts), axis=0)
-        tk_count += c
-        callback(prog=0.7 + 0.2 * (i + 1) / len(cnts), msg="")
-    cnts = cnts_
+    async with trio.open_nursery() as nursery:
+        for i in range(0, len(cnts), batch_size):
+            nursery.start_soon(encode_batch, i)
+    cnts = np.concatenate(cnts_, axis=0) if cnts_ else np.array([])
 
     title_w = float(parser_config.get("filename_embd_weight", 0.1))
     vects = (title_w * tts + (1 - title_w) *
@@ -485,6 +534,223 @@ async def run_raptor(row, chat_mdl, embd_mdl, vector_size, callback=None):
     return res, tk_count
 
 
+def chunk_bytes(d):
+    """Rough size of a chunk in a bulk request."""
+    size = 0
+    for k, v in d.items():
+        if isinstance(v, str):
+            size += len(k) + len(v)
+        elif isinstance(v, list):
+            size += len(k) + 12 * len(v)
+        else:
+            size += len(k) + 16
+    return size
+
+
+def chunk_bulk_batches(chunks):
+    """Split chunks into bulk requests bounded by both DOC_BULK_SIZE and (approximately) DOC_BULK_BYTES."""
+    batch, batch_bytes = [], 0
+    for ck in chunks:
+        ck_bytes = chunk_bytes(ck)
+        if batch and (len(batch) >= DOC_BULK_SIZE or batch_bytes + ck_bytes > DOC_BULK_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(ck)
+        batch_bytes += ck_bytes
+    if batch:
+        yield batch
+
+
+async def bulk_insert(batch, idxnm, task_dataset_id, progress_callback):
+    """Index one batch of chunks. A batch rejected for its size or by a timeout is split in halves and retried."""
+    async with bulk_limiter:
+        doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(batch, idxnm, task_dataset_id))
+    if doc_store_result and len(batch) > 1 and re.search(r"(timeout|time out|too large|413|429|rejected|circuit_breaking)", str(doc_store_result), re.IGNORECASE):
+        logging.warning(f"Bulk of {len(batch)} chunks rejected, retrying in halves: {doc_store_result}")
+        await bulk_insert(batch[:len(batch) // 2], idxnm, task_dataset_id, progress_callback)
+        await bulk_insert(batch[len(batch) // 2:], idxnm, task_dataset_id, progress_callback)
+        return
+    if doc_store_result:
+        error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
+        progress_callback(-1, msg=error_message)
+        raise Exception(error_message)
+
+
+async def commit_chunk_ids(task_id, idxnm, task_dataset_id, chunk_ids):
+    """Record the chunk ids of the task, or remove the chunks again (returns False) if the task disappeared meanwhile."""
+    try:
+        TaskService.update_chunk_ids(task_id, " ".join(chunk_ids))
+    except DoesNotExist:
+        logging.warning(f"insert_chunks update_chunk_ids failed since task {task_id} is unknown.")
+        await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"id": chunk_ids}, idxnm, task_dataset_id))
+        return False
+    return True
+
+
+async def insert_chunks(task_id, task_tenant_id, task_dataset_id, chunks, progress_callback):
+    """
+    Index chunks with several bulk requests in flight, then record the chunk ids of the task once.
+    On failure, or if the task disappeared meanwhile (returns False), the inserted chunks are removed again.
+    """
+    if not chunks:
+        return True
+    idxnm = search.index_name(task_tenant_id)
+    inserted = 0
+
+    async def insert_batch(batch):
+        await bulk_insert(batch, idxnm, task_dataset_id, progress_callback)
+        nonlocal inserted
+        before = inserted
+        inserted += len(batch)
+        if before // 128 != inserted // 128:
+            progress_callback(prog=0.8 + 0.1 * inserted / len(chunks), msg="")
+
+    chunk_ids = [chunk["id"] for chunk in chunks]
+    try:
+        async with trio.open_nursery() as nursery:
+            for batch in chunk_bulk_batches(chunks):
+                nursery.start_soon(insert_batch, batch)
+    except BaseException:
+        # The chunk ids are only recorded at the end, so nothing else would clean up a partial index.
+        with trio.CancelScope(shield=True):
+            await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"id": chunk_ids}, idxnm, task_dataset_id))
+        raise
+
+    return await commit_chunk_ids(task_id, idxnm, task_dataset_id, chunk_ids)
+
+
+async def stream_chunks(task, embedding_model, progress_callback):
+    """
+    Chunk, enrich, embed and index a document with all the stages running at once.
+    Chunks flow from stage to stage through bounded memory channels: the embedding model works while images are
+    uploaded and keywords generated, and bulk indexing starts with the first embedded batch.
+    Returns (chunk_count, token_count, vector_size), or None if the task disappeared meanwhile.
+    """
+    cks = await chunk_document(task, progress_callback)
+    if not cks:
+        return 0, 0, 0
+    total = len(cks)
+    # Chunks are popped from the end as they enter the pipeline, so they are released once indexed.
+    cks.reverse()
+    doc = chunk_base_doc(task)
+    parser_config = task["parser_config"]
+    auto_keywords = parser_config.get("auto_keywords", 0)
+    auto_questions = parser_config.get("auto_questions", 0)
+    chat_mdl = None
+    if auto_keywords or auto_questions:
+        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
+    idxnm = search.index_name(task["tenant_id"])
+    stats = {"prepared": 0, "embedded": 0, "indexed": 0, "tokens": 0, "vector_size": 0}
+    chunk_ids = []
+    st = timer()
+
+    def report(stage, n):
+        before = stats[stage]
+        stats[stage] += n
+        step = max(128, total // 10)
+        if before // step != stats[stage] // step or stats[stage] == total:
+            progress_callback(prog=0.7 + 0.2 * stats["indexed"] / total,
+                              msg="Prepared {prepared}, embedded {embedded}, indexed {indexed} of {total} chunks".format(total=total, **stats))
+
+    async def prepare(send_channel):
+        # With keywords or questions to generate, chunks go in batches sharing their LLM cache round trips.
+        batch_size = ENRICH_BATCH_SIZE if chat_mdl else 1
+        async with send_channel:
+            while cks:
+                batch = []
+                while cks and len(batch) < batch_size:
+                    check_canceled(task["id"])
+                    batch.append(await upload_to_minio(task, doc, cks.pop()))
+                if auto_keywords:
+                    await docs_enrichment(doc_keyword_extraction, "keywords", chat_mdl, batch, auto_keywords, task["id"])
+                if auto_questions:
+                    await docs_enrichment(doc_question_proposal, "question", chat_mdl, batch, auto_questions, task["id"])
+                for d in batch:
+                    await send_channel.send(d)
+                report("prepared", len(batch))
+
+    async def embed(receive_channel, send_channel):
+        title_vts = None
+
+        async def embed_batch(batch):
+            nonlocal title_vts
+            check_canceled(task["id"])
+            try:
+                if title_vts is None:
+                    title_vts, c = await embedding_scheduler.encode(embedding_model, [batch[0].get("docnm_kwd", "Title")])
+                    stats["tokens"] += c
+                tk_count, stats["vector_size"] = await embedding(batch, embedding_model, parser_config, title_vts=title_vts)
+            except Exception as e:
+                error_message = "Generate embedding error:{}".format(str(e))
+                progress_callback(-1, error_message)
+                logging.exception(error_message)
+                raise
+            stats["tokens"] += tk_count
+            for d in batch:
+                await send_channel.send(d)
+            report("embedded", len(batch))
+
+        # A few batches are in flight at once so that the scheduler can pack them into full model calls.
+        in_flight = trio.Semaphore(MAX_CONCURRENT_EMBEDDINGS * 2)
+
+        async def embed_released(batch):
+            try:
+                await embed_batch(batch)
+            finally:
+                in_flight.release()
+
+        async with receive_channel, send_channel, trio.open_nursery() as nursery:
+            batch = []
+            async for d in receive_channel:
+                batch.append(d)
+                if len(batch) >= EMBEDDING_BATCH_SIZE:
+                    await in_flight.acquire()
+                    nursery.start_soon(embed_released, batch)
+                    batch = []
+            if batch:
+                await in_flight.acquire()
+                nursery.start_soon(embed_released, batch)
+
+    async def insert_batch(batch):
+        await bulk_insert(batch, idxnm, task["kb_id"], progress_callback)
+        report("indexed", len(batch))
+
+    async def index(receive_channel):
+        async with receive_channel, trio.open_nursery() as nursery:
+            batch, batch_bytes = [], 0
+            async for d in receive_channel:
+                ck_bytes = chunk_bytes(d)
+                if batch and (len(batch) >= DOC_BULK_SIZE or batch_bytes + ck_bytes > DOC_BULK_BYTES):
+                    nursery.start_soon(insert_batch, batch)
+                    batch, batch_bytes = [], 0
+                batch.append(d)
+                batch_bytes += ck_bytes
+                chunk_ids.append(d["id"])
+            if batch:
+                nursery.start_soon(insert_batch, batch)
+
+    try:
+        async with trio.open_nursery() as nursery:
+            prepared_send, prepared_receive = trio.open_memory_channel(PIPELINE_CHANNEL_SIZE)
+            embedded_send, embedded_receive = trio.open_memory_channel(PIPELINE_CHANNEL_SIZE)
+            async with prepared_send:
+                for _ in range(MAX_CONCURRENT_MINIO):
+                    nursery.start_soon(prepare, prepared_send.clone())
+            nursery.start_soon(embed, prepared_receive, embedded_send)
+            nursery.start_soon(index, embedded_receive)
+    except BaseException:
+        # The chunk ids are only recorded at the end, so nothing else would clean up a partial index.
+        if chunk_ids:
+            with trio.CancelScope(shield=True):
+                await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"id": chunk_ids}, idxnm, task["kb_id"]))
+        raise
+    logging.info("Streamed doc({}) chunks({}) through chunk/embed/index in {:.2f}s".format(task["name"], total, timer() - st))
+
+    if not await commit_chunk_ids(task["id"], idxnm, task["kb_id"], chunk_ids):
+        return None
+    return len(set(chunk_ids)), stats["tokens"], stats["vector_size"]
+
+
 async def do_handle_task(task):
     task_id = task["id"]
     task_from_page = task["from_page"]
@@ -509,8 +775,7 @@ async def do_handle_task(task):
         progress_callback(-1, msg=error_message)
         raise Exception(error_message)
 
-    task_canceled = TaskService.do_cancel(task_id)
-    if task_canceled:
+    if cancel_listener.is_canceled(task_id):
         progress_callback(-1, msg="Task has been canceled.")
         return
 
@@ -547,6 +812,24 @@ async def do_handle_task(task):
         await run_graphrag(task, task_language, with_resolution, with_community, chat_model, embedding_model, progress_callback)
         progress_callback(prog=1.0, msg="Knowledge Graph done ({:.2f}s)".format(timer() - start_ts))
         return
+    elif STREAM_CHUNKS and not task["kb_parser_config"].get("tag_kb_ids", []):
+        # Standard chunking methods, with chunking, embedding and indexing overlapped
+        start_ts = timer()
+        streamed = await stream_chunks(task, embedding_model, progress_callback)
+        if streamed is None:
+            return
+        chunk_count, token_count, _ = streamed
+        if not chunk_count:
+            progress_callback(1., msg=f"No chunk built from {task_document_name}")
+            return
+        DocumentService.increment_chunk_num(task_doc_id, task_dataset_id, token_count, chunk_count, 0)
+        task_time_cost = timer() - task_start_ts
+        progress_callback(prog=1.0, msg="Indexing done ({:.2f}s). Task done ({:.2f}s)".format(timer() - start_ts, task_time_cost))
+        logging.info(
+            "Chunk doc({}), page({}-{}), chunks({}), token({}), elapsed:{:.2f}".format(task_document_name, task_from_page,
+                                                                                       task_to_page, chunk_count,
+                                                                                       token_count, task_time_cost))
+        return
     else:
         # Standard chunking methods
         start_ts = timer()
@@ -575,24 +858,8 @@ async def do_handle_task(task):
 
     chunk_count = len(set([chunk["id"] for chunk in chunks]))
     start_ts = timer()
-    doc_store_result = ""
-    es_bulk_size = 4
-    for b in range(0, len(chunks), es_bulk_size):
-        doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + es_bulk_size], search.index_name(task_tenant_id), task_dataset_id))
-        if b % 128 == 0:
-            progress_callback(prog=0.8 + 0.1 * (b + 1) / len(chunks), msg="")
-        if doc_store_result:
-            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
-            progress_callback(-1, msg=error_message)
-            raise Exception(error_message)
-        chunk_ids = [chunk["id"] for chunk in chunks[:b + es_bulk_size]]
-        chunk_ids_str = " ".join(chunk_ids)
-        try:
-            TaskService.update_chunk_ids(task["id"], chunk_ids_str)
-        except DoesNotExist:
-            logging.warning(f"do_handle_task update_chunk_ids failed since task {task['id']} is unknown.")
-            doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"id": chunk_ids}, search.index_name(task_tenant_id), task_dataset_id))
-            return
+    if not await insert_chunks(task_id, task_tenant_id, task_dataset_id, chunks, progress_callback):
+        return
     logging.info("Indexing doc({}), page({}-{}), chunks({}), elapsed: {:.2f}".format(task_document_name, task_from_page,
                                                                                      task_to_page, len(chunks),
                                                                                      timer() - start_ts))
@@ -608,18 +875,16 @@ async def do_handle_task(task):
                                                                                    token_count, task_time_cost))
 
 
-async def handle_task():
+async def handle_task(redis_msg, task):
     global DONE_TASKS, FAILED_TASKS
-    redis_msg, task = await collect()
-    if not task:
-        await trio.sleep(5)
-        return
     try:
         logging.info(f"handle_task begin for task {json.dumps(task)}")
         CURRENT_TASKS[task["id"]] = copy.deepcopy(task)
         await do_handle_task(task)
         DONE_TASKS += 1
         CURRENT_TASKS.pop(task["id"], None)
+        progress_reporter.flush()
+        cancel_listener.unwatch(task["id"])
         logging.info(f"handle_task done for task {json.dumps(task)}")
     except Exception as e:
         FAILED_TASKS += 1
@@ -632,6 +897,10 @@ async def handle_task():
             set_progress(task["id"], prog=-1, msg=f"[Exception]: {err_msg}")
         except Exception:
             pass
+        # The document failed, its sibling tasks in the other executors stop as well.
+        cancel_documents([task["doc_id"]])
+        progress_reporter.flush()
+        cancel_listener.unwatch(task["id"])
         logging.exception(f"handle_task got exception for task {json.dumps(task)}")
     redis_msg.ack()
 
@@ -658,6 +927,9 @@ async def report_status():
                 "done": DONE_TASKS,
                 "failed": FAILED_TASKS,
                 "current": current,
+                "embedding": embedding_scheduler.stats(),
+                "progress": progress_reporter.stats,
+                "queues": task_consumer.stats,
             })
             REDIS_CONN.zadd(CONSUMER_NAME, heartbeat, now.timestamp())
             logging.info(f"{CONSUMER_NAME} reported heartbeat: {heartbeat}")
@@ -713,10 +985,11 @@ def recover_pending_tasks():
             redis_lock.release()
             stop_event.wait(60)
         
-async def task_manager():
-    global task_limiter
-    async with task_limiter:
-        await handle_task()
+async def task_manager(limiter, token, redis_msg, task):
+    try:
+        await handle_task(redis_msg, task)
+    finally:
+        limiter.release_on_behalf_of(token)
 
 
 async def main():
@@ -745,8 +1018,14 @@ async def main():
     async with trio.open_nursery() as nursery:
         nursery.start_soon(report_status)
         while not stop_event.is_set():
-            nursery.start_soon(task_manager)
-            await trio.sleep(0.1)
+            # A slot is taken before reading so that no more messages are consumed than can be processed.
+            limiter, token = task_limiter, object()
+            await limiter.acquire_on_behalf_of(token)
+            redis_msg, task = await collect(limiter.available_tokens + 1)
+            if not task:
+                limiter.release_on_behalf_of(token)
+                continue
+            nursery.start_soon(task_manager, limiter, token, redis_msg, task)
     logging.error("BUG!!! You should not reach here!!!")
 
 if __name__ == "__main__":
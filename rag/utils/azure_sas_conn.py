@@ -60,6 +60,18 @@ class RAGFlowAzureSasBlob:
                 self.__open__()
                 time.sleep(1)
 
+    def put_stream(self, bucket, fnm, stream, size=-1):
+        """Upload a seekable file object block by block, without reading it into memory."""
+        for _ in range(3):
+            try:
+                stream.seek(0)
+                return self.conn.upload_blob(name=fnm, data=stream, length=size if size >= 0 else None,
+                                             max_single_put_size=settings.STORAGE_PART_SIZE, max_block_size=settings.STORAGE_PART_SIZE)
+            except Exception:
+                logging.exception(f"Fail put {bucket}/{fnm}")
+                self.__open__()
+                time.sleep(1)
+
     def rm(self, bucket, fnm):
         try:
             self.conn.delete_blob(fnm)
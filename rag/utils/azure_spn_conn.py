@@ -68,6 +68,25 @@ class RAGFlowAzureSpnBlob:
                 self.__open__()
                 time.sleep(1)
 
+    def put_stream(self, bucket, fnm, stream, size=-1):
+        """Upload a seekable file object by appending it part by part, without reading it into memory."""
+        for _ in range(3):
+            try:
+                stream.seek(0)
+                f = self.conn.create_file(fnm)
+                offset = 0
+                while True:
+                    part = stream.read(settings.STORAGE_PART_SIZE)
+                    if not part:
+                        break
+                    f.append_data(part, offset=offset, length=len(part))
+                    offset += len(part)
+                return f.flush_data(offset)
+            except Exception:
+                logging.exception(f"Fail put {bucket}/{fnm}")
+                self.__open__()
+                time.sleep(1)
+
     def rm(self, bucket, fnm):
         try:
             self.conn.delete_file(fnm)
@@ -0,0 +1,920 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import logging
+import re
+import json
+import math
+import os
+import shutil
+import threading
+from collections import defaultdict
+
+import copy
+import numpy as np
+from filelock import FileLock
+from rag import settings
+from rag.settings import TAG_FLD, PAGERANK_FLD
+from rag.utils import singleton, get_float
+from rag.utils.retrieval_cache import bumps_kb_version
+from rag.utils.doc_store_conn import DocStoreConnection, MatchExpr, OrderByExpr, MatchTextExpr, MatchDenseExpr, \
+    FusionExpr
+from rag.nlp import is_english
+
+logger = logging.getLogger('ragflow.embedded_conn')
+
+# Fields with an exact-value (keyword) index, used by filters, aggregations and `*_kwd` text matching.
+KEYWORD_FIELD = re.compile(r"^(.*_(kwd|id|ids|uid|uids|int|flt|fea)|uid|id)$")
+# Fields with an inverted index over whitespace separated tokens, see `tks`/`ltks` in conf/mapping.json.
+TEXT_FIELD = re.compile(r".*_l?tks$")
+VECTOR_FIELD = re.compile(r"^q_[0-9]+_vec$")
+
+QUERY_TOKEN = re.compile(
+    r'\s*(?:(?P<lp>\()|(?P<rp>\))|"(?P<phrase>(?:[^"\\]|\\.)*)"(?:~[0-9]+)?|(?P<term>(?:[^\s()"\\^~]|\\.)+)(?:~[0-9]*)?)'
+    r'(?:\^(?P<boost>[0-9]*\.?[0-9]+))?')
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_SIZE = 10
+# Attempts to load the current snapshot without the file lock while other processes compact the index.
+SNAPSHOT_LOAD_RETRIES = 3
+
+
+def _unescape(txt: str) -> str:
+    return re.sub(r"\\(.)", r"\1", txt)
+
+
+def _hashable_values(v) -> list:
+    if isinstance(v, list):
+        return [x for x in v if isinstance(x, (str, int, float, bool))]
+    if isinstance(v, (str, int, float, bool)):
+        return [v]
+    return []
+
+
+def parse_query_string(query: str) -> list:
+    """
+    Parse the subset of the Lucene query string syntax generated by FulltextQueryer into a tree of
+    ("term", text, boost), ("phrase", [tokens], boost) and ("group", [children], boost).
+    Operators (OR/AND) are ignored since every clause is a `should` clause, and phrase slop is
+    relaxed to "all tokens present in the field".
+    """
+    stack = [[]]
+    for m in QUERY_TOKEN.finditer(query):
+        boost = float(m.group("boost")) if m.group("boost") else 1.0
+        if m.group("lp"):
+            stack.append([])
+        elif m.group("rp"):
+            if len(stack) == 1:
+                continue
+            children = stack.pop()
+            if children:
+                stack[-1].append(("group", children, boost))
+        elif m.group("phrase") is not None:
+            tks = _unescape(m.group("phrase")).split()
+            if tks:
+                stack[-1].append(("phrase", tks, boost))
+        elif m.group("term"):
+            tk = _unescape(m.group("term"))
+            if tk in ["OR", "AND", "||", "&&"]:
+                continue
+            stack[-1].append(("term", tk, boost))
+    while len(stack) > 1:
+        children = stack.pop()
+        if children:
+            stack[-1].append(("group", children, 1.0))
+    return stack[0]
+
+
+def query_terms(nodes: list) -> set[str]:
+    terms = set()
+    for ty, v, _ in nodes:
+        if ty == "term":
+            terms.add(v)
+        elif ty == "phrase":
+            terms.update(v)
+        else:
+            terms.update(query_terms(v))
+    return terms
+
+
+class EmbeddedTable:
+    """
+    All the chunks of one index, i.e. one tenant.
+    Documents live in a slot array. Text fields have an inverted index of term frequencies,
+    keyword fields an exact-value index and every `q_N_vec` column a contiguous float32 matrix.
+    """
+
+    def __init__(self):
+        self.docs: list[dict | None] = []
+        self.slots: dict[str, int] = {}
+        self.free: list[int] = []
+        self.postings = defaultdict(lambda: defaultdict(dict))  # field -> term -> {slot: tf}
+        self.doc_lens = defaultdict(dict)  # field -> {slot: number of tokens}
+        self.total_lens = defaultdict(int)  # field -> sum of doc_lens
+        self.keywords = defaultdict(lambda: defaultdict(set))  # field -> value -> {slot}
+        self.vectors: dict[str, np.ndarray] = {}  # column -> (capacity, dim)
+        self.norms: dict[str, np.ndarray] = {}  # column -> (capacity,), 0 for missing rows
+
+    def __len__(self):
+        return len(self.slots)
+
+    def alive(self) -> set[int]:
+        return set(self.slots.values())
+
+    def upsert(self, d: dict):
+        chunk_id = d["id"]
+        if chunk_id in self.slots:
+            slot = self.slots[chunk_id]
+            self._unindex(slot)
+        elif self.free:
+            slot = self.free.pop()
+        else:
+            slot = len(self.docs)
+            self.docs.append(None)
+        self.slots[chunk_id] = slot
+        self._index(slot, d)
+
+    def remove(self, slot: int):
+        d = self.docs[slot]
+        self._unindex(slot)
+        del self.slots[d["id"]]
+        self.docs[slot] = None
+        self.free.append(slot)
+
+    def doc(self, slot: int, fields: list[str] | None = None) -> dict:
+        """
+        Return a copy of the stored document with its vectors, or only the given fields.
+        """
+        d = self.docs[slot]
+        if fields is None:
+            res = copy.deepcopy(d)
+            fields = list(self.vectors.keys())
+        else:
+            res = {k: copy.deepcopy(d[k]) for k in fields if k in d}
+            res["id"] = d["id"]
+        for col in fields:
+            if col in self.vectors and self.norms[col][slot] > 0:
+                res[col] = self.vectors[col][slot].tolist()
+        return res
+
+    def _index(self, slot: int, d: dict):
+        d = copy.deepcopy(d)
+        for k in list(d.keys()):
+            v = d[k]
+            if VECTOR_FIELD.match(k):
+                self._set_vector(k, slot, d.pop(k))
+            elif TEXT_FIELD.match(k) and isinstance(v, str):
+                tf = defaultdict(int)
+                tks = v.split()
+                for t in tks:
+                    tf[t] += 1
+                for t, c in tf.items():
+                    self.postings[k][t][slot] = c
+                self.doc_lens[k][slot] = len(tks)
+                self.total_lens[k] += len(tks)
+            elif KEYWORD_FIELD.match(k):
+                for x in _hashable_values(v):
+                    self.keywords[k][x].add(slot)
+        self.docs[slot] = d
+
+    def _unindex(self, slot: int):
+        d = self.docs[slot]
+        for k, v in d.items():
+            if TEXT_FIELD.match(k) and isinstance(v, str):
+                for t in set(v.split()):
+                    pst = self.postings[k].get(t)
+                    if pst is None:
+                        continue
+                    pst.pop(slot, None)
+                    if not pst:
+                        del self.postings[k][t]
+                self.total_lens[k] -= self.doc_lens[k].pop(slot, 0)
+            elif KEYWORD_FIELD.match(k):
+                for x in _hashable_values(v):
+                    pst = self.keywords[k].get(x)
+                    if pst is None:
+                        continue
+                    pst.discard(slot)
+                    if not pst:
+                        del self.keywords[k][x]
+        for col in self.norms.keys():
+            if slot < len(self.norms[col]):
+                self.norms[col][slot] = 0
+
+    def _set_vector(self, col: str, slot: int, v):
+        v = np.asarray(v if not isinstance(v, str) else [get_float(x) for x in v.split("\t")], dtype=np.float32)
+        if col not in self.vectors:
+            self.vectors[col] = np.zeros((max(64, slot + 1), len(v)), dtype=np.float32)
+            self.norms[col] = np.zeros((max(64, slot + 1),), dtype=np.float32)
+        mtx = self.vectors[col]
+        if slot >= mtx.shape[0]:
+            capacity = max(slot + 1, mtx.shape[0] * 2)
+            grown = np.zeros((capacity, mtx.shape[1]), dtype=np.float32)
+            grown[:mtx.shape[0]] = mtx
+            norms = np.zeros((capacity,), dtype=np.float32)
+            norms[:mtx.shape[0]] = self.norms[col]
+            self.vectors[col], self.norms[col] = grown, norms
+        elif not self.vectors[col].flags.writeable:
+            self.vectors[col] = np.array(self.vectors[col])
+            self.norms[col] = np.array(self.norms[col])
+        self.vectors[col][slot] = v
+        self.norms[col][slot] = float(np.linalg.norm(v)) or 1e-12
+
+    """
+    Filters
+    """
+
+    def _field_values(self, slot: int, field: str) -> list:
+        v = self.docs[slot].get(field)
+        if v is None:
+            return []
+        return v if isinstance(v, list) else [v]
+
+    def _matching(self, field: str, values: list, candidates: set[int]) -> set[int]:
+        if field in self.keywords or KEYWORD_FIELD.match(field):
+            res = set()
+            for v in values:
+                res |= self.keywords[field].get(v, set())
+            return candidates & res
+        values = set(_hashable_values(values))
+        return {s for s in candidates if values & set(_hashable_values(self._field_values(s, field)))}
+
+    def _exists(self, field: str, candidates: set[int]) -> set[int]:
+        if VECTOR_FIELD.match(field):
+            norms = self.norms.get(field)
+            return {s for s in candidates if norms is not None and s < len(norms) and norms[s] > 0}
+        return {s for s in candidates if self.docs[s].get(field) is not None}
+
+    def filter(self, condition: dict, for_search: bool = False) -> set[int]:
+        """
+        Conjunctive equivalent filtering with the same semantics as ESConnection.
+        """
+        res = self.alive()
+        for k, v in condition.items():
+            if for_search and k == "available_int":
+                unavailable = {s for s in res if get_float(self.docs[s].get("available_int", 1)) < 1}
+                res = unavailable if v == 0 else res - unavailable
+                continue
+            if k == "exists":
+                res = self._exists(v, res)
+                continue
+            if k == "must_not":
+                if isinstance(v, dict) and "exists" in v:
+                    res = res - self._exists(v["exists"], res)
+                continue
+            if not v:
+                continue
+            if isinstance(v, list):
+                res = self._matching(k, v, res)
+            elif isinstance(v, str) or isinstance(v, int):
+                res = self._matching(k, [v], res)
+            else:
+                raise Exception(
+                    f"Condition `{str(k)}={str(v)}` value type is {str(type(v))}, expected to be int, str or list.")
+        return res
+
+    """
+    Scoring
+    """
+
+    def _term_scores(self, field: str, term: str) -> dict[int, float]:
+        if not TEXT_FIELD.match(field):
+            return {s: 1.0 for s in self.keywords.get(field, {}).get(term, set())}
+        pst = self.postings.get(field, {}).get(term)
+        if not pst:
+            return {}
+        n = len(self.doc_lens[field])
+        df = len(pst)
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        if field.endswith("_ltks"):
+            avgdl = self.total_lens[field] / max(n, 1)
+            dls = self.doc_lens[field]
+            return {s: idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dls[s] / max(avgdl, 1e-6)))
+                    for s, tf in pst.items()}
+        # scripted_sim of `*_tks`: normalized idf, term frequency saturated at 1
+        idf /= math.log(1 + ((n - 0.5) / 1.5))
+        return {s: idf for s in pst.keys()}
+
+    def _node_scores(self, node, fields: list[tuple[str, float]]) -> dict[int, float]:
+        ty, v, boost = node
+        res = {}
+        if ty == "group":
+            for child in v:
+                for s, sc in self._node_scores(child, fields).items():
+                    res[s] = res.get(s, 0) + sc
+        else:
+            # best_fields: the best matching field wins
+            for fld, fboost in fields:
+                if ty == "term":
+                    scores = self._term_scores(fld, v)
+                elif not TEXT_FIELD.match(fld):
+                    scores = self._term_scores(fld, " ".join(v))
+                else:
+                    scores = None
+                    for tk in v:
+                        tk_scores = self._term_scores(fld, tk)
+                        if scores is None:
+                            scores = tk_scores
+                        else:
+                            scores = {s: sc + tk_scores[s] for s, sc in scores.items() if s in tk_scores}
+                        if not scores:
+                            break
+                for s, sc in (scores or {}).items():
+                    if sc * fboost > res.get(s, 0):
+                        res[s] = sc * fboost
+        if boost != 1.0:
+            res = {s: sc * boost for s, sc in res.items()}
+        return res
+
+    def match_text(self, m: MatchTextExpr, candidates: set[int]) -> tuple[dict[int, float], set[str]]:
+        fields = []
+        for f in m.fields:
+            f, _, boost = f.partition("^")
+            fields.append((f, float(boost) if boost else 1.0))
+        clauses = parse_query_string(m.matching_text)
+        msm = m.extra_options.get("minimum_should_match", 0.0)
+        if isinstance(msm, str):
+            msm = float(msm.rstrip("%")) / 100 if msm.endswith("%") else int(msm)
+        if isinstance(msm, float):
+            msm = int(len(clauses) * msm)
+
+        scores, hits = {}, defaultdict(int)
+        for clause in clauses:
+            for s, sc in self._node_scores(clause, fields).items():
+                if s not in candidates or sc <= 0:
+                    continue
+                scores[s] = scores.get(s, 0) + sc
+                hits[s] += 1
+        if msm > 0:
+            scores = {s: sc for s, sc in scores.items() if hits[s] >= msm}
+        return scores, query_terms(clauses)
+
+    def match_dense(self, m: MatchDenseExpr, candidates: set[int]) -> dict[int, float]:
+        """
+        Brute force cosine similarity over the vector matrix, scored like Elasticsearch's knn: (1 + cosine) / 2.
+        """
+        col = m.vector_column_name
+        if col not in self.vectors or not candidates:
+            return {}
+        q = np.asarray(m.embedding_data, dtype=np.float32)
+        slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        slots = slots[slots < self.vectors[col].shape[0]]
+        norms = self.norms[col][slots]
+        slots, norms = slots[norms > 0], norms[norms > 0]
+        if not len(slots):
+            return {}
+        cos = (self.vectors[col][slots] @ q) / (norms * (np.linalg.norm(q) or 1e-12))
+        similarity = get_float(m.extra_options.get("similarity", 0.0))
+        keep = cos >= similarity
+        slots, cos = slots[keep], cos[keep]
+        if len(slots) > m.topn:
+            top = np.argpartition(-cos, m.topn - 1)[:m.topn]
+            slots, cos = slots[top], cos[top]
+        return {int(s): float(1 + c) / 2 for s, c in zip(slots, cos)}
+
+    def rank_feature_score(self, slot: int, rank_feature: dict) -> float:
+        d = self.docs[slot]
+        sc = 0.0
+        for fld, boost in rank_feature.items():
+            if fld == PAGERANK_FLD:
+                v = d.get(PAGERANK_FLD, 0)
+            else:
+                v = (d.get(TAG_FLD) or {}).get(fld, 0)
+            sc += boost * get_float(v) if v else 0
+        return sc
+
+    def sort_key(self, slot: int, field: str):
+        v = self.docs[slot].get(field)
+        if isinstance(v, list):
+            v = [get_float(x) for x in v if isinstance(x, (int, float, str))]
+            v = sum(v) / len(v) if v else None
+        elif field.endswith("_int") or field.endswith("_flt"):
+            v = get_float(v) if v is not None else None
+        return v
+
+    def highlight(self, slot: int, fields: list[str], terms: set[str]) -> dict:
+        res = {}
+        for fld in fields:
+            txt = self.docs[slot].get(fld)
+            if not isinstance(txt, str):
+                continue
+            tks = txt.split()
+            if not any(t in terms for t in tks):
+                continue
+            res[fld] = [" ".join(f"<em>{t}</em>" if t in terms else t for t in tks)]
+        return res
+
+
+@singleton
+class EmbeddedConnection(DocStoreConnection):
+    """
+    In-process document engine for single node and edge deployments.
+
+    Tables are kept in memory. When `embedded.path` is configured every index is persisted
+    under `<path>/<indexName>/` as a snapshot (documents in JSON, one memory-mapped `.npy`
+    matrix per vector column) plus an append-only log of the operations applied since.
+    Processes sharing the directory, i.e. the API server and the task executors, replay the
+    log tail before every request and serialize their writes with a file lock.
+    """
+
+    def __init__(self):
+        self.path = settings.EMBEDDED.get("path", "")
+        self.compact_ops = int(settings.EMBEDDED.get("compact_ops", 1000))
+        self.tables: dict[str, EmbeddedTable] = {}
+        self.states: dict[str, dict] = {}  # indexName -> {"gen", "offset", "ops"}
+        self.lock = threading.RLock()
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+        logger.info(f"Use embedded doc engine at {self.path or 'memory'}.")
+
+    """
+    Persistence
+    """
+
+    def _dir(self, indexName: str) -> str:
+        return os.path.join(self.path, indexName)
+
+    def _file_lock(self, indexName: str) -> FileLock:
+        os.makedirs(self._dir(indexName), exist_ok=True)
+        return FileLock(os.path.join(self._dir(indexName), ".lock"))
+
+    def _current_gen(self, indexName: str) -> int:
+        try:
+            with open(os.path.join(self._dir(indexName), "CURRENT"), "r") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _load_snapshot(self, indexName: str, gen: int) -> EmbeddedTable:
+        """
+        Raise FileNotFoundError if the files of `gen` have been compacted away.
+        """
+        tbl = EmbeddedTable()
+        if gen == 0:
+            # Nothing has been compacted yet, the whole index is in the log.
+            return tbl
+        fnm = os.path.join(self._dir(indexName), f"snapshot.{gen}.json")
+        with open(fnm, "r") as f:
+            snapshot = json.load(f)
+        for slot, d in enumerate(snapshot["docs"]):
+            tbl.docs.append(None)
+            if d is None:
+                tbl.free.append(slot)
+                continue
+            tbl.slots[d["id"]] = slot
+            tbl._index(slot, d)
+        for col in snapshot["vectors"]:
+            mtx = np.load(os.path.join(self._dir(indexName), f"{col}.{gen}.npy"), mmap_mode="r")
+            tbl.vectors[col] = mtx
+            tbl.norms[col] = np.linalg.norm(mtx, axis=1).astype(np.float32)
+            tbl.norms[col][[s for s, d in enumerate(tbl.docs) if d is None and s < len(mtx)]] = 0
+        return tbl
+
+    def _load_current(self, indexName: str, gen: int) -> tuple[EmbeddedTable | None, int]:
+        """
+        Load the snapshot of generation `gen`, or None if the index has been deleted.
+        Another process may compact the index meanwhile and delete the files of `gen`: CURRENT is read
+        again and the newer generation loaded, at last under the file lock which compactions hold.
+        """
+        for _ in range(SNAPSHOT_LOAD_RETRIES):
+            try:
+                return self._load_snapshot(indexName, gen), gen
+            except FileNotFoundError:
+                if not os.path.isdir(self._dir(indexName)):
+                    return None, gen
+                gen = self._current_gen(indexName)
+        with self._file_lock(indexName):
+            gen = self._current_gen(indexName)
+            return self._load_snapshot(indexName, gen), gen
+
+    def _refresh(self, indexName: str):
+        """
+        Bring the in-memory table up to date with the files written by this or other processes.
+        """
+        if not self.path:
+            return
+        with self.lock:
+            tbl = None
+            gen = self._current_gen(indexName)
+            state = self.states.get(indexName)
+            if os.path.isdir(self._dir(indexName)):
+                if state is not None and state["gen"] == gen:
+                    tbl = self.tables.get(indexName)
+                else:
+                    tbl, gen = self._load_current(indexName, gen)
+            if tbl is None:
+                self.tables.pop(indexName, None)
+                self.states.pop(indexName, None)
+                return
+            if state is None or state["gen"] != gen:
+                self.tables[indexName] = tbl
+                state = self.states[indexName] = {"gen": gen, "offset": 0, "ops": 0}
+            wal = os.path.join(self._dir(indexName), f"wal.{gen}.jsonl")
+            try:
+                if os.path.getsize(wal) <= state["offset"]:
+                    return
+                f = open(wal, "r")
+            except FileNotFoundError:
+                # Nothing logged yet, or compacted meanwhile: the next refresh loads the new generation.
+                return
+            with f:
+                f.seek(state["offset"])
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    self._apply(indexName, json.loads(line))
+                    state["offset"] += len(line.encode("utf-8"))
+                    state["ops"] += 1
+
+    def _append(self, indexName: str, op: dict):
+        if not self.path:
+            return
+        state = self.states.setdefault(indexName, {"gen": self._current_gen(indexName), "offset": 0, "ops": 0})
+        line = json.dumps(op, ensure_ascii=False, default=lambda o: o.tolist() if hasattr(o, "tolist") else str(o)) + "\n"
+        with open(os.path.join(self._dir(indexName), f"wal.{state['gen']}.jsonl"), "a") as f:
+            f.write(line)
+        state["offset"] += len(line.encode("utf-8"))
+        state["ops"] += 1
+        if state["ops"] >= self.compact_ops:
+            self._compact(indexName)
+
+    def _compact(self, indexName: str):
+        tbl = self.tables[indexName]
+        state = self.states[indexName]
+        gen = state["gen"] + 1
+        d = self._dir(indexName)
+        for col, mtx in tbl.vectors.items():
+            mtx = np.array(mtx[:len(tbl.docs)])
+            mtx[tbl.norms[col][:len(mtx)] == 0] = 0
+            np.save(os.path.join(d, f"{col}.{gen}.npy"), mtx)
+        with open(os.path.join(d, f"snapshot.{gen}.json"), "w") as f:
+            json.dump({"docs": tbl.docs, "vectors": list(tbl.vectors.keys())}, f, ensure_ascii=False)
+        with open(os.path.join(d, "CURRENT.tmp"), "w") as f:
+            f.write(str(gen))
+        os.replace(os.path.join(d, "CURRENT.tmp"), os.path.join(d, "CURRENT"))
+        for fnm in os.listdir(d):
+            if re.match(r".*\.([0-9]+)\.(json|jsonl|npy)$", fnm) and not fnm.split(".")[-2] == str(gen):
+                os.remove(os.path.join(d, fnm))
+        self.states[indexName] = {"gen": gen, "offset": 0, "ops": 0}
+        self.tables[indexName] = self._load_snapshot(indexName, gen)
+        logger.info(f"EmbeddedConnection compacted {indexName} into generation {gen}.")
+
+    def _write(self, indexName: str, op: dict, create: bool = False):
+        with self.lock:
+            if not self.path:
+                if indexName not in self.tables and not create:
+                    return None
+                self.tables.setdefault(indexName, EmbeddedTable())
+                return self._apply(indexName, op)
+            if not create and not os.path.isdir(self._dir(indexName)):
+                return None
+            with self._file_lock(indexName):
+                self._refresh(indexName)
+                self.tables.setdefault(indexName, EmbeddedTable())
+                res = self._apply(indexName, op)
+                self._append(indexName, op)
+                return res
+
+    def _table(self, indexName: str) -> EmbeddedTable | None:
+        with self.lock:
+            self._refresh(indexName)
+            return self.tables.get(indexName)
+
+    def _apply(self, indexName: str, op: dict):
+        tbl = self.tables.setdefault(indexName, EmbeddedTable())
+        if op["op"] == "insert":
+            for d in op["docs"]:
+                tbl.upsert(d)
+            return []
+        if op["op"] == "update":
+            return self._apply_update(tbl, op["condition"], op["value"])
+        if op["op"] == "delete":
+            return self._apply_delete(tbl, op["condition"])
+        raise ValueError(f"Unknown operation {op['op']}")
+
+    """
+    Database operations
+    """
+
+    def dbType(self) -> str:
+        return "embedded"
+
+    def health(self) -> dict:
+        with self.lock:
+            return {
+                "type": "embedded",
+                "status": "green",
+                "path": self.path,
+                "indices": len(self.tables),
+                "chunks": sum(len(t) for t in self.tables.values()),
+            }
+
+    """
+    Table operations
+    """
+
+    def createIdx(self, indexName: str, knowledgebaseId: str, vectorSize: int):
+        with self.lock:
+            if self.path:
+                os.makedirs(self._dir(indexName), exist_ok=True)
+            self.tables.setdefault(indexName, EmbeddedTable())
+        return True
+
+    def deleteIdx(self, indexName: str, knowledgebaseId: str):
+        if len(knowledgebaseId) > 0:
+            # The index need to be alive after any kb deletion since all kb under this tenant are in one index.
+            return
+        with self.lock:
+            self.tables.pop(indexName, None)
+            self.states.pop(indexName, None)
+            if self.path and os.path.isdir(self._dir(indexName)):
+                shutil.rmtree(self._dir(indexName), ignore_errors=True)
+
+    def indexExist(self, indexName: str, knowledgebaseId: str = None) -> bool:
+        with self.lock:
+            if self.path:
+                return os.path.isdir(self._dir(indexName))
+            return indexName in self.tables
+
+    """
+    CRUD operations
+    """
+
+    def search(
+            self, selectFields: list[str],
+            highlightFields: list[str],
+            condition: dict,
+            matchExprs: list[MatchExpr],
+            orderBy: OrderByExpr,
+            offset: int,
+            limit: int,
+            indexNames: str | list[str],
+            knowledgebaseIds: list[str],
+            aggFields: list[str] = [],
+            rank_feature: dict | None = None
+    ):
+        """
+        Return an Elasticsearch-like response so that the result helpers behave like ESConnection's.
+        """
+        if isinstance(indexNames, str):
+            indexNames = indexNames.split(",")
+        assert isinstance(indexNames, list) and len(indexNames) > 0
+        assert "_id" not in condition
+        condition = dict(condition)
+        condition["kb_id"] = knowledgebaseIds
+
+        weights = None
+        for m in matchExprs:
+            if isinstance(m, FusionExpr) and m.method == "weighted_sum" and "weights" in (m.fusion_params or {}):
+                weights = [get_float(w) for w in m.fusion_params["weights"].split(",")]
+
+        hits = []
+        aggs = {fld: defaultdict(int) for fld in aggFields}
+        with self.lock:
+            for indexName in indexNames:
+                tbl = self._table(indexName)
+                if tbl is None:
+                    continue
+                candidates = tbl.filter(condition, for_search=True)
+                text_scores, dense_scores, terms = None, None, set()
+                for m in matchExprs:
+                    if isinstance(m, MatchTextExpr):
+                        text_scores, terms = tbl.match_text(m, candidates)
+                        # Like the other engines, the dense match is filtered by the full text match.
+                        candidates = set(text_scores.keys())
+                for m in matchExprs:
+                    if isinstance(m, MatchDenseExpr):
+                        dense_scores = tbl.match_dense(m, candidates)
+
+                if text_scores is not None and dense_scores is not None:
+                    tw, vw = weights if weights and len(weights) == 2 else (0.5, 0.5)
+                    mx = max(text_scores.values(), default=0) or 1
+                    scores = {s: tw * sc / mx + vw * dense_scores.get(s, 0) for s, sc in text_scores.items()}
+                elif text_scores is not None:
+                    scores = text_scores
+                elif dense_scores is not None:
+                    scores = dense_scores
+                else:
+                    scores = {s: 1.0 for s in candidates}
+                if matchExprs and rank_feature:
+                    scores = {s: sc + tbl.rank_feature_score(s, rank_feature) for s, sc in scores.items()}
+
+                for s in scores.keys():
+                    for fld in aggFields:
+                        for v in _hashable_values(tbl.docs[s].get(fld)):
+                            aggs[fld][v] += 1
+                hits.extend((indexName, tbl, s, sc, terms) for s, sc in scores.items())
+
+            hits.sort(key=lambda h: h[2])
+            if orderBy and orderBy.fields:
+                for field, order in reversed(orderBy.fields):
+                    # Documents missing the field always go last.
+                    keys = [h[1].sort_key(h[2], field) for h in hits]
+                    present = sorted([(k, h) for k, h in zip(keys, hits) if k is not None],
+                                     key=lambda x: x[0], reverse=order == 1)
+                    hits = [h for _, h in present] + [h for k, h in zip(keys, hits) if k is None]
+            elif matchExprs:
+                hits.sort(key=lambda h: h[3] * -1)
+            total = len(hits)
+            hits = hits[offset:offset + (limit if limit > 0 else DEFAULT_SIZE)]
+
+            res_hits = []
+            fields = [f for f in selectFields if f not in ["_score", "id"]] if selectFields else None
+            for indexName, tbl, s, sc, terms in hits:
+                h = {"_index": indexName, "_id": tbl.docs[s]["id"], "_score": sc, "_source": tbl.doc(s, fields)}
+                h["_source"].pop("id", None)
+                if highlightFields and terms:
+                    hl = tbl.highlight(s, highlightFields, terms)
+                    if hl:
+                        h["highlight"] = hl
+                res_hits.append(h)
+
+        res = {"timed_out": False, "hits": {"total": {"value": total, "relation": "eq"}, "hits": res_hits}}
+        if aggFields:
+            res["aggregations"] = {
+                f"aggs_{fld}": {"buckets": [{"key": k, "doc_count": c} for k, c in
+                                            sorted(cnt.items(), key=lambda x: (x[1] * -1, str(x[0])))]}
+                for fld, cnt in aggs.items()}
+        logger.debug(f"EmbeddedConnection.search {str(indexNames)} total: {total}")
+        return res
+
+    def get(self, chunkId: str, indexName: str, knowledgebaseIds: list[str]) -> dict | None:
+        with self.lock:
+            tbl = self._table(indexName)
+            if tbl is None or chunkId not in tbl.slots:
+                return None
+            return tbl.doc(tbl.slots[chunkId])
+
+    @bumps_kb_version
+    def insert(self, documents: list[dict], indexName: str, knowledgebaseId: str = None) -> list[str]:
+        docs = []
+        for d in documents:
+            assert "_id" not in d
+            assert "id" in d
+            d_copy = copy.deepcopy(d)
+            d_copy["kb_id"] = knowledgebaseId
+            docs.append(d_copy)
+        try:
+            self._write(indexName, {"op": "insert", "docs": docs}, create=True)
+        except Exception as e:
+            logger.exception("EmbeddedConnection.insert got exception")
+            return [str(e)]
+        return []
+
+    @bumps_kb_version
+    def update(self, condition: dict, newValue: dict, indexName: str, knowledgebaseId: str) -> bool:
+        condition = dict(condition)
+        condition["kb_id"] = knowledgebaseId
+        newValue = copy.deepcopy(newValue)
+        newValue.pop("id", None)
+        try:
+            return bool(self._write(indexName, {"op": "update", "condition": condition, "value": newValue}))
+        except Exception:
+            logger.exception(f"EmbeddedConnection.update(index={indexName}, condition={json.dumps(condition, ensure_ascii=False)}) got exception")
+            return False
+
+    def _apply_update(self, tbl: EmbeddedTable, condition: dict, newValue: dict) -> bool:
+        if "id" in condition and isinstance(condition["id"], str):
+            # update specific single document
+            slot = tbl.slots.get(condition["id"])
+            if slot is None:
+                return False
+            slots = [slot]
+        else:
+            slots = tbl.filter({k: v for k, v in condition.items() if isinstance(k, str)})
+        for slot in slots:
+            d = tbl.doc(slot)
+            for k, v in newValue.items():
+                if k == "remove":
+                    if isinstance(v, str):
+                        d.pop(v, None)
+                    elif isinstance(v, dict):
+                        for kk, vv in v.items():
+                            if isinstance(d.get(kk), list) and vv in d[kk]:
+                                d[kk].remove(vv)
+                    continue
+                if k == "add":
+                    if isinstance(v, dict):
+                        for kk, vv in v.items():
+                            d.setdefault(kk, [])
+                            if not isinstance(d[kk], list):
+                                d[kk] = [d[kk]]
+                            d[kk].append(vv.strip())
+                    continue
+                if not v and k != "available_int":
+                    continue
+                d[k] = v
+            tbl.upsert(d)
+        return True
+
+    @bumps_kb_version
+    def delete(self, condition: dict, indexName: str, knowledgebaseId: str) -> int:
+        assert "_id" not in condition
+        condition = dict(condition)
+        condition["kb_id"] = knowledgebaseId
+        try:
+            return self._write(indexName, {"op": "delete", "condition": condition}) or 0
+        except Exception:
+            logger.exception("EmbeddedConnection.delete got exception")
+            return 0
+
+    def _apply_delete(self, tbl: EmbeddedTable, condition: dict) -> int:
+        if "id" in condition:
+            chunk_ids = condition["id"]
+            if not isinstance(chunk_ids, list):
+                chunk_ids = [chunk_ids]
+            slots = tbl.filter({"kb_id": condition["kb_id"]})
+            if chunk_ids:  # when chunk_ids is empty, delete all
+                slots &= {tbl.slots[i] for i in chunk_ids if i in tbl.slots}
+        else:
+            slots = tbl.filter(condition)
+        for slot in slots:
+            tbl.remove(slot)
+        return len(slots)
+
+    """
+    Helper functions for search result
+    """
+
+    def getTotal(self, res):
+        return res["hits"]["total"]["value"]
+
+    def getChunkIds(self, res):
+        return [d["_id"] for d in res["hits"]["hits"]]
+
+    def __getSource(self, res):
+        rr = []
+        for d in res["hits"]["hits"]:
+            d["_source"]["id"] = d["_id"]
+            d["_source"]["_score"] = d["_score"]
+            rr.append(d["_source"])
+        return rr
+
+    def getFields(self, res, fields: list[str]) -> dict[str, dict]:
+        res_fields = {}
+        if not fields:
+            return {}
+        for d in self.__getSource(res):
+            m = {n: d.get(n) for n in fields if d.get(n) is not None}
+            for n, v in m.items():
+                if isinstance(v, list):
+                    continue
+                if not isinstance(v, str):
+                    m[n] = str(m[n])
+            if m:
+                res_fields[d["id"]] = m
+        return res_fields
+
+    def getHighlight(self, res, keywords: list[str], fieldnm: str):
+        ans = {}
+        for d in res["hits"]["hits"]:
+            hlts = d.get("highlight")
+            if not hlts:
+                continue
+            txt = "...".join([a for a in list(hlts.items())[0][1]])
+            if not is_english(txt.split()):
+                ans[d["_id"]] = txt
+                continue
+
+            txt = d["_source"].get(fieldnm, "")
+            txt = re.sub(r"[\r\n]", " ", txt, flags=re.IGNORECASE | re.MULTILINE)
+            txts = []
+            for t in re.split(r"[.?!;\n]", txt):
+                for w in keywords:
+                    t = re.sub(r"(^|[ .?/'\"\(\)!,:;-])(%s)([ .?/'\"\(\)!,:;-])" % re.escape(w), r"\1<em>\2</em>\3", t,
+                               flags=re.IGNORECASE | re.MULTILINE)
+                if not re.search(r"<em>[^<>]+</em>", t, flags=re.IGNORECASE | re.MULTILINE):
+                    continue
+                txts.append(t)
+            ans[d["_id"]] = "...".join(txts) if txts else txt
+
+        return ans
+
+    def getAggregation(self, res, fieldnm: str):
+        agg_field = "aggs_" + fieldnm
+        if "aggregations" not in res or agg_field not in res["aggregations"]:
+            return list()
+        bkts = res["aggregations"][agg_field]["buckets"]
+        return [(b["key"], b["doc_count"]) for b in bkts]
+
+    """
+    SQL
+    """
+
+    def sql(self, sql: str, fetch_size: int, format: str):
+        logger.warning("EmbeddedConnection.sql: SQL is not supported by the embedded doc engine.")
+        return None
@@ -0,0 +1,94 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import re
+import threading
+
+import numpy as np
+import xxhash
+from cachetools import LRUCache
+
+from rag.utils.redis_conn import REDIS_CONN
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 4096))
+QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", 24 * 3600))
+QUERY_EMBEDDING_CACHE_REDIS = os.environ.get("QUERY_EMBEDDING_CACHE_REDIS", "1").lower() in ["1", "true", "yes"]
+
+
+def normalize_query(txt):
+    return re.sub(r"\s+", " ", str(txt)).strip()
+
+
+class QueryEmbeddingCache:
+    """
+    Two tier cache of query vectors keyed by embedding model and normalized query text:
+    an in-process LRU in front of an optional Redis tier storing the raw float32 bytes.
+    """
+
+    def __init__(self, maxsize=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL, use_redis=QUERY_EMBEDDING_CACHE_REDIS):
+        self.lru = LRUCache(maxsize=maxsize)
+        self.ttl = ttl
+        self.use_redis = use_redis
+        self.lock = threading.Lock()
+        self.stats = {"lru_hits": 0, "redis_hits": 0, "misses": 0}
+
+    @staticmethod
+    def redis_key(model, txt):
+        hasher = xxhash.xxh64()
+        hasher.update(str(model).encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(txt.encode("utf-8"))
+        return "qemb:" + hasher.hexdigest()
+
+    def get(self, model, txt):
+        txt = normalize_query(txt)
+        with self.lock:
+            vec = self.lru.get((model, txt))
+            if vec is not None:
+                self.stats["lru_hits"] += 1
+                return vec.copy()
+        if self.use_redis and REDIS_CONN.is_alive():
+            bin = REDIS_CONN.get_bytes(self.redis_key(model, txt))
+            if bin:
+                vec = np.frombuffer(bin, dtype=np.float32)
+                with self.lock:
+                    self.stats["redis_hits"] += 1
+                    self.lru[(model, txt)] = vec
+                return vec.copy()
+        with self.lock:
+            self.stats["misses"] += 1
+
+    def put(self, model, txt, vec):
+        txt = normalize_query(txt)
+        vec = np.asarray(vec)
+        if vec.ndim != 1:
+            return
+        with self.lock:
+            self.lru[(model, txt)] = vec.copy()
+        if self.use_redis and REDIS_CONN.is_alive():
+            REDIS_CONN.set(self.redis_key(model, txt), vec.astype(np.float32).tobytes(), self.ttl)
+
+    def info(self):
+        with self.lock:
+            res = dict(self.stats)
+            res["size"] = len(self.lru)
+        total = res["lru_hits"] + res["redis_hits"] + res["misses"]
+        res["hit_rate"] = (res["lru_hits"] + res["redis_hits"]) / total if total else 0.
+        return res
+
+
+query_embedding_cache = QueryEmbeddingCache()
@@ -76,6 +76,21 @@ class RAGFlowMinio:
                 self.__open__()
                 time.sleep(1)
 
+    def put_stream(self, bucket, fnm, stream, size=-1):
+        """Upload a seekable file object as a multipart upload, without reading it into memory."""
+        for _ in range(3):
+            try:
+                if not self.conn.bucket_exists(bucket):
+                    self.conn.make_bucket(bucket)
+
+                stream.seek(0)
+                r = self.conn.put_object(bucket, fnm, stream, size, part_size=settings.STORAGE_PART_SIZE)
+                return r
+            except Exception:
+                logging.exception(f"Fail to put {bucket}/{fnm}:")
+                self.__open__()
+                time.sleep(1)
+
     def rm(self, bucket, fnm):
         try:
             self.conn.remove_object(bucket, fnm)
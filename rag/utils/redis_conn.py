@@ -46,6 +46,13 @@ class RedisMsg:
     def get_msg_id(self):
         return self.__msg_id
 
+    def get_queue_name(self):
+        return self.__queue_name
+
+    def get_enqueue_time(self):
+        """Seconds since the epoch at which the message was added, taken from its stream id."""
+        return int(str(self.__msg_id).split("-")[0]) / 1000.
+
 
 @singleton
 class RedisDB:
@@ -62,6 +69,7 @@ class RedisDB:
     def __init__(self):
         self.REDIS = None
         self.config = settings.REDIS
+        self.__groups = set()
         self.__open__()
 
     def register_scripts(self) -> None:
@@ -112,6 +120,16 @@ class RedisDB:
             logging.warning("RedisDB.get " + str(k) + " got exception: " + str(e))
             self.__open__()
 
+    def get_bytes(self, k):
+        """GET without decoding the reply, for binary values."""
+        if not self.REDIS:
+            return
+        try:
+            return self.REDIS.execute_command("GET", k, NEVER_DECODE=True)
+        except Exception as e:
+            logging.warning("RedisDB.get_bytes " + str(k) + " got exception: " + str(e))
+            self.__open__()
+
     def set_obj(self, k, obj, exp=3600):
         try:
             self.REDIS.set(k, json.dumps(obj, ensure_ascii=False), exp)
@@ -130,6 +148,48 @@ class RedisDB:
             self.__open__()
         return False
 
+    def incr(self, key: str):
+        try:
+            return self.REDIS.incr(key)
+        except Exception as e:
+            logging.warning("RedisDB.incr " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return None
+
+    def mget(self, keys: list[str]):
+        try:
+            return self.REDIS.mget(keys)
+        except Exception as e:
+            logging.warning("RedisDB.mget " + str(keys[:3]) + " got exception: " + str(e))
+            self.__open__()
+        return None
+
+    def mget_bytes(self, keys: list[str]):
+        """MGET without decoding the replies, for binary values."""
+        if not keys:
+            return []
+        try:
+            return self.REDIS.execute_command("MGET", *keys, NEVER_DECODE=True)
+        except Exception as e:
+            logging.warning("RedisDB.mget_bytes " + str(keys[:3]) + " got exception: " + str(e))
+            self.__open__()
+        return None
+
+    def mset(self, mapping: dict, exp=3600):
+        """SET every key of the mapping with one pipelined round trip."""
+        if not mapping:
+            return True
+        try:
+            pipeline = self.REDIS.pipeline(transaction=False)
+            for k, v in mapping.items():
+                pipeline.set(k, v, exp)
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.mset " + str(list(mapping.keys())[:3]) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
     def sadd(self, key: str, member: str):
         try:
             self.REDIS.sadd(key, member)
@@ -256,6 +316,48 @@ class RedisDB:
                 )
         return None
 
+    def queue_consumer_batch(self, queue_names: list[str], group_name, consumer_name, count=1, block=1000) -> list[RedisMsg] | None:
+        """
+        Read up to `count` new messages in all from the queues, taking them from the queues in the given order.
+        If none is waiting, wait at most `block` milliseconds for one to arrive. Returns None if Redis is not reachable.
+        """
+        try:
+            for queue_name in queue_names:
+                if (queue_name, group_name) in self.__groups:
+                    continue
+                try:
+                    group_info = self.REDIS.xinfo_groups(queue_name)
+                except Exception as e:
+                    if str(e) != 'no such key':
+                        raise
+                    group_info = []
+                if not any(gi["name"] == group_name for gi in group_info):
+                    self.REDIS.xgroup_create(queue_name, group_name, id="0", mkstream=True)
+                self.__groups.add((queue_name, group_name))
+            res = []
+            for queue_name in queue_names:
+                if len(res) >= count:
+                    break
+                res.extend(self.__read_group(group_name, consumer_name, [queue_name], count - len(res)))
+            if not res and block:
+                # XREADGROUP applies the count per stream: wait on no more queues than messages may be taken.
+                res = self.__read_group(group_name, consumer_name, queue_names[:count], 1, block)
+            return res
+        except Exception as e:
+            logging.warning("RedisDB.queue_consumer_batch " + str(queue_names) + " got exception: " + str(e))
+            self.__groups.clear()
+            self.__open__()
+        return None
+
+    def __read_group(self, group_name, consumer_name, queue_names: list[str], count, block=None) -> list[RedisMsg]:
+        messages = self.REDIS.xreadgroup(group_name, consumer_name, {queue_name: ">" for queue_name in queue_names},
+                                         count=count, block=block)
+        res = []
+        for queue_name, element_list in messages or []:
+            for msg_id, payload in element_list:
+                res.append(RedisMsg(self.REDIS, queue_name, group_name, msg_id, payload))
+        return res
+
     def get_unacked_iterator(self, queue_names: list[str], group_name, consumer_name):
         try:
             for queue_name in queue_names:
@@ -331,6 +433,26 @@ class RedisDB:
             logging.warning("RedisDB.delete " + str(key) + " got exception: " + str(e))
             self.__open__()
         return False
+
+    def publish(self, channel: str, message: str) -> bool:
+        try:
+            self.REDIS.publish(channel, message)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.publish " + str(channel) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def subscribe(self, channel: str):
+        """A PubSub subscribed to `channel`, None if Redis is not reachable."""
+        try:
+            pubsub = self.REDIS.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(channel)
+            return pubsub
+        except Exception as e:
+            logging.warning("RedisDB.subscribe " + str(channel) + " got exception: " + str(e))
+            self.__open__()
+        return None
     
     
 REDIS_CONN = RedisDB()
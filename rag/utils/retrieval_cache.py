@@ -0,0 +1,119 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import copy
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+
+import xxhash
+from cachetools import TTLCache
+
+from rag.utils.redis_conn import REDIS_CONN
+
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", 1024))
+RETRIEVAL_CACHE_TTL = int(os.environ.get("RETRIEVAL_CACHE_TTL", 600))
+# How long a doc store write may take to become searchable (Elasticsearch/OpenSearch refresh every second).
+RETRIEVAL_CACHE_REFRESH_SECS = float(os.environ.get("RETRIEVAL_CACHE_REFRESH_SECS", 2))
+
+
+def kb_version_key(kb_id):
+    return f"kb_version:{kb_id}"
+
+
+def kb_written_key(kb_id):
+    return f"kb_written:{kb_id}"
+
+
+def bump_kb_version(kb_ids):
+    if not kb_ids:
+        return
+    if isinstance(kb_ids, str):
+        kb_ids = [kb_ids]
+    for kb_id in kb_ids:
+        REDIS_CONN.incr(kb_version_key(kb_id))
+        REDIS_CONN.set(kb_written_key(kb_id), time.time(), max(1, math.ceil(RETRIEVAL_CACHE_REFRESH_SECS)))
+
+
+def kb_versions(kb_ids):
+    """
+    Current version of every knowledge base, None when Redis can't tell or when one of them was written less
+    than RETRIEVAL_CACHE_REFRESH_SECS ago: a search may not see that write yet, and its result must not be
+    cached under the new version.
+    """
+    if not REDIS_CONN.is_alive():
+        return None
+    res = REDIS_CONN.mget([kb_version_key(kb_id) for kb_id in kb_ids] + [kb_written_key(kb_id) for kb_id in kb_ids])
+    if res is None:
+        return None
+    versions, written = res[:len(kb_ids)], res[len(kb_ids):]
+    now = time.time()
+    if any(t is not None and now - float(t) < RETRIEVAL_CACHE_REFRESH_SECS for t in written):
+        return None
+    return versions
+
+
+def bumps_kb_version(func):
+    """Bump the version of the `knowledgebaseId` argument once the doc store write is done."""
+    sig = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            bump_kb_version(sig.bind(*args, **kwargs).arguments.get("knowledgebaseId"))
+
+    return wrapper
+
+
+class RetrievalCache:
+    """
+    Results of `Dealer.retrieval`, keyed by the retrieval parameters and the versions of the knowledge bases searched.
+    Any chunk insert, update or delete bumps the knowledge base version, so stale entries are never hit again;
+    nothing is cached until the write is searchable.
+    """
+
+    def __init__(self, maxsize=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(kb_ids, *params):
+        kb_ids = sorted(set(kb_ids))
+        versions = kb_versions(kb_ids)
+        if versions is None:
+            return None
+        hasher = xxhash.xxh64()
+        hasher.update(json.dumps([kb_ids, versions, params], ensure_ascii=False, default=str).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            res = self.cache.get(key)
+        return copy.deepcopy(res) if res is not None else None
+
+    def put(self, key, value):
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.cache[key] = value
+
+
+retrieval_cache = RetrievalCache()
@@ -18,6 +18,7 @@ import logging
 import boto3
 from botocore.exceptions import ClientError
 from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
 import time
 from io import BytesIO
 from rag.utils import singleton
@@ -130,6 +131,26 @@ class RAGFlowS3:
                 self.__open__()
                 time.sleep(1)
 
+    @use_prefix_path
+    @use_default_bucket
+    def put_stream(self, bucket, fnm, stream, size=-1):
+        """Upload a seekable file object as a multipart upload, without reading it into memory."""
+        logging.debug(f"bucket name {bucket}; filename :{fnm}:")
+        for _ in range(1):
+            try:
+                if not self.bucket_exists(bucket):
+                    self.conn.create_bucket(Bucket=bucket)
+                    logging.info(f"create bucket {bucket} ********")
+                stream.seek(0)
+                config = TransferConfig(multipart_threshold=settings.STORAGE_PART_SIZE, multipart_chunksize=settings.STORAGE_PART_SIZE)
+                r = self.conn.upload_fileobj(stream, bucket, fnm, Config=config)
+
+                return r
+            except Exception:
+                logging.exception(f"Fail put {bucket}/{fnm}")
+                self.__open__()
+                time.sleep(1)
+
     @use_prefix_path
     @use_default_bucket
     def rm(self, bucket, fnm):
@@ -0,0 +1,115 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import threading
+import time
+
+from rag.utils.redis_conn import REDIS_CONN
+
+TASK_CANCEL_CHANNEL = "rag_flow_task_cancel"
+TASK_CANCEL_TTL = 24 * 3600
+
+
+def cancel_key(doc_id):
+    return f"{doc_id}-cancel"
+
+
+def cancel_documents(doc_ids):
+    """Flag the documents as canceled and notify the task executors working on them."""
+    for doc_id in doc_ids:
+        REDIS_CONN.set(cancel_key(doc_id), "1", TASK_CANCEL_TTL)
+        REDIS_CONN.publish(TASK_CANCEL_CHANNEL, doc_id)
+
+
+def uncancel_documents(doc_ids):
+    """Clear the flag before the documents are queued again."""
+    for doc_id in doc_ids:
+        REDIS_CONN.delete(cancel_key(doc_id))
+
+
+class CancelListener:
+    """
+    Keeps the set of canceled documents among the tasks running in this process, fed by the
+    TASK_CANCEL_CHANNEL subscription, so that `is_canceled` is a dictionary lookup.
+    The flags are read once when a task is watched and again after every (re)subscription,
+    so notifications published while not subscribed are not lost.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.canceled = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def watch(self, task_id, doc_id):
+        with self.lock:
+            self.tasks[task_id] = doc_id
+            if self.thread is None:
+                self.thread = threading.Thread(name="CancelListener", target=self._run, daemon=True)
+                self.thread.start()
+        if REDIS_CONN.exist(cancel_key(doc_id)):
+            with self.lock:
+                self.canceled.add(doc_id)
+
+    def unwatch(self, task_id):
+        with self.lock:
+            doc_id = self.tasks.pop(task_id, None)
+            if doc_id not in self.tasks.values():
+                self.canceled.discard(doc_id)
+
+    def is_canceled(self, task_id):
+        doc_id = self.tasks.get(task_id)
+        return doc_id is not None and doc_id in self.canceled
+
+    def is_doc_canceled(self, doc_id):
+        return doc_id in self.canceled
+
+    def _sync(self):
+        with self.lock:
+            doc_ids = list(set(self.tasks.values()))
+        if not doc_ids:
+            return
+        flags = REDIS_CONN.mget([cancel_key(doc_id) for doc_id in doc_ids]) or []
+        with self.lock:
+            self.canceled |= {doc_id for doc_id, flag in zip(doc_ids, flags) if flag}
+
+    def _run(self):
+        while True:
+            pubsub = REDIS_CONN.subscribe(TASK_CANCEL_CHANNEL)
+            if pubsub is None:
+                time.sleep(1)
+                continue
+            try:
+                self._sync()
+                for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    doc_id = message["data"]
+                    with self.lock:
+                        if doc_id in self.tasks.values():
+                            self.canceled.add(doc_id)
+                            logging.info(f"CancelListener: document {doc_id} canceled")
+            except Exception:
+                logging.exception("CancelListener subscription got exception")
+                time.sleep(1)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+cancel_listener = CancelListener()
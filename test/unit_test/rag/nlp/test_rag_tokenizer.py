@@ -0,0 +1,63 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import pytest
+
+from rag.nlp.rag_tokenizer import tokenizer
+
+CORPUS = [
+    "南京市长江大桥",
+    "研究生命起源",
+    "我们中出了一个叛徒",
+    "结婚的和尚未结婚的",
+    "北京天安门广场上人山人海",
+    "上海自来水来自海上",
+    "乒乓球拍卖完了",
+    "中国人民银行发布了新的货币政策",
+    "他说的确实在理",
+    "这个门把手坏了请把手拿开",
+    "人工智能技术在医疗领域的应用越来越广泛",
+    "下雨天留客天留我不留",
+    "哈哈哈哈哈哈哈哈哈哈哈哈哈",
+    "大学生活动中心今天开放",
+    "欢迎新老师生前来就餐",
+    "工信处女干事每月经过下属科室都要亲口交代",
+    "化妆和服装的区别",
+    "美国会通过对台售武法案",
+    "吉林省长春市长春药店",
+    "发展中国家兔的饲养技术",
+]
+# Long enough for the 11 token cutoff of dfs_, short enough for it to run quickly.
+MAX_SPAN = 14
+
+
+def spans():
+    for txt in CORPUS:
+        for s in range(len(txt)):
+            for e in range(s + 1, min(len(txt), s + MAX_SPAN) + 1):
+                yield txt[s:e]
+
+
+def dfs_top(span, topn):
+    tkslist = []
+    tokenizer.dfs_(span, 0, [], tkslist)
+    return tokenizer.sortTks_(tkslist)[:topn]
+
+
+@pytest.mark.parametrize("topn", [1, 2])
+def test_dp_matches_dfs(topn):
+    mismatches = [span for span in spans() if tokenizer.dp_(span, topn) != dfs_top(span, topn)]
+    assert not mismatches, f"dp_ and dfs_ disagree on {len(mismatches)} spans, e.g. {mismatches[:5]}"
@@ -0,0 +1,153 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import inspect
+import os
+
+import pytest
+
+from rag import settings
+from rag.utils import embedded_conn, retrieval_cache
+from rag.utils.doc_store_conn import MatchDenseExpr, MatchTextExpr, OrderByExpr
+
+INDEX = "ragflow_tenant"
+KB_ID = "kb"
+
+# EmbeddedConnection is a per-process singleton, the tests need several instances to act as several processes.
+EmbeddedConnection = inspect.getclosurevars(embedded_conn.EmbeddedConnection).nonlocals["cls"]
+
+
+@pytest.fixture(autouse=True)
+def no_redis(monkeypatch):
+    monkeypatch.setattr(retrieval_cache, "bump_kb_version", lambda kb_ids: None)
+
+
+@pytest.fixture
+def new_conn(monkeypatch, tmp_path):
+    def _new_conn(path=str(tmp_path), compact_ops=1000):
+        monkeypatch.setattr(settings, "EMBEDDED", {"path": path, "compact_ops": compact_ops})
+        conn = EmbeddedConnection()
+        conn.createIdx(INDEX, KB_ID, 4)
+        return conn
+
+    return _new_conn
+
+
+def chunk(i, text, vec):
+    return {"id": f"c{i}", "doc_id": "d1", "content_ltks": text, "q_4_vec": vec, "available_int": 1}
+
+
+def ids(res):
+    return sorted(h["_id"] for h in res["hits"]["hits"])
+
+
+def search_text(conn, text):
+    return conn.search(["content_ltks"], [], {}, [MatchTextExpr(["content_ltks"], text, 10)], OrderByExpr(), 0, 10,
+                       INDEX, [KB_ID])
+
+
+def search_dense(conn, vec):
+    return conn.search(["content_ltks"], [], {}, [MatchDenseExpr("q_4_vec", vec, "float", "cosine", 10)],
+                       OrderByExpr(), 0, 10, INDEX, [KB_ID])
+
+
+def fill(conn, n):
+    docs = [chunk(i, f"word{i} common", [float(i % 4 == j) for j in range(4)]) for i in range(n)]
+    assert conn.insert(docs, INDEX, KB_ID) == []
+
+
+@pytest.mark.parametrize("in_memory", [True, False])
+def test_round_trip(new_conn, in_memory):
+    conn = new_conn(path="") if in_memory else new_conn()
+    fill(conn, 3)
+
+    assert conn.get("c1", INDEX, [KB_ID])["content_ltks"] == "word1 common"
+    assert ids(search_text(conn, "word2")) == ["c2"]
+    assert ids(search_text(conn, "common")) == ["c0", "c1", "c2"]
+    assert search_dense(conn, [0.0, 1.0, 0.0, 0.0])["hits"]["hits"][0]["_id"] == "c1"
+
+    assert conn.update({"id": "c1"}, {"content_ltks": "changed"}, INDEX, KB_ID)
+    assert conn.get("c1", INDEX, [KB_ID])["content_ltks"] == "changed"
+    assert ids(search_text(conn, "word1")) == []
+    assert ids(search_text(conn, "changed")) == ["c1"]
+
+    assert conn.delete({"id": ["c0"]}, INDEX, KB_ID) == 1
+    assert conn.get("c0", INDEX, [KB_ID]) is None
+    assert ids(search_text(conn, "common")) == ["c2"]
+    assert conn.delete({"doc_id": "d1"}, INDEX, KB_ID) == 2
+    assert ids(search_text(conn, "changed")) == []
+
+
+def test_compaction(new_conn, tmp_path):
+    conn = new_conn(compact_ops=2)
+    for i in range(5):
+        fill(conn, i + 1)
+    conn.delete({"id": ["c0"]}, INDEX, KB_ID)
+
+    files = os.listdir(tmp_path / INDEX)
+    gen = int((tmp_path / INDEX / "CURRENT").read_text())
+    assert gen == 3
+    assert f"snapshot.{gen}.json" in files
+    assert not [f for f in files if f.startswith("snapshot.") and f != f"snapshot.{gen}.json"]
+
+    reopened = new_conn(compact_ops=2)
+    assert ids(search_text(reopened, "common")) == ["c1", "c2", "c3", "c4"]
+    assert search_dense(reopened, [0.0, 0.0, 0.0, 1.0])["hits"]["hits"][0]["_id"] == "c3"
+    assert reopened.get("c4", INDEX, [KB_ID])["q_4_vec"] == [1.0, 0.0, 0.0, 0.0]
+
+
+def test_refresh_across_instances(new_conn):
+    a, b = new_conn(compact_ops=3), new_conn(compact_ops=3)
+    fill(a, 2)
+    assert ids(search_text(b, "common")) == ["c0", "c1"]
+
+    b.update({"id": "c0"}, {"content_ltks": "changed"}, INDEX, KB_ID)
+    b.insert([chunk(9, "other", [1.0, 1.0, 0.0, 0.0])], INDEX, KB_ID)
+    assert ids(search_text(a, "common")) == ["c1"]
+    assert a.get("c9", INDEX, [KB_ID])["content_ltks"] == "other"
+
+    a.delete({"id": ["c9"]}, INDEX, KB_ID)
+    assert b.get("c9", INDEX, [KB_ID]) is None
+
+
+def test_refresh_after_generation_compacted_away(new_conn, monkeypatch):
+    a, b = new_conn(compact_ops=1), new_conn(compact_ops=1)
+    fill(b, 2)
+    assert ids(search_text(a, "common")) == ["c0", "c1"]
+    stale = a.states[INDEX]["gen"]
+
+    # b compacts again and removes the files of the generation a is about to load.
+    b.insert([chunk(2, "common", [0.0, 0.0, 1.0, 0.0])], INDEX, KB_ID)
+    tbl, gen = a._load_current(INDEX, stale)
+    assert gen == stale + 1
+    assert sorted(tbl.slots) == ["c0", "c1", "c2"]
+
+    # a read CURRENT right before that compaction.
+    gens = iter([stale])
+    monkeypatch.setattr(a, "_current_gen",
+                        lambda indexName: next(gens, None) or EmbeddedConnection._current_gen(a, indexName))
+    a.states.pop(INDEX)
+    assert ids(search_text(a, "common")) == ["c0", "c1", "c2"]
+    assert a.states[INDEX]["gen"] == stale + 1
+
+
+def test_deleted_index(new_conn):
+    a, b = new_conn(), new_conn()
+    fill(a, 1)
+    assert b.get("c0", INDEX, [KB_ID]) is not None
+    a.deleteIdx(INDEX, "")
+    assert not b.indexExist(INDEX)
+    assert b.get("c0", INDEX, [KB_ID]) is None